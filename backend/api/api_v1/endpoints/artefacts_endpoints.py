@@ -1,16 +1,20 @@
-import json
 import logging
 import os
 from datetime import datetime
 from enum import Enum
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
 
 from backend import config
-from backend.db.schemas.artefacts_schemas import Artefact, ArtefactUpdate
+from backend.core.supersede import record_stale_completion
+from backend.db.schemas.artefacts_schemas import (Artefact, ArtefactUpdate,
+                                                  LedgerEntry, LedgerPayload,
+                                                  StageCompletion)
+from backend.db.storage import InvalidJSONError
 from backend.decorators import log_endpoint
-from backend.dependencies import get_db
+from backend.dependencies import Storage, get_storage
 
 router = APIRouter()
 
@@ -26,97 +30,120 @@ logger.setLevel(logging.INFO)
 @log_endpoint
 async def get_artefact(
     uuid: str,
-    db=Depends(get_db)
+    storage: Storage = Depends(get_storage)
 ) -> Artefact:
-    # Query artefact metadata from database
-    row = db.execute(
-        "SELECT * FROM files WHERE uuid = ?",
-        (uuid,)
-    ).fetchone()
-
-    if hasattr(row, "keys"):
-        logger.debug("get_artefact row keys: %s", row.keys())
-        logger.debug("get_artefact row data: %r", dict(row))
+    # Query artefact metadata from database, JSON columns come back decoded
+    row = await run_in_threadpool(storage.get_artefact, uuid)
 
     if not row:
         logger.info(f"Artefact not found for UUID: {uuid}")
         raise HTTPException(status_code=404, detail="Artefact not found")
 
-    # Convert these rows to JSON since we're currently storing it as a string due to SQLite limitations
-    artefact_dict = dict(row)
-    for key in ["ai_features_and_insights", "ai_alerts_and_actions", "ai_eterny_legacy_schema"]:
-        if key in artefact_dict and artefact_dict[key]:
-            try:
-                artefact_dict[key] = json.loads(artefact_dict[key])
-            except json.JSONDecodeError:
-                logger.warning(f"Field {key} could not be JSON decoded, setting to None")
-                artefact_dict[key] = None
-
-    artefact = Artefact(**artefact_dict)
-    logger.info(f"get_artefact returning data for UUID {uuid}: %s", artefact.dict())
+    artefact = Artefact(**row)
 
     logger.info(f"Retrieved artefact for UUID: {uuid}")
     return artefact
 
 
+def update_values(update: ArtefactUpdate) -> dict:
+    """The fields set on an update, as the storage takes them."""
+    data = update.dict(exclude_unset=True)
+    for key, value in data.items():
+        if isinstance(value, Enum):
+            data[key] = value.value
+        elif isinstance(value, datetime):
+            data[key] = value.isoformat()
+    return data
+
+
+def not_found_or_superseded(uuid: str, generation: Optional[str], storage: Storage) -> None:
+    if generation is not None and storage.get_artefact(uuid):
+        raise HTTPException(status_code=409, detail="Artefact was uploaded again, generation superseded")
+    raise HTTPException(status_code=404, detail="Artefact not found")
+
+
 @router.patch("/metadata/{uuid}", response_model=Artefact, response_model_exclude_none=False)
 @log_endpoint
-async def update_artefact_metadata(uuid: str, update: ArtefactUpdate, db=Depends(get_db)):
-    data = update.dict(exclude_unset=True)
-    logger.info(f"update_artefact_metadata called for UUID {uuid} with data: %s", data)
+async def update_artefact_metadata(
+    uuid: str, update: ArtefactUpdate, generation: Optional[str] = None, storage: Storage = Depends(get_storage)
+):
+    """Update the given fields, with `generation` only while the artefact is of that upload generation (409 otherwise)."""
+    data = update_values(update)
 
     if not data:
         raise HTTPException(status_code=400, detail="No valid fields to update")
 
-    fields = []
-    values = []
+    try:
+        row = await run_in_threadpool(storage.update_artefact, uuid, data, generation=generation)
+    except InvalidJSONError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid JSON value: {str(e)}")
 
-    for key, value in data.items():
-        if isinstance(value, Enum):
-            value = value.value
-        elif isinstance(value, datetime):
-            value = value.isoformat()
-        fields.append(f"{key} = ?")
-        values.append(value)
-
-    values.append(uuid)
-    query = f"UPDATE files SET {', '.join(fields)} WHERE uuid = ?"
-    logger.debug("update_artefact_metadata SQL: %s", query)
-    logger.debug("update_artefact_metadata params: %s", values)
-    db.execute(query, values)
-    db.commit()
-
-    row = db.execute("SELECT * FROM files WHERE uuid = ?", (uuid,)).fetchone()
-    logger.info(f"update_artefact_metadata updated row for UUID {uuid}: %s", dict(row))
     if not row:
-        raise HTTPException(status_code=404, detail="Artefact not found")
+        await run_in_threadpool(not_found_or_superseded, uuid, generation, storage)
 
-    updated_doc = Artefact(**dict(row))
-    logger.info(f"update_artefact_metadata returning updated artefact for UUID {uuid}: %s", updated_doc.dict())
-    return updated_doc
+    logger.info(f"update_artefact_metadata updated fields {sorted(data)} for UUID {uuid}")
+    return Artefact(**row)
+
+
+@router.post("/stage/{uuid}", response_model=Artefact, response_model_exclude_none=False)
+@log_endpoint
+async def complete_pipeline_stage(uuid: str, completion: StageCompletion, storage: Storage = Depends(get_storage)):
+    """Store the outputs of a pipeline stage and mark it completed, in one write so parallel stages cannot lose each other's."""
+    data = update_values(completion.data)
+    try:
+        row = await run_in_threadpool(
+            storage.complete_pipeline_stage, uuid, completion.stage, completion.tokens, data, generation=completion.generation
+        )
+    except InvalidJSONError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid JSON value: {str(e)}")
+
+    if not row:
+        try:
+            await run_in_threadpool(not_found_or_superseded, uuid, completion.generation, storage)
+        except HTTPException as e:
+            if e.status_code == 409:
+                await run_in_threadpool(record_stale_completion, storage, uuid, completion.stage, completion.tokens)
+            raise
+
+    logger.info(f"complete_pipeline_stage completed {completion.stage} with fields {sorted(data)} for UUID {uuid}")
+    return Artefact(**row)
 
 
 @router.get("/list/pending", response_model=List[Artefact])
 @log_endpoint
-async def list_pending_artefacts(limit: int = 10, db=Depends(get_db)):
-    rows = db.execute(
-        "SELECT * FROM files WHERE analysis_status = 'pending' LIMIT ?",
-        (limit,)
-    ).fetchall()
+async def list_pending_artefacts(limit: int = 10, storage: Storage = Depends(get_storage)):
+    rows = await run_in_threadpool(storage.list_artefacts, limit=limit, analysis_status="pending")
 
-    artefacts = [Artefact(**dict(row)) for row in rows]
+    artefacts = [Artefact(**row) for row in rows]
     logger.info(f"Retrieved {len(artefacts)} pending artefacts (limit: {limit})")
     return artefacts
 
 
+@router.post("/claim/pending", response_model=List[Artefact])
+@log_endpoint
+async def claim_pending_artefacts(limit: int = 10, storage: Storage = Depends(get_storage)):
+    """Move up to `limit` pending artefacts to processing, concurrent callers never get the same artefact."""
+    rows = await run_in_threadpool(storage.claim_pending_artefacts, limit=limit)
+
+    artefacts = [Artefact(**row) for row in rows]
+    logger.info(f"Claimed {len(artefacts)} pending artefacts (limit: {limit})")
+    return artefacts
+
+
 @router.get("/list/all", response_model=List[Artefact])
 @log_endpoint
-async def list_all_artefacts(limit: int = 10, offset: int = 0, db=Depends(get_db)):
-    rows = db.execute(
-        "SELECT * FROM files LIMIT ? OFFSET ?",
-        (limit, offset)
-    ).fetchall()
+async def list_all_artefacts(limit: int = 10, offset: int = 0, storage: Storage = Depends(get_storage)):
+    rows = await run_in_threadpool(storage.list_artefacts, limit=limit, offset=offset)
 
-    artefacts = [Artefact(**dict(row)) for row in rows]
+    artefacts = [Artefact(**row) for row in rows]
     logger.info(f"Retrieved {len(artefacts)} artefacts (limit: {limit}, offset: {offset})")
     return artefacts
+
+
+@router.post("/ledger/{uuid}", response_model=LedgerEntry)
+@log_endpoint
+async def record_ledger_entry(uuid: str, payload: LedgerPayload, storage: Storage = Depends(get_storage)) -> LedgerEntry:
+    """Record tokens spent on a document in the token ledger."""
+    row = await run_in_threadpool(storage.add_ledger_entry, uuid, tokens=payload.tokens, entry_type=payload.entry_type)
+    logger.info(f"Recorded {payload.tokens} {payload.entry_type} tokens for UUID {uuid}")
+    return LedgerEntry(**row)
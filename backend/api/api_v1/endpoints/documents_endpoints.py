@@ -1,18 +1,39 @@
-import hashlib
+import asyncio
 import json
 import logging
 import os
-from datetime import datetime
-from typing import Optional
+import tarfile
+import uuid
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path
+from typing import Callable, List, Optional
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
-from google.cloud import storage
+from fastapi import (APIRouter, Depends, File, Form, HTTPException, Response,
+                     UploadFile)
+from google.cloud import storage as gcs
+from starlette.concurrency import run_in_threadpool
 
 from backend import config
+from backend.api.api_v1.endpoints.utils_endpoints import extract_file_text
+from backend.blobstore import BlobStore, get_blob_store
+from backend.core import admission, tracing
 from backend.core.celery import celery_app
-from backend.db.schemas.artefacts_schemas import AImode
+from backend.core.supersede import new_generation, supersede
+from backend.db.schemas.artefacts_schemas import AImode, AnalysisStatus
 from backend.decorators import log_endpoint
-from backend.dependencies import get_db
+from backend.dependencies import Storage, get_storage
+from backend.utils import pipeline_timeline
+from backend.utils.pipeline_definitions import load_pipelines, pipeline_name
+from backend.utils.text_compaction import (compact_document_text,
+                                           compaction_enabled, count_tokens)
+from backend.utils.token_estimate import (document_tokens_from_size,
+                                          estimate_analysis_tokens)
+from backend.utils.uploads import (FileDigest, FileTooLargeError, StoredFile,
+                                   copy_stream_to_file, download_gcs_file,
+                                   hash_upload_file, save_upload_file)
 
 router = APIRouter()
 
@@ -23,11 +44,94 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger.setLevel(logging.INFO)
 
+ANALYSE_DOCUMENT_TASK = "workers.analysis_worker.analyse_document"
+
+# Task events the expected completion time of a preflight is measured over
+PREFLIGHT_TIMELINE_WINDOW = timedelta(hours=1)
+
+
+def _document_uuid(customer_id: str, filename: str) -> str:
+    file_uuid = customer_id + "_" + str(filename)
+    return file_uuid.replace(" ", "_").replace("-", "_")
+
+
+# Content is stored once per sha256 in the blob store, the customer path is a hardlink to it.
+# Each stored document holds one blob reference, released again if anything after acquiring it fails.
+
+async def _store_upload_file(upload: UploadFile, file_path: str, storage: Storage, blob_store: BlobStore) -> FileDigest:
+    # Hash the spooled upload first so duplicates are never written again
+    digest = await hash_upload_file(upload)
+    await run_in_threadpool(storage.acquire_blob, digest.sha256, digest.size)
+    try:
+        if not await run_in_threadpool(blob_store.exists, digest.sha256):
+            staged = await save_upload_file(upload, blob_store.staging_path())
+            await run_in_threadpool(blob_store.ingest, staged.sha256, staged.path)
+        logger.info(f"Linking {file_path} to blob {digest.sha256}")
+        await run_in_threadpool(blob_store.link, digest.sha256, file_path)
+    except BaseException:
+        await run_in_threadpool(storage.release_blob, digest.sha256)
+        raise
+    return digest
+
+
+def _store_staged_file(staged: StoredFile, file_path: str, storage: Storage, blob_store: BlobStore) -> FileDigest:
+    # Content already streamed into the staging area, ingest drops it if the blob exists
+    storage.acquire_blob(staged.sha256, staged.size)
+    try:
+        blob_store.ingest(staged.sha256, staged.path)
+        blob_store.link(staged.sha256, file_path)
+    except BaseException:
+        storage.release_blob(staged.sha256)
+        raise
+    return FileDigest(sha256=staged.sha256, size=staged.size)
+
+
+def _store_gcs_file(gcs_client, gcs_bucket: str, gcs_file_path: str, file_path: str,
+                    storage: Storage, blob_store: BlobStore) -> FileDigest:
+    # The remote hash is unknown until downloaded, stage it and let ingest drop duplicates
+    staged = download_gcs_file(gcs_client, gcs_bucket, gcs_file_path, blob_store.staging_path())
+    return _store_staged_file(staged, file_path, storage, blob_store)
+
+
+def _estimated_tokens(filename: str, file_size: int, ai_analysis_mode: str) -> int:
+    # Refined from the extracted text by the worker once extraction is done
+    return sum(estimate_analysis_tokens(document_tokens_from_size(filename, file_size), ai_analysis_mode).values())
+
+
+def _admission_tokens(filename: str, file_size: Optional[int], ai_analysis_mode: str) -> int:
+    # The size of a GCS file is not known before it is downloaded, it counts as ADMISSION_UNKNOWN_FILE_SIZE bytes
+    return _estimated_tokens(filename, config.ADMISSION_UNKNOWN_FILE_SIZE if file_size is None else file_size, ai_analysis_mode)
+
+
+def _admit(storage: Storage, customer_id: str, documents: List[tuple], ai_analysis_mode: str, defer_when_busy: bool) -> admission.Decision:
+    """Admit (filename, size) documents as one, refused with 429 over a limit unless they are to be deferred."""
+    estimated_tokens = sum(_admission_tokens(filename, file_size, ai_analysis_mode) for filename, file_size in documents)
+    decision = admission.controller.admit(storage, customer_id, estimated_tokens, defer_when_busy, documents=len(documents))
+    if not decision.admitted and not defer_when_busy:
+        refused = documents[0][0] if len(documents) == 1 else f"{len(documents)} documents"
+        logger.info(f"Refused {refused} of customer {customer_id}: {decision.limit} limit, retry after {decision.retry_after}s")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Analysis pipeline is busy ({decision.limit} limit reached), retry later",
+            headers={"Retry-After": str(decision.retry_after)},
+        )
+    return decision
+
+
+def _release_replaced(document: dict, file_path: str, storage: Storage) -> None:
+    # A replaced record gives up its blob reference, and its file when it was stored under another name
+    old_file_path = os.path.join(BASE_UPLOAD_DIR, document["customer_id"], document["filename"])
+    if old_file_path != file_path and os.path.exists(old_file_path):
+        os.remove(old_file_path)
+    if document["hash_sha256"]:
+        storage.release_blob(document["hash_sha256"])
+
 
 @router.post("/{customer_id}")
 @log_endpoint
 async def add_document_for_analysis(
     customer_id: str,
+    response: Response,
     customer_data: str = Form(
         ...,
         description='Customer data JSON string. Example: {"customer_name": "Jan Filips"}'
@@ -38,8 +142,15 @@ async def add_document_for_analysis(
     ai_analysis_mode: AImode = Form(...),
     ai_output_language: str = Form('Czech'),
     eterny_api_webhook_url: str = Form(...),
-    db=Depends(get_db),
+    defer_when_busy: bool = Form(False, description="Accept the document as deferred instead of a 429 when the pipeline is busy"),
+    storage: Storage = Depends(get_storage),
 ) -> dict:
+    """
+    Add a document for analysis.
+
+    Over an admission limit the upload is refused with 429 and a Retry-After header, or with `defer_when_busy`
+    stored as deferred (202) and enqueued by the API once the pipeline has room.
+    """
     try:
         customer_data = json.loads(customer_data)
     except json.JSONDecodeError:
@@ -50,90 +161,85 @@ async def add_document_for_analysis(
         raise HTTPException(status_code=400, detail="Provide either a file or bucket+document_path, not both")
 
     # Validate that either a file is uploaded or GCS bucket and document_path are provided
-    if file is None:
-        if not gcs_bucket or not gcs_file_path:
-            raise HTTPException(status_code=400, detail="Either upload a file or provide gcs_bucket and gcs_file_path")
-        # Download file from Google Cloud Storage
-        gcs_client = storage.Client()
-        bucket = gcs_client.bucket(gcs_bucket)
-        blob = bucket.blob(gcs_file_path)
-        filename = os.path.basename(gcs_file_path)
-        customer_dir = os.path.join(BASE_UPLOAD_DIR, customer_id)
-        os.makedirs(customer_dir, exist_ok=True)
-        file_path = os.path.join(customer_dir, filename)
-        blob.download_to_filename(file_path)
-        with open(file_path, "rb") as f:
-            contents = f.read()
-        hash_sha256 = hashlib.sha256(contents).hexdigest()
-    else:
-        contents = await file.read()
-        hash_sha256 = hashlib.sha256(contents).hexdigest()
-        filename = file.filename
-        customer_dir = os.path.join(BASE_UPLOAD_DIR, customer_id)
-        os.makedirs(customer_dir, exist_ok=True)
-        file_path = os.path.join(customer_dir, filename)
-
-        # Delete existing document record and file for this UUID to prevent removing the new file later
-        file_uuid = customer_id + "_" + filename
-        file_uuid = file_uuid.replace(" ", "_").replace("-", "_")
-        existing = db.execute(
-            "SELECT filename FROM files WHERE uuid = ?",
-            (file_uuid,),
-        ).fetchone()
-        if existing:
-            old_file_path = os.path.join(customer_dir, existing[0])
-            if os.path.exists(old_file_path):
-                os.remove(old_file_path)
-            db.execute(
-                "DELETE FROM files WHERE uuid = ?",
-                (file_uuid,),
+    if file is None and (not gcs_bucket or not gcs_file_path):
+        raise HTTPException(status_code=400, detail="Either upload a file or provide gcs_bucket and gcs_file_path")
+
+    filename = file.filename if file is not None else os.path.basename(gcs_file_path)
+    file_path = os.path.join(BASE_UPLOAD_DIR, customer_id, filename)
+    file_uuid = _document_uuid(customer_id, filename)
+    blob_store = get_blob_store()
+
+    # Decided before anything is stored, the size of a GCS file is not known until it is downloaded
+    file_size = file.size if file is not None else None
+    decision = await run_in_threadpool(_admit, storage, customer_id, [(filename, file_size)], ai_analysis_mode.value, defer_when_busy)
+
+    try:
+        if file is None:
+            digest = await run_in_threadpool(
+                _store_gcs_file, gcs.Client(), gcs_bucket, gcs_file_path, file_path, storage, blob_store
             )
+        else:
+            digest = await _store_upload_file(file, file_path, storage, blob_store)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    hash_sha256, file_size = digest
+    generation = new_generation()
 
-        logger.info(f"Saving file to {file_path}")
-        with open(file_path, "wb") as buffer:
-            buffer.write(contents)
+    inserted = False
+    try:
+        existing = await run_in_threadpool(storage.get_artefact, file_uuid)
+        # Save metadata to DB, replacing an existing record for this UUID in the same transaction
+        now_iso = datetime.utcnow().isoformat()
+        await run_in_threadpool(storage.bulk_insert_artefacts, [{
+            "uuid": file_uuid,
+            "customer_id": customer_id,
+            "filename": filename,
+            "uploaded_at": now_iso,
+            "ai_output_language": ai_output_language,
+            "ai_analysis_mode": ai_analysis_mode.value,
+            "analysis_status": 'pending' if decision.admitted else 'deferred',
+            "analysis_started_at": None,
+            "analysis_completed_at": None,
+            "webhook_url": eterny_api_webhook_url,
+            "file_size": file_size,
+            "hash_sha256": hash_sha256,
+            "estimated_tokens": _estimated_tokens(filename, file_size, ai_analysis_mode.value),
+            "generation": generation,
+        }], True)
+        inserted = True
+        # The replaced record drops its blob reference and its analysis is cancelled once the new one is in
+        if existing:
+            await run_in_threadpool(_release_replaced, existing, file_path, storage)
+            await run_in_threadpool(supersede, storage, existing)
+    except BaseException:
+        # Once inserted, the new record holds the reference of the stored file
+        if not inserted:
+            await run_in_threadpool(storage.release_blob, hash_sha256)
+        raise
 
-    # Compute metadata
-    file_size = len(contents)
-    file_uuid = customer_id + "_" + str(filename)
-    file_uuid = file_uuid.replace(" ", "_").replace("-", "_")
-
-    # Save metadata to DB
-    now_iso = datetime.utcnow().isoformat()
-    db.execute(
-        """
-        INSERT INTO files (
-            uuid, customer_id, filename, uploaded_at,
-            ai_output_language, ai_analysis_mode, analysis_status, analysis_started_at, analysis_completed_at,
-            webhook_url,
-            file_size,
-            hash_sha256
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            file_uuid,
-            customer_id,
-            filename,
-            now_iso,
-            ai_output_language,
-            ai_analysis_mode,
-            'pending',
-            None,
-            None,
-            eterny_api_webhook_url,
-            file_size,
-            hash_sha256
-        )
-    )
-    db.commit()
+    if not decision.admitted:
+        logger.info(f"Deferred {filename} of customer {customer_id}: {decision.limit} limit")
+        response.status_code = 202
+        return {
+            "status": "deferred",
+            "customer_id": customer_id,
+            "filename": filename,
+            "sha256": hash_sha256,
+            "file_size": file_size,
+            "retry_after": decision.retry_after
+        }
 
     logger.info("Triggering Celery task for document analysis")
     try:
-        task = celery_app.send_task(  # NoQA
-            "workers.analysis_worker.analyse_document",
-            args=[file_uuid],
-        )
+        # Root of the document's trace, every stage of the analysis continues it
+        with tracing.tracer.start_as_current_span("analyse document", attributes={"document.uuid": file_uuid, "customer.id": customer_id}):
+            task = celery_app.send_task(  # NoQA
+                ANALYSE_DOCUMENT_TASK,
+                args=[file_uuid],
+                kwargs={"generation": generation},
+            )
     except Exception as e:
         logger.error(f"Failed to start Celery worker: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to start Celery worker")
@@ -146,3 +252,353 @@ async def add_document_for_analysis(
         "sha256": hash_sha256,
         "file_size": file_size
     }
+
+
+def _document_tokens(text: str, ai_analysis_mode: str) -> int:
+    # The LLM stages get the compacted text
+    return compact_document_text(text).tokens_after if compaction_enabled(ai_analysis_mode) else count_tokens(text)
+
+
+def _expected_seconds(storage: Storage, ai_analysis_mode: str) -> Optional[float]:
+    # Median queue wait plus run time of each stage. The tasks before the pipeline run one after another,
+    # the pipeline takes its critical path with independent stages in parallel
+    until = datetime.utcnow()
+    runs = pipeline_timeline.task_runs(storage.list_pipeline_events(until - PREFLIGHT_TIMELINE_WINDOW, until))
+    seconds = {
+        stage: sum(summary[timing].get("p50", 0) for timing in ("queue_wait", "run_time"))
+        for stage, summary in pipeline_timeline.summarize(runs, "stage").items()
+    }
+    if not seconds:
+        return None
+    pipelines = load_pipelines()
+    pipeline_stages = {stage for pipeline in pipelines.values() for stage in pipeline.stages}
+    ingest = sum(stage_seconds for stage, stage_seconds in seconds.items() if stage not in pipeline_stages)
+    return round(ingest + pipelines[pipeline_name(ai_analysis_mode)].critical_path(seconds), 1)
+
+
+@router.post("/{customer_id}/preflight")
+@log_endpoint
+async def preflight_document(
+    customer_id: str,
+    file: UploadFile = File(...),
+    ai_analysis_mode: AImode = Form(...),
+    storage: Storage = Depends(get_storage),
+) -> dict:
+    """
+    Estimate the LLM tokens and the completion time of a document before submitting it, nothing is stored.
+
+    The text is extracted and compacted as the analysis would, which also caches the extraction for the upload
+    that follows. The expected completion time adds up the median queue wait and run time of the stages over
+    the last hour along the critical path of the document's pipeline (null without recent tasks), and the
+    Retry-After of a refused upload when the pipeline is busy.
+    """
+    blob_store = get_blob_store()
+    # Extractors go by the file extension
+    staged_path = blob_store.staging_path() + os.path.splitext(file.filename or "")[1].lower()
+    try:
+        staged = await save_upload_file(file, staged_path)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        text = await extract_file_text(Path(staged.path), staged.sha256)
+    finally:
+        await run_in_threadpool(os.remove, staged.path)
+
+    mode = ai_analysis_mode.value
+    document_tokens = await run_in_threadpool(_document_tokens, text, mode)
+    stages = estimate_analysis_tokens(document_tokens, mode)
+    estimated_tokens = sum(stages.values())
+    decision = await run_in_threadpool(admission.controller.evaluate, storage, customer_id, estimated_tokens)
+    expected_seconds = await run_in_threadpool(_expected_seconds, storage, mode)
+    if expected_seconds is not None:
+        expected_seconds += decision.retry_after
+
+    return {
+        "customer_id": customer_id,
+        "filename": file.filename,
+        "sha256": staged.sha256,
+        "file_size": staged.size,
+        "ai_analysis_mode": mode,
+        "document_tokens": document_tokens,
+        "estimated_tokens": estimated_tokens,
+        "stages": stages,
+        "expected_seconds": expected_seconds,
+        "admitted": decision.admitted,
+        "limit": decision.limit,
+        "retry_after": decision.retry_after,
+    }
+
+
+# Bulk ingestion
+
+def _check_batch_size(count: int) -> None:
+    if count > config.BULK_MAX_DOCUMENTS:
+        raise HTTPException(status_code=413, detail=f"A batch can contain at most {config.BULK_MAX_DOCUMENTS} documents")
+
+
+def _is_document(name: str) -> bool:
+    # Skip hidden files and the metadata macOS adds to archives
+    filename = os.path.basename(name)
+    return bool(filename) and not filename.startswith(".") and "__MACOSX" not in name.split("/")
+
+
+@contextmanager
+def _open_archive(fileobj):
+    """The documents of a zip or tar archive as (name, size, open) tuples."""
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            yield [
+                (info.filename, info.file_size, partial(archive.open, info))
+                for info in archive.infolist() if not info.is_dir() and _is_document(info.filename)
+            ]
+        return
+
+    fileobj.seek(0)
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r:*")
+    except tarfile.ReadError:
+        raise HTTPException(status_code=400, detail="archive must be a zip or tar file")
+    with archive:
+        yield [
+            (member.name, member.size, partial(archive.extractfile, member))
+            for member in archive.getmembers() if member.isfile() and _is_document(member.name)
+        ]
+
+
+def _store_archive(fileobj, customer_dir: str, storage: Storage, blob_store: BlobStore, stored: list, rejected: list,
+                   admit: Callable[[List[tuple]], admission.Decision]) -> admission.Decision:
+    with _open_archive(fileobj) as members:
+        _check_batch_size(len(members))
+        # Admitted once the members are listed, before any of them is stored
+        decision = admit([(os.path.basename(name), size) for name, size, _ in members])
+        for name, size, open_member in members:
+            filename = os.path.basename(name)
+            try:
+                if size > config.MAX_UPLOAD_SIZE:
+                    raise FileTooLargeError(config.MAX_UPLOAD_SIZE)
+                with open_member() as reader:
+                    staged = copy_stream_to_file(reader, blob_store.staging_path())
+            except (FileTooLargeError, zipfile.BadZipFile, tarfile.TarError) as e:
+                rejected.append({"filename": filename, "detail": str(e)})
+                continue
+            stored.append((filename, _store_staged_file(staged, os.path.join(customer_dir, filename), storage, blob_store)))
+    return decision
+
+
+def _parse_gcs_manifest(gcs_manifest: str) -> List[dict]:
+    try:
+        entries = json.loads(gcs_manifest)
+    except json.JSONDecodeError:
+        entries = None
+    if not isinstance(entries, list) or not all(
+        isinstance(entry, dict) and entry.get("gcs_bucket") and entry.get("gcs_file_path") for entry in entries
+    ):
+        raise HTTPException(status_code=422, detail="gcs_manifest must be a JSON list of {gcs_bucket, gcs_file_path} objects")
+    return entries
+
+
+async def _store_gcs_manifest(entries: List[dict], customer_dir: str, storage: Storage, blob_store: BlobStore,
+                              stored: list, rejected: list) -> None:
+    # Entries sharing a filename would overwrite each other, only the last one is downloaded
+    entries = list({os.path.basename(entry["gcs_file_path"]): entry for entry in entries}.values())
+    gcs_client = gcs.Client()
+    semaphore = asyncio.Semaphore(config.BULK_GCS_CONCURRENCY)
+
+    async def store(entry: dict) -> FileDigest:
+        file_path = os.path.join(customer_dir, os.path.basename(entry["gcs_file_path"]))
+        async with semaphore:
+            return await run_in_threadpool(
+                _store_gcs_file, gcs_client, entry["gcs_bucket"], entry["gcs_file_path"], file_path, storage, blob_store
+            )
+
+    results = await asyncio.gather(*(store(entry) for entry in entries), return_exceptions=True)
+    failure = None
+    for entry, result in zip(entries, results):
+        filename = os.path.basename(entry["gcs_file_path"])
+        if isinstance(result, (FileTooLargeError, FileNotFoundError)):
+            rejected.append({"filename": filename, "detail": str(result)})
+        elif isinstance(result, BaseException):
+            failure = failure or result
+        else:
+            stored.append((filename, result))
+    if failure:
+        raise failure
+
+
+def _release_replaced_documents(replaced: List[tuple], storage: Storage) -> None:
+    for document, file_path in replaced:
+        _release_replaced(document, file_path, storage)
+
+
+def publish_analysis_tasks(documents: List[dict]) -> None:
+    # One producer, and so one broker connection and channel, for the whole batch. Nothing waits on
+    # analyse_document results, ignoring them also skips a result backend subscription per task.
+    with celery_app.producer_or_acquire() as producer:
+        for document in documents:
+            celery_app.send_task(
+                ANALYSE_DOCUMENT_TASK, args=[document["uuid"]], kwargs={"generation": document.get("generation")},
+                producer=producer, ignore_result=True,
+            )
+
+
+@router.post("/{customer_id}/bulk")
+@log_endpoint
+async def add_documents_for_analysis_in_bulk(
+    customer_id: str,
+    response: Response,
+    customer_data: str = Form(
+        ...,
+        description='Customer data JSON string. Example: {"customer_name": "Jan Filips"}'
+    ),
+    files: Optional[List[UploadFile]] = File(None, description="Documents to analyse, at most 1000 per request"),
+    archive: Optional[UploadFile] = File(None, description="A zip or tar (optionally compressed) archive of documents"),
+    gcs_manifest: Optional[str] = Form(
+        None,
+        description='JSON list of GCS documents. Example: [{"gcs_bucket": "bucket", "gcs_file_path": "path/lease.pdf"}]'
+    ),
+    ai_analysis_mode: AImode = Form(...),
+    ai_output_language: str = Form('Czech'),
+    eterny_api_webhook_url: str = Form(...),
+    defer_when_busy: bool = Form(False, description="Accept the batch as deferred instead of a 429 when the pipeline is busy"),
+    storage: Storage = Depends(get_storage),
+) -> dict:
+    """
+    Add many documents of one customer for analysis: multipart files, an archive or a GCS manifest.
+
+    All records are written in one transaction and all analysis tasks are published over one producer.
+    Documents that are too large, missing or unreadable are listed in `rejected`, the rest are analysed.
+    The batch is admitted as a whole before anything is stored: over an admission limit it is refused with 429,
+    or with `defer_when_busy` stored as deferred (202). Track the batch with GET /document/batch/{batch_id}.
+    """
+    try:
+        customer_data = json.loads(customer_data)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=422, detail="customer_data must be valid JSON")
+
+    if sum(1 for source in (files, archive, gcs_manifest) if source) != 1:
+        raise HTTPException(status_code=400, detail="Provide exactly one of files, archive or gcs_manifest")
+
+    customer_dir = os.path.join(BASE_UPLOAD_DIR, customer_id)
+    blob_store = get_blob_store()
+    admit = partial(_admit, storage, customer_id, ai_analysis_mode=ai_analysis_mode.value, defer_when_busy=defer_when_busy)
+    stored = []
+    rejected = []
+    inserted = False
+    try:
+        if files:
+            _check_batch_size(len(files))
+            decision = await run_in_threadpool(admit, [(os.path.basename(upload.filename or ""), upload.size) for upload in files])
+            for upload in files:
+                filename = os.path.basename(upload.filename or "")
+                if not filename:
+                    rejected.append({"filename": upload.filename or "", "detail": "The part has no filename"})
+                    continue
+                try:
+                    stored.append((filename, await _store_upload_file(upload, os.path.join(customer_dir, filename), storage, blob_store)))
+                except FileTooLargeError as e:
+                    rejected.append({"filename": filename, "detail": str(e)})
+        elif archive:
+            decision = await run_in_threadpool(_store_archive, archive.file, customer_dir, storage, blob_store, stored, rejected, admit)
+        else:
+            entries = _parse_gcs_manifest(gcs_manifest)
+            _check_batch_size(len(entries))
+            decision = await run_in_threadpool(admit, [(os.path.basename(entry["gcs_file_path"]), None) for entry in entries])
+            await _store_gcs_manifest(entries, customer_dir, storage, blob_store, stored, rejected)
+
+        if not stored:
+            raise HTTPException(status_code=422, detail={"message": "No document in the batch could be stored", "rejected": rejected})
+
+        # Later documents with the same UUID win, as with sequential uploads
+        documents = {}
+        replaced = []
+        for filename, digest in stored:
+            file_uuid = _document_uuid(customer_id, filename)
+            if file_uuid in documents:
+                earlier_filename, earlier_digest = documents[file_uuid]
+                earlier = {"customer_id": customer_id, "filename": earlier_filename, "hash_sha256": earlier_digest.sha256}
+                replaced.append((earlier, os.path.join(customer_dir, filename)))
+            documents[file_uuid] = (filename, digest)
+
+        batch_id = uuid.uuid4().hex
+        now_iso = datetime.utcnow().isoformat()
+        records = [
+            {
+                "uuid": file_uuid,
+                "customer_id": customer_id,
+                "filename": filename,
+                "uploaded_at": now_iso,
+                "ai_output_language": ai_output_language,
+                "ai_analysis_mode": ai_analysis_mode.value,
+                "analysis_status": 'pending' if decision.admitted else 'deferred',
+                "analysis_started_at": None,
+                "analysis_completed_at": None,
+                "webhook_url": eterny_api_webhook_url,
+                "file_size": digest.size,
+                "hash_sha256": digest.sha256,
+                "batch_id": batch_id,
+                "estimated_tokens": _estimated_tokens(filename, digest.size, ai_analysis_mode.value),
+                "generation": new_generation(),
+            }
+            for file_uuid, (filename, digest) in documents.items()
+        ]
+
+        # Replace existing records for these UUIDs in the same transaction as the insert, their files
+        # and analyses are let go once the new records are in
+        existing = await run_in_threadpool(storage.get_artefacts, list(documents))
+        await run_in_threadpool(storage.bulk_insert_artefacts, records, True)
+        inserted = True
+        replaced += [(document, os.path.join(customer_dir, documents[document["uuid"]][0])) for document in existing]
+        await run_in_threadpool(_release_replaced_documents, replaced, storage)
+        for document in existing:
+            await run_in_threadpool(supersede, storage, document)
+    except BaseException:
+        # Once inserted, the new records hold the references of the stored files
+        if not inserted:
+            for _, digest in stored:
+                await run_in_threadpool(storage.release_blob, digest.sha256)
+        raise
+
+    result = {
+        "status": "success",
+        "customer_id": customer_id,
+        "batch_id": batch_id,
+        "accepted": len(records),
+        "rejected": rejected,
+        "documents": [
+            {"uuid": file_uuid, "filename": filename, "sha256": digest.sha256, "file_size": digest.size}
+            for file_uuid, (filename, digest) in documents.items()
+        ]
+    }
+    if not decision.admitted:
+        logger.info(f"Deferred batch {batch_id} of customer {customer_id}: {decision.limit} limit")
+        response.status_code = 202
+        return {**result, "status": "deferred", "retry_after": decision.retry_after}
+
+    logger.info(f"Triggering {len(records)} Celery tasks for batch {batch_id}")
+    try:
+        await run_in_threadpool(publish_analysis_tasks, records)
+    except Exception as e:
+        logger.error(f"Failed to start Celery worker: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to start Celery worker")
+
+    logger.info(f"Uploaded batch {batch_id} for customer {customer_id}: {len(records)} documents, {len(rejected)} rejected")
+    return result
+
+
+@router.get("/batch/{batch_id}")
+@log_endpoint
+async def get_batch_progress(batch_id: str, storage: Storage = Depends(get_storage)) -> dict:
+    """Aggregate analysis progress of a bulk ingestion batch."""
+    counts = await run_in_threadpool(storage.count_artefacts_by_status, batch_id)
+    if not counts:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    total = sum(counts.values())
+    statuses = {status.value: counts.get(status.value, 0) for status in AnalysisStatus}
+    return {
+        "batch_id": batch_id,
+        "total": total,
+        "statuses": statuses,
+        "progress": round((statuses[AnalysisStatus.processed.value] + statuses[AnalysisStatus.failed.value]) / total, 4)
+    }
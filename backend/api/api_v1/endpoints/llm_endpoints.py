@@ -133,3 +133,10 @@ async def streaming_chat_completion(
             "X-Accel-Buffering": "no"
         }
     )
+
+
+@router.get("/pool/stats")
+@log_endpoint
+async def pool_stats() -> Dict[str, Any]:
+    """Load, error rate, latency and ejections per LLM endpoint, and hedging counters, of this API process."""
+    return ai_client.stats()
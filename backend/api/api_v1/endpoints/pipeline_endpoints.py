@@ -0,0 +1,75 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+
+from backend.db.schemas.pipeline_schemas import PipelineEvents
+from backend.decorators import log_endpoint
+from backend.dependencies import Storage, get_storage
+from backend.utils import pipeline_timeline
+from backend.utils.pipeline_definitions import get_pipeline
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+
+def _utc(moment: datetime) -> datetime:
+    # Events are stored as naive UTC
+    return moment.astimezone(timezone.utc).replace(tzinfo=None) if moment.tzinfo else moment
+
+
+@router.post("/events")
+@log_endpoint
+async def add_pipeline_events(payload: PipelineEvents, storage: Storage = Depends(get_storage)):
+    """Append a batch of task events recorded by a worker."""
+    events = [dict(event.model_dump(), occurred_at=_utc(event.occurred_at)) for event in payload.events]
+    return {"inserted": await run_in_threadpool(storage.add_pipeline_events, events)}
+
+
+@router.get("/timeline")
+@log_endpoint
+async def get_pipeline_timeline(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    hours: float = Query(24, gt=0, description="Length of the window when `since` is not given"),
+    storage: Storage = Depends(get_storage)
+):
+    """Queue wait and run time percentiles (seconds) per stage and per customer, of the task events in [since, until)."""
+    until = _utc(until) if until else datetime.utcnow()
+    since = _utc(since) if since else until - timedelta(hours=hours)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="`since` must be before `until`")
+
+    events = await run_in_threadpool(storage.list_pipeline_events, since, until)
+    runs = pipeline_timeline.task_runs(events)
+    return {
+        "since": since,
+        "until": until,
+        "runs": len(runs),
+        "stages": pipeline_timeline.summarize(runs, "stage"),
+        "customers": pipeline_timeline.summarize(runs, "customer_id"),
+    }
+
+
+@router.get("/timeline/{document_uuid}")
+@log_endpoint
+async def get_document_timeline(document_uuid: str, storage: Storage = Depends(get_storage)):
+    """The task runs of one document in start order, seconds per stage and the critical path of its pipeline over them."""
+    events = await run_in_threadpool(storage.list_document_pipeline_events, document_uuid)
+    if not events:
+        raise HTTPException(status_code=404, detail="No pipeline events for this document")
+
+    runs = sorted(pipeline_timeline.task_runs(events), key=lambda run: run["started_at"])
+    seconds = pipeline_timeline.stage_seconds(runs)
+    document = await run_in_threadpool(storage.get_artefact, document_uuid)
+    pipeline = ((document or {}).get("pipeline_state") or {}).get("pipeline")
+    return {
+        "document_uuid": document_uuid,
+        "elapsed": (events[-1]["occurred_at"] - events[0]["occurred_at"]).total_seconds(),
+        "stages": seconds,
+        "critical_path": round(get_pipeline(pipeline).critical_path(seconds), 4) if pipeline else None,
+        "runs": runs,
+    }
@@ -0,0 +1,53 @@
+import logging
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, Header, HTTPException
+from sse_starlette.sse import EventSourceResponse
+
+from backend import config
+from backend.core import progress
+from backend.decorators import log_endpoint
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+async def _progress_stream(channel: str, last_event_id: Optional[str], until_final: bool) -> EventSourceResponse:
+    if not config.PROGRESS_REDIS_URL or not await progress.hub.ready():
+        raise HTTPException(status_code=503, detail="Live progress is unavailable")
+
+    async def event_generator():
+        async for event in progress.hub.subscribe(channel, last_event_id):
+            yield {"id": event["id"], "event": "progress", "data": orjson.dumps(event).decode()}
+            if until_final and event["status"] in progress.FINAL_STATUSES:
+                return
+
+    return EventSourceResponse(
+        event_generator(),
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+@router.get("/document/{document_uuid}")
+@log_endpoint
+async def document_progress(
+    document_uuid: str,
+    last_event_id: Optional[str] = Header(None, description="Resume after this event, sent by EventSource on reconnect")
+) -> EventSourceResponse:
+    """Stage transitions of a document's analysis as server-sent events, the stream ends when it is processed or failed."""
+    return await _progress_stream(progress.document_channel(document_uuid), last_event_id, until_final=True)
+
+
+@router.get("/customer/{customer_id}")
+@log_endpoint
+async def customer_progress(
+    customer_id: str,
+    last_event_id: Optional[str] = Header(None, description="Resume after this event, sent by EventSource on reconnect")
+) -> EventSourceResponse:
+    """Stage transitions of the analyses of all of a customer's documents as server-sent events."""
+    return await _progress_stream(progress.customer_channel(customer_id), last_event_id, until_final=False)
@@ -6,13 +6,16 @@ from typing import List, Literal
 import tiktoken
 from fastapi import APIRouter, Body, Depends, HTTPException, Query
 from sse_starlette.sse import EventSourceResponse
+from starlette.concurrency import run_in_threadpool
 
 from backend.api.api_v1.endpoints.artefacts_endpoints import get_artefact
 from backend.db.schemas.rag_schemas import MessagePayload, RAGMessage
 from backend.decorators import log_endpoint
-from backend.dependencies import ai_client, get_db
+from backend.dependencies import Storage, ai_client, get_storage
+from backend.llm.routing import route_model
 from backend.utils.helpers import construct_docu_info_in_text
 from backend.utils.prompt_generators import load_prompts
+from backend.utils.text_compaction import count_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -33,13 +36,13 @@ async def ask_question_about_document(
     document_uuid: str,
     output_language: str,
     question: str = Query(...),
-    db=Depends(get_db)
+    storage: Storage = Depends(get_storage)
 ) -> EventSourceResponse:
     """RAG ask endpoint with streaming."""
     # Get customer output language
-    document = await get_artefact(document_uuid, db)
+    document = await get_artefact(document_uuid, storage)
 
-    conversation_history = await get_messages(document_uuid, order="asc", db=db)
+    conversation_history = await get_messages(document_uuid, order="asc", storage=storage)
 
     prompt = prompts["rag_query"]
     user_message = f"Question: {question}\n\nOur conversation history: {repr(conversation_history)}\n\nToday is {datetime.datetime.now()}."
@@ -53,22 +56,20 @@ async def ask_question_about_document(
         system_message = prompt["messages"][0]["content"].replace("{output_language}", output_language)
         question = user_message
 
-    db_ctx = get_db()
-    db_conn = next(db_ctx)
-    try:
-        await record_messages(
-            document_uuid=document_uuid,
-            payload=MessagePayload(question=question),
-            db=db_conn
-        )
-    finally:
-        db_ctx.close()
+    await record_messages(
+        document_uuid=document_uuid,
+        payload=MessagePayload(question=question),
+        storage=storage
+    )
+
+    ai_analysis_mode = document.ai_analysis_mode.value if document.ai_analysis_mode else None
+    model = route_model("gpt-4.1", count_tokens(system_message + user_message), stage="rag_query", ai_analysis_mode=ai_analysis_mode)
 
     # Streaming event generator
     async def event_generator():
         try:
             stream = ai_client.chat.completions.create(
-                model="gpt-4.1",
+                model=model,
                 temperature=0.5,
                 messages=[
                     {"role": "system", "content": system_message},
@@ -105,18 +106,13 @@ async def ask_question_about_document(
 
         # XXX Record token usage asynchronously
 
-        # Record the full answer on a separate DB connection to avoid closed DB issue
+        # Record the full answer, storage opens its own connection so this is safe after the request scope ended
         full_answer = "".join(completion_chunks)
-        db_ctx = get_db()
-        db_conn = next(db_ctx)
-        try:
-            await record_messages(
-                document_uuid=document_uuid,
-                payload=MessagePayload(answer=full_answer),
-                db=db_conn
-            )
-        finally:
-            db_ctx.close()
+        await record_messages(
+            document_uuid=document_uuid,
+            payload=MessagePayload(answer=full_answer),
+            storage=storage
+        )
 
         yield "data: [DONE]\n\n"
 
@@ -135,26 +131,11 @@ async def ask_question_about_document(
 async def record_messages(
     document_uuid: str,
     payload: MessagePayload = Body(...),
-    db=Depends(get_db)
+    storage: Storage = Depends(get_storage)
 ) -> RAGMessage:
-    # enforce alternation: no two questions or two answers in a row
-    db.execute(
-        "SELECT message_type FROM messages WHERE document_uuid = ? ORDER BY id DESC LIMIT 1",
-        (document_uuid,)
-    )
     context_type = 'question' if payload.question else 'answer'
     content = payload.question or payload.answer
-    cursor = db.execute(
-        "INSERT INTO messages (document_uuid, message_type, content) VALUES (?, ?, ?)",
-        (document_uuid, context_type, content)
-    )
-    db.commit()
-    message_id = cursor.lastrowid
-    cursor = db.execute(
-        "SELECT id, document_uuid, message_type, content, created_at FROM messages WHERE id = ?",
-        (message_id,)
-    )
-    row = cursor.fetchone()
+    row = await run_in_threadpool(storage.add_message, document_uuid, context_type, content)
     return RAGMessage(**row)
 
 
@@ -163,7 +144,7 @@ async def record_messages(
 async def get_messages(
     document_uuid: str,
     order: Literal["asc", "desc"] = "desc",
-    db=Depends(get_db)
+    storage: Storage = Depends(get_storage)
 ) -> List[RAGMessage]:
     # validate ordering parameter
     order = order.lower()
@@ -172,11 +153,5 @@ async def get_messages(
             status_code=400,
             detail="Query parameter 'order' must be 'asc' or 'desc'"
         )
-    sql = (
-        "SELECT id, document_uuid, message_type, content, created_at "
-        "FROM messages WHERE document_uuid = ? "
-        f"ORDER BY id {order.upper()}"
-    )
-    cursor = db.execute(sql, (document_uuid,))
-    rows = cursor.fetchall()
+    rows = await run_in_threadpool(storage.list_messages, document_uuid, order=order)
     return [RAGMessage(**row) for row in rows]
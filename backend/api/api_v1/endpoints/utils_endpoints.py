@@ -1,17 +1,21 @@
 import logging
-import mimetypes
-import subprocess
 from pathlib import Path
+from typing import Optional, Tuple
 
+from celery.exceptions import SoftTimeLimitExceeded, TimeLimitExceeded
+from celery.exceptions import TimeoutError as CeleryTimeoutError
 from fastapi import APIRouter, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
 
 from backend import config
 from backend.api.api_v1.endpoints.artefacts_endpoints import get_artefact
+from backend.blobstore import collect_garbage, get_blob_store
 from backend.decorators import log_endpoint
-from backend.dependencies import get_db
-from backend.utils.extract_text import (extract_docx_text, extract_md_text,
-                                        extract_odt_text, extract_pdf_text,
-                                        extract_rtf_text, extract_txt_text)
+from backend.dependencies import Storage, get_storage
+from backend.utils.extract_text import (DOCUMENT_EXTENSIONS,
+                                        UnsupportedDocumentError)
+from backend.utils.extraction_cache import get_extraction_cache
+from workers.extraction_worker import extract_document_text
 
 logger = logging.getLogger(__name__)
 
@@ -24,118 +28,81 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-@router.get("/extract_text_from_file")
-@log_endpoint
-async def extract_text_from_file(uuid: str, db=Depends(get_db)) -> str:
-    """This endpoint will indetify type of file and extract text from it."""
-    document = await get_artefact(uuid=uuid, db=db)
+async def _get_document_path(uuid: str, storage: Storage) -> Tuple[Path, Optional[str]]:
+    document = await get_artefact(uuid=uuid, storage=storage)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
 
     file_path = Path(config.BASE_UPLOAD_DIR) / document.customer_id / document.filename
     logger.info(f"Looking for file at: {file_path}")
-    logger.info(f"Customer ID: {document.customer_id}, Filename: {document.filename}")
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
+    return file_path, document.hash_sha256
 
-    mime_type, _ = mimetypes.guess_type(file_path.name)
-    supported_doc_types = {
-        'application/pdf',
-        'application/msword',
-        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-        'application/rtf',
-        'text/rtf',
-        'application/x-rtf',
-        'text/plain',
-        'text/markdown',
-        'application/vnd.oasis.opendocument.text'
-    }
-    supported_image_types = {
-        'image/png',
-        'image/jpeg',
-        'image/webp',
-        'image/gif'
-    }
-    if mime_type in supported_image_types:
-        return await extract_text_from_image(uuid, db)
-    elif mime_type in supported_doc_types:
-        return await extract_text_from_document(uuid, db)
-    else:
-        raise HTTPException(
-            status_code=400,
-            detail="Unsupported file format. Supported formats: PDF, DOC, DOCX, RTF, TXT, MD, ODT, PNG, JPEG, WEBP, GIF"
-        )
-
-
-@router.get("/document_to_text")
-@log_endpoint
-async def extract_text_from_document(uuid: str, db=Depends(get_db)) -> str:
-    """Convert PDF, DOC, DOCX, TXT, ODT to plaintext."""
 
-    document = await get_artefact(uuid=uuid, db=db)
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
+def _run_extraction(file_path: Path, hash_sha256: Optional[str]) -> str:
+    result = extract_document_text.apply_async(args=[str(file_path), hash_sha256])
+    return result.get(timeout=config.EXTRACTION_WAIT_TIMEOUT)
 
-    file_path = Path(config.BASE_UPLOAD_DIR) / document.customer_id / document.filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
 
+async def extract_file_text(file_path: Path, hash_sha256: Optional[str] = None) -> str:
+    """Extract text on the extraction workers, the API only waits for the result off the event loop."""
     try:
-        file_extension = file_path.suffix.lower()
-
-        if file_extension == '.pdf':
-            return extract_pdf_text(file_path)
-        elif file_extension == '.docx':
-            return extract_docx_text(file_path)
-        elif file_extension == '.doc':
-            # fallback for legacy .doc files using antiword
-            try:
-                result = subprocess.run(
-                    ['antiword', str(file_path)],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    check=True
-                )
-                return result.stdout.decode('utf-8')
-            except subprocess.CalledProcessError as e:
-                logger.error(f"Antiword failed to process {file_path}: {str(e)}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Error processing legacy .doc file: {str(e)}"
-                )
-        elif file_extension == '.rtf':
-            return extract_rtf_text(file_path)
-        elif file_extension == '.txt':
-            return extract_txt_text(file_path)
-        elif file_extension == '.md':
-            return extract_md_text(file_path)
-        elif file_extension == '.odt':
-            return extract_odt_text(file_path)
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail="Unsupported file format. Supported formats: PDF, DOC, DOCX, RTF, TXT, MD, ODT"
-            )
-
+        return await run_in_threadpool(_run_extraction, file_path, hash_sha256)
+    except UnsupportedDocumentError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (CeleryTimeoutError, SoftTimeLimitExceeded, TimeLimitExceeded):
+        logger.error(f"Text extraction from {file_path} timed out")
+        raise HTTPException(status_code=504, detail="Text extraction timed out")
+    except MemoryError:
+        logger.error(f"Text extraction from {file_path} exceeded the memory limit")
+        raise HTTPException(status_code=422, detail="Document needs more memory to extract than allowed")
     except Exception as e:
         logger.error(f"Error extracting text from {file_path}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
 
+@router.get("/extract_text_from_file")
+@log_endpoint
+async def extract_text_from_file(uuid: str, storage: Storage = Depends(get_storage)) -> str:
+    """This endpoint will indetify type of file and extract text from it."""
+    file_path, hash_sha256 = await _get_document_path(uuid, storage)
+    return await extract_file_text(file_path, hash_sha256)
+
+
+@router.get("/document_to_text")
+@log_endpoint
+async def extract_text_from_document(uuid: str, storage: Storage = Depends(get_storage)) -> str:
+    """Convert PDF, DOC, DOCX, TXT, ODT to plaintext."""
+    file_path, hash_sha256 = await _get_document_path(uuid, storage)
+    if file_path.suffix.lower() not in DOCUMENT_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail="Unsupported file format. Supported formats: PDF, DOC, DOCX, RTF, TXT, MD, ODT"
+        )
+    return await extract_file_text(file_path, hash_sha256)
+
+
 @router.get("/image_to_text")
 @log_endpoint
-async def extract_text_from_image(uuid: str, db=Depends(get_db)) -> str:
+async def extract_text_from_image(uuid: str, storage: Storage = Depends(get_storage)) -> str:
     """Convert image to plaintext utilising LLM."""
+    file_path, hash_sha256 = await _get_document_path(uuid, storage)
+    return await extract_file_text(file_path, hash_sha256)
 
-    # XXX TODO utilise LLM to extract text from image
-    # XXX TODO LLM should extract metadata as well such as document type and any descriptive info it can produce really and store this as raw_text
 
-    image = await get_artefact(uuid=uuid, db=db)
-    if not image:
-        raise HTTPException(status_code=404, detail="Document not found")
+@router.post("/blobs/gc")
+@log_endpoint
+async def collect_unreferenced_blobs(storage: Storage = Depends(get_storage)) -> dict:
+    """Delete stored files no document has referenced for longer than BLOB_GC_GRACE_SECONDS."""
+    return await run_in_threadpool(collect_garbage, storage, get_blob_store())
 
-    file_path = Path(config.BASE_UPLOAD_DIR) / image.customer_id / image.filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
 
-    return "XXX TODO"
+@router.get("/extraction_cache/stats")
+@log_endpoint
+async def extraction_cache_stats() -> dict:
+    """Size, hit/miss counters and evictions of the extracted text cache, overall and per extractor."""
+    cache = get_extraction_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **await run_in_threadpool(cache.stats)}
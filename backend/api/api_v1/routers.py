@@ -4,7 +4,9 @@ from backend.api.api_v1.endpoints import (artefacts_endpoints,
                                           celery_endpoints,
                                           documents_endpoints,
                                           generic_endpoints, llm_endpoints,
-                                          rag_endpoints, utils_endpoints)
+                                          pipeline_endpoints,
+                                          progress_endpoints, rag_endpoints,
+                                          utils_endpoints)
 
 api_router = APIRouter()
 
@@ -29,6 +31,13 @@ api_router.include_router(
     tags=["LLM"]
 )
 
+# Progress Endpoints
+api_router.include_router(
+    progress_endpoints.router,
+    prefix="/progress",
+    tags=["Progress"]
+)
+
 # Celery Endpoints
 api_router.include_router(
     celery_endpoints.router,
@@ -50,6 +59,13 @@ api_router.include_router(
     tags=["Artefacts (internal)"]
 )
 
+# Pipeline Endpoints
+api_router.include_router(
+    pipeline_endpoints.router,
+    prefix="/pipeline",
+    tags=["Pipeline"]
+)
+
 # Generic Endpoints
 api_router.include_router(
     generic_endpoints.router,
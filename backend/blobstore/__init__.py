@@ -0,0 +1,51 @@
+import logging
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from backend import config
+from backend.blobstore.base import BlobStore
+from backend.db.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+def create_blob_store(backend: str = None) -> BlobStore:
+    """Instantiate the configured blob store backend."""
+    backend = (backend or config.BLOB_STORE_BACKEND).lower()
+    if backend == "local":
+        from backend.blobstore.local import LocalBlobStore
+        return LocalBlobStore(config.BLOB_STORE_DIR)
+    if backend == "gcs":
+        from backend.blobstore.gcs import GCSBlobStore
+        return GCSBlobStore(config.BLOB_STORE_DIR, config.BLOB_STORE_GCS_BUCKET, prefix=config.BLOB_STORE_GCS_PREFIX)
+    raise ValueError(f"Unsupported blob store backend: {backend}")
+
+
+@lru_cache(maxsize=None)
+def get_blob_store() -> BlobStore:
+    """Process-wide blob store instance."""
+    return create_blob_store()
+
+
+def collect_garbage(storage: Storage, blob_store: BlobStore, grace_seconds: int = None, limit: int = 1000) -> dict:
+    """
+    Delete blobs that have had no references for longer than the grace period.
+
+    Uploads acquire a reference before checking whether the content exists, and only records that are
+    still unreferenced are deleted, so a blob being re-uploaded is normally kept. The grace period
+    covers the remaining window between that check and the file removal below.
+    """
+    grace_seconds = config.BLOB_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    released_before = datetime.utcnow() - timedelta(seconds=grace_seconds)
+
+    deleted = []
+    for hash_sha256 in storage.list_unreferenced_blobs(released_before, limit=limit):
+        if storage.delete_unreferenced_blob(hash_sha256):
+            blob_store.delete(hash_sha256)
+            deleted.append(hash_sha256)
+
+    logger.info(f"Blob GC deleted {len(deleted)} unreferenced blobs")
+    return {"deleted": len(deleted), "hashes": deleted}
+
+
+__all__ = ["BlobStore", "collect_garbage", "create_blob_store", "get_blob_store"]
@@ -0,0 +1,79 @@
+import errno
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore(ABC):
+    """
+    Content-addressed file store keyed by sha256.
+
+    Every blob also has a local path (the blob itself for local disk, a read-through cache for remote
+    backends). Customer-visible paths under BASE_UPLOAD_DIR are hardlinks to it, so existing
+    path-based code keeps working while identical content is stored once.
+    """
+
+    name: str = "abstract"
+
+    def __init__(self, local_dir: str):
+        self.local_dir = local_dir
+        self.staging_dir = os.path.join(local_dir, ".staging")
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def local_path(self, hash_sha256: str) -> str:
+        return os.path.join(self.local_dir, hash_sha256[:2], hash_sha256[2:4], hash_sha256)
+
+    def staging_path(self) -> str:
+        """A fresh path on the blob store's filesystem to stream new content into before ingest()."""
+        return os.path.join(self.staging_dir, uuid.uuid4().hex)
+
+    @abstractmethod
+    def exists(self, hash_sha256: str) -> bool:
+        """Whether the blob is already stored."""
+
+    @abstractmethod
+    def ingest(self, hash_sha256: str, staged_path: str) -> bool:
+        """
+        Take ownership of a staged file whose sha256 is `hash_sha256`.
+
+        Returns True when the content was new, False when it was a duplicate and the staged copy was dropped.
+        """
+
+    @abstractmethod
+    def ensure_local(self, hash_sha256: str) -> str:
+        """Return the local path of the blob, fetching it first if needed."""
+
+    @abstractmethod
+    def delete(self, hash_sha256: str) -> None:
+        """Remove the blob and any local copy."""
+
+    def link(self, hash_sha256: str, dest_path: str) -> None:
+        """Atomically point `dest_path` at the blob, as a hardlink (symlink across filesystems)."""
+        src = self.ensure_local(hash_sha256)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        if os.path.exists(dest_path) and os.path.samefile(src, dest_path):
+            return
+
+        tmp_path = f"{dest_path}.link-{uuid.uuid4().hex}"
+        try:
+            os.link(src, tmp_path)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            logger.warning(f"Cannot hardlink {src} to {dest_path} ({e.strerror}), using a symlink")
+            os.symlink(os.path.abspath(src), tmp_path)
+        os.replace(tmp_path, dest_path)
+
+    def _move_into_place(self, staged_path: str, hash_sha256: str) -> None:
+        path = self.local_path(hash_sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(staged_path, path)
+
+    def _remove_local(self, hash_sha256: str) -> None:
+        try:
+            os.remove(self.local_path(hash_sha256))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,64 @@
+import logging
+import os
+import tempfile
+
+from backend.blobstore.base import BlobStore
+
+logger = logging.getLogger(__name__)
+
+
+class GCSBlobStore(BlobStore):
+    """
+    Blobs stored as gs://<bucket>/<prefix><sha256>, with a local read-through cache.
+
+    Works against any GCS-compatible server; set STORAGE_EMULATOR_HOST to use a local stand-in.
+    """
+
+    name = "gcs"
+
+    def __init__(self, local_dir: str, bucket_name: str, prefix: str = "blobs/", client=None):
+        super().__init__(local_dir)
+        if client is None:
+            from google.cloud import storage as gcs
+            client = gcs.Client()
+        self.bucket = client.bucket(bucket_name)
+        self.prefix = prefix
+
+    def _blob(self, hash_sha256: str):
+        return self.bucket.blob(f"{self.prefix}{hash_sha256}")
+
+    def exists(self, hash_sha256: str) -> bool:
+        return self._blob(hash_sha256).exists()
+
+    def ingest(self, hash_sha256: str, staged_path: str) -> bool:
+        from google.api_core.exceptions import PreconditionFailed
+
+        created = True
+        try:
+            # if_generation_match=0 makes the upload a no-op when another process stored the blob first
+            self._blob(hash_sha256).upload_from_filename(staged_path, if_generation_match=0)
+        except PreconditionFailed:
+            created = False
+        # Keep the staged bytes as the local cache copy, they are already on disk
+        self._move_into_place(staged_path, hash_sha256)
+        return created
+
+    def ensure_local(self, hash_sha256: str) -> str:
+        path = self.local_path(hash_sha256)
+        if os.path.exists(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.staging_dir, delete=False) as tmp:
+            self._blob(hash_sha256).download_to_file(tmp)
+        os.replace(tmp.name, path)
+        logger.info(f"Fetched blob {hash_sha256} into the local cache")
+        return path
+
+    def delete(self, hash_sha256: str) -> None:
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self._blob(hash_sha256).delete()
+        except NotFound:
+            pass
+        self._remove_local(hash_sha256)
@@ -0,0 +1,31 @@
+import logging
+import os
+
+from backend.blobstore.base import BlobStore
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs stored on local disk under BLOB_STORE_DIR/<aa>/<bb>/<sha256>."""
+
+    name = "local"
+
+    def exists(self, hash_sha256: str) -> bool:
+        return os.path.exists(self.local_path(hash_sha256))
+
+    def ingest(self, hash_sha256: str, staged_path: str) -> bool:
+        if self.exists(hash_sha256):
+            os.remove(staged_path)
+            return False
+        self._move_into_place(staged_path, hash_sha256)
+        return True
+
+    def ensure_local(self, hash_sha256: str) -> str:
+        path = self.local_path(hash_sha256)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Blob {hash_sha256} is missing from {self.local_dir}")
+        return path
+
+    def delete(self, hash_sha256: str) -> None:
+        self._remove_local(hash_sha256)
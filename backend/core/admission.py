@@ -0,0 +1,160 @@
+"""
+Admission control of documents submitted for analysis.
+
+Before a document is accepted the controller looks at the messages waiting in ai-analysis-queue, the
+documents its customer has in flight (pending or processing) and the estimated LLM tokens of all documents
+in flight. Over a limit, the upload is refused with a Retry-After of how long the exceeded backlog takes
+to drain, or stored as deferred and released by release_deferred() once there is room again.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, NamedTuple, Optional
+
+from backend import config
+from backend.core import metrics
+from backend.core.celery import celery_app
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_QUEUE = "ai-analysis-queue"
+
+
+class Load(NamedTuple):
+    # None when the broker could not be asked
+    queue_depth: Optional[int]
+    documents: int
+    estimated_tokens: int
+    # Tasks started per second over the last ADMISSION_RATE_WINDOW, None when none started
+    tasks_per_second: Optional[float]
+
+
+class Decision(NamedTuple):
+    admitted: bool
+    # "queue_depth", "customer_in_flight" or "token_backlog", the limit that needs the longest to drain
+    limit: Optional[str] = None
+    retry_after: int = 0
+
+
+def drain_seconds(amount: float, per_second: Optional[float]) -> float:
+    return amount / per_second if per_second else config.ADMISSION_DEFAULT_RETRY_AFTER
+
+
+def stalled_before() -> datetime:
+    # Analyses processing since before then are stalled, their worker died without marking them failed
+    return datetime.now() - timedelta(seconds=config.ADMISSION_STALL_SECONDS)
+
+
+class AdmissionController:
+    """Admission decisions on a view of the pipeline load refreshed at most every ADMISSION_REFRESH_SECONDS."""
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._load: Optional[Load] = None
+        self._measured_at = 0.0
+
+    def _measure(self, storage) -> Load:
+        try:
+            queue_depth = metrics.queue_depths(self.app).get(ANALYSIS_QUEUE, 0)
+        except Exception as e:
+            logger.warning(f"Admission without the queue depth, the broker is unavailable: {e}")
+            queue_depth = None
+        in_flight = storage.in_flight_totals(stalled_before=stalled_before())
+        now = datetime.utcnow()
+        started = storage.count_pipeline_events(now - timedelta(seconds=config.ADMISSION_RATE_WINDOW), now, "started")
+        return Load(queue_depth, in_flight["documents"], in_flight["estimated_tokens"], started / config.ADMISSION_RATE_WINDOW or None)
+
+    def load(self, storage, refresh: bool = False) -> Load:
+        with self._lock:
+            if refresh or self._load is None or time.monotonic() - self._measured_at >= config.ADMISSION_REFRESH_SECONDS:
+                self._load = self._measure(storage)
+                self._measured_at = time.monotonic()
+            return self._load
+
+    def evaluate(self, storage, customer_id: str, estimated_tokens: int, documents: int = 1) -> Decision:
+        """Whether `documents` documents of `estimated_tokens` in all would be admitted now, without counting them in."""
+        if not config.ADMISSION_ENABLED:
+            return Decision(True)
+        load = self.load(storage)
+        tokens_per_second = config.ADMISSION_TOKENS_PER_MINUTE / 60
+        waits = {}
+
+        if load.queue_depth is not None and load.queue_depth + documents > config.ADMISSION_MAX_QUEUE_DEPTH:
+            waits["queue_depth"] = drain_seconds(load.queue_depth + documents - config.ADMISSION_MAX_QUEUE_DEPTH, load.tasks_per_second)
+
+        customer = storage.in_flight_totals(customer_id, stalled_before=stalled_before())
+        excess = customer["documents"] + documents - config.ADMISSION_MAX_IN_FLIGHT_PER_CUSTOMER
+        if excess > 0:
+            # Until that many of the customer's documents went through the LLM quota
+            in_flight = customer["documents"] + documents
+            waits["customer_in_flight"] = drain_seconds(excess * (customer["estimated_tokens"] + estimated_tokens) / in_flight, tokens_per_second)
+
+        backlog = load.estimated_tokens + estimated_tokens
+        if backlog > config.ADMISSION_MAX_TOKEN_BACKLOG:
+            waits["token_backlog"] = drain_seconds(backlog - config.ADMISSION_MAX_TOKEN_BACKLOG, tokens_per_second)
+
+        if not waits:
+            return Decision(True)
+        limit = max(waits, key=waits.get)
+        return Decision(False, limit, min(max(math.ceil(waits[limit]), 1), config.ADMISSION_MAX_RETRY_AFTER))
+
+    def admit(self, storage, customer_id: str, estimated_tokens: int, defer: bool = False, documents: int = 1) -> Decision:
+        """
+        Decide on documents about to be enqueued (or deferred, with `defer`), one upload or a whole batch.
+
+        Admitted ones count in the load until the next refresh.
+        """
+        decision = self.evaluate(storage, customer_id, estimated_tokens, documents)
+        if decision.admitted:
+            with self._lock:
+                if self._load is not None:
+                    self._load = self._load._replace(
+                        queue_depth=None if self._load.queue_depth is None else self._load.queue_depth + documents,
+                        documents=self._load.documents + documents,
+                        estimated_tokens=self._load.estimated_tokens + estimated_tokens,
+                    )
+        metrics.ADMISSION_DECISIONS.labels(
+            "admitted" if decision.admitted else "deferred" if defer else "rejected", decision.limit or "none"
+        ).inc(documents)
+        return decision
+
+    def release_deferred(self, storage, publish: Callable[[List[dict]], None]) -> int:
+        """Enqueue deferred documents, oldest first, as many as the queue depth and token backlog leave room for."""
+        if not config.ADMISSION_ENABLED:
+            room = config.ADMISSION_RELEASE_BATCH
+        else:
+            load = self.load(storage, refresh=True)
+            room = 0 if load.estimated_tokens >= config.ADMISSION_MAX_TOKEN_BACKLOG else config.ADMISSION_RELEASE_BATCH
+            if load.queue_depth is not None:
+                room = min(room, config.ADMISSION_MAX_QUEUE_DEPTH - load.queue_depth)
+        if room <= 0:
+            return 0
+
+        documents = storage.claim_deferred_artefacts(limit=room)
+        if not documents:
+            return 0
+        try:
+            publish(documents)
+        except Exception:
+            # Back to deferred, the next round tries again
+            for document in documents:
+                storage.update_artefact(document["uuid"], {"analysis_status": "deferred"})
+            raise
+        logger.info(f"Released {len(documents)} deferred documents for analysis")
+        return len(documents)
+
+
+async def release_deferred_periodically(controller: AdmissionController, storage, publish: Callable[[List[dict]], None]) -> None:
+    while True:
+        await asyncio.sleep(config.ADMISSION_RELEASE_INTERVAL)
+        try:
+            await asyncio.to_thread(controller.release_deferred, storage, publish)
+        except Exception as e:
+            logger.warning(f"Deferred documents not released: {e}")
+
+
+controller = AdmissionController(celery_app)
@@ -4,6 +4,8 @@ from celery import Celery
 from kombu import Exchange, Queue
 
 from backend import config
+# Task metrics, trace context propagation and the pipeline timeline hook into Celery signals
+from backend.core import metrics, pipeline_events, tracing  # NoQA: F401
 
 # Broker and Backend URLs
 default_broker_url = config.RABBITMQ_BROKER
@@ -17,7 +19,7 @@ celery_app = Celery(
     "worker",
     broker=broker_url,
     backend=redis_url,
-    include=["workers.analysis_worker"]
+    include=["workers.analysis_worker", "workers.extraction_worker"]
 )
 
 # Celery Configuration
@@ -25,6 +27,7 @@ celery_app.conf.update(
     result_expires=86400,
     task_acks_late=True,
     broker_connection_retry_on_startup=True,
+    broker_transport_options=config.CELERY_BROKER_TRANSPORT_OPTIONS,
     worker_cancel_long_running_tasks_on_connection_loss=True,
     worker_prefetch_multiplier=4,
     task_soft_time_limit=36000,
@@ -36,11 +39,13 @@ celery_app.conf.update(
     task_default_priority=5,  # Default mid-level priority
     task_queues=(
         Queue('default', Exchange('default'), routing_key='default', durable=True),
-        Queue('ai-analysis-queue', Exchange('ai-analysis-exchange'), routing_key='ai-analysis-routing-key', durable=True)
+        Queue('ai-analysis-queue', Exchange('ai-analysis-exchange'), routing_key='ai-analysis-routing-key', durable=True),
+        Queue('extraction-queue', Exchange('extraction-exchange'), routing_key='extraction-routing-key', durable=True)
     )
 )
 
 # Task Routing
 celery_app.conf.task_routes = {
-    "workers.analysis_worker.*": {"queue": "ai-analysis-queue"}
+    "workers.analysis_worker.*": {"queue": "ai-analysis-queue"},
+    "workers.extraction_worker.*": {"queue": "extraction-queue"}
 }
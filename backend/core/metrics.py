@@ -0,0 +1,201 @@
+"""
+Prometheus metrics of the API and the Celery workers.
+
+Values are kept in prometheus_client's multiprocess mode: every process, prefork children and
+gunicorn workers included, writes its own files to PROMETHEUS_MULTIPROC_DIR and a scrape adds
+them up. The API serves them on /metrics, a worker's main process on METRICS_WORKER_PORT.
+Import prometheus_client through this module only, it has to see the directory on its first import.
+"""
+import atexit
+import glob
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from backend import config
+
+# prometheus_client picks its value storage on import, the directory has to be known first.
+# Without one, the first process creates a temporary one, the processes it starts inherit it
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    if config.PROMETHEUS_MULTIPROC_DIR:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = config.PROMETHEUS_MULTIPROC_DIR
+    else:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+        atexit.register(shutil.rmtree, os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+import prometheus_client  # NoQA: E402
+from celery import signals  # NoQA: E402
+from prometheus_client import multiprocess  # NoQA: E402
+from prometheus_client.core import GaugeMetricFamily  # NoQA: E402
+
+logger = logging.getLogger(__name__)
+
+LLM_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+TASK_BUCKETS = (0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+HTTP_REQUEST_SECONDS = prometheus_client.Histogram(
+    "http_request_duration_seconds", "API request latency", ["method", "route", "status"]
+)
+TASK_SECONDS = prometheus_client.Histogram(
+    "celery_task_duration_seconds", "Run time of Celery tasks", ["task", "state"], buckets=TASK_BUCKETS
+)
+TASK_RETRIES = prometheus_client.Counter("celery_task_retries_total", "Celery task retries", ["task"])
+TASK_FAILURES = prometheus_client.Counter("celery_task_failures_total", "Celery tasks failed for good", ["task", "exception"])
+LLM_COMPLETION_SECONDS = prometheus_client.Histogram(
+    "llm_completion_duration_seconds", "LLM completion latency, hedges and endpoint failover included",
+    ["prompt", "model", "outcome"], buckets=LLM_BUCKETS
+)
+LLM_TOKENS = prometheus_client.Counter("llm_tokens_total", "LLM tokens by kind (prompt, completion)", ["prompt", "model", "kind"])
+LLM_ENDPOINT_ERRORS = prometheus_client.Counter(
+    "llm_endpoint_errors_total", "Failed requests to LLM endpoints, 429 when throttled", ["prompt", "model", "endpoint", "status"]
+)
+FUSED_STAGES = prometheus_client.Counter(
+    "celery_fused_stages_total", "Stages handed over in a fused run: run in-process (fused) or enqueued, and why", ["task", "outcome"]
+)
+SUPERSEDED_ANALYSES = prometheus_client.Counter(
+    "analysis_superseded_total", "Analyses in flight superseded by a new upload of their document, by status", ["status"]
+)
+SUPERSEDED_TOKENS = prometheus_client.Counter(
+    "analysis_superseded_tokens_total", "Tokens of superseded analyses: spent before, and estimated saved by the cancellation", ["kind"]
+)
+STALE_STAGES = prometheus_client.Counter("celery_stale_stages_total", "Stages of a superseded analysis stopped before running", ["stage"])
+STORAGE_SECONDS = prometheus_client.Histogram("storage_operation_duration_seconds", "Storage operation latency", ["backend", "operation"])
+ADMISSION_DECISIONS = prometheus_client.Counter(
+    "admission_decisions_total", "Uploads admitted, deferred or rejected, with the limit exceeded", ["outcome", "limit"]
+)
+
+# Media type of render()
+CONTENT_TYPE = prometheus_client.CONTENT_TYPE_LATEST
+
+_task_started = {}
+
+
+def registry() -> prometheus_client.CollectorRegistry:
+    """A registry adding up the values of every process writing to PROMETHEUS_MULTIPROC_DIR."""
+    collected = prometheus_client.CollectorRegistry()
+    multiprocess.MultiProcessCollector(collected)
+    return collected
+
+
+def render(*collectors) -> bytes:
+    """The text exposition of all processes' metrics and of `collectors`, collected now."""
+    collected = registry()
+    for collector in collectors:
+        collected.register(collector)
+    return prometheus_client.generate_latest(collected)
+
+
+def observe_completion(stage: Optional[str], model: str, seconds: float, usage=None, failed: bool = False) -> None:
+    prompt = stage or "completion"
+    LLM_COMPLETION_SECONDS.labels(prompt, model, "error" if failed else "ok").observe(seconds)
+    if usage is not None:
+        LLM_TOKENS.labels(prompt, model, "prompt").inc(usage.prompt_tokens)
+        LLM_TOKENS.labels(prompt, model, "completion").inc(usage.completion_tokens)
+
+
+def observe_endpoint_error(stage: Optional[str], model: str, endpoint: str, error: BaseException) -> None:
+    # Requests cancelled because their hedge won did not fail
+    if isinstance(error, Exception):
+        status = getattr(error, "status_code", None) or type(error).__name__
+        LLM_ENDPOINT_ERRORS.labels(stage or "completion", model, endpoint, str(status)).inc()
+
+
+def instrument_storage(storage):
+    """Time every public method of a storage instance."""
+    def timed(name, method):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                STORAGE_SECONDS.labels(storage.name, name).observe(time.perf_counter() - start)
+        return wrapper
+
+    for name in dir(type(storage)):
+        if not name.startswith("_") and callable(getattr(storage, name)):
+            setattr(storage, name, timed(name, getattr(storage, name)))
+    return storage
+
+
+class QueueDepthCollector:
+    """Messages waiting in each Celery queue, asked from the broker at most every METRICS_QUEUE_DEPTH_REFRESH_SECONDS."""
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._depths: Dict[str, int] = {}
+        self._measured_at: Optional[float] = None
+
+    def depths(self) -> Dict[str, int]:
+        with self._lock:
+            if self._measured_at is None or time.monotonic() - self._measured_at >= config.METRICS_QUEUE_DEPTH_REFRESH_SECONDS:
+                try:
+                    self._depths = queue_depths(self.app)
+                except Exception as e:
+                    # Not asked again before the next refresh either, scrapes of an unavailable broker stay cheap
+                    logger.warning(f"Celery queue depths unavailable: {e}")
+                    self._depths = {}
+                self._measured_at = time.monotonic()
+            return self._depths
+
+    def collect(self):
+        depth = GaugeMetricFamily("celery_queue_depth", "Messages waiting in a Celery queue", labels=["queue"])
+        for name, count in self.depths().items():
+            depth.add_metric([name], count)
+        yield depth
+
+
+def queue_depths(app) -> Dict[str, int]:
+    """Messages waiting in each Celery queue, asked from the broker."""
+    depths = {}
+    with app.connection_for_read() as connection:
+        connection.ensure_connection(max_retries=1)
+        for queue in app.conf.task_queues:
+            # A failed passive declare closes the channel, every queue gets its own
+            with connection.channel() as channel:
+                try:
+                    depths[queue.name] = channel.queue_declare(queue=queue.name, passive=True).message_count
+                except connection.channel_errors:
+                    # Not declared yet, nothing was ever sent to it
+                    depths[queue.name] = 0
+    return depths
+
+
+@signals.task_prerun.connect
+def task_started(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@signals.task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    start = _task_started.pop(task_id, None)
+    if start is not None:
+        TASK_SECONDS.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - start)
+
+
+@signals.task_retry.connect
+def task_retried(sender=None, **kwargs):
+    TASK_RETRIES.labels(sender.name).inc()
+
+
+@signals.task_failure.connect
+def task_failed(sender=None, exception=None, **kwargs):
+    TASK_FAILURES.labels(sender.name, type(exception).__name__).inc()
+
+
+@signals.worker_init.connect
+def serve_worker_metrics(**kwargs):
+    # Files of an earlier run would be added to this one's values
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+    if config.METRICS_WORKER_PORT:
+        try:
+            prometheus_client.start_http_server(config.METRICS_WORKER_PORT, registry=registry())
+            logger.info(f"Serving worker metrics on port {config.METRICS_WORKER_PORT}")
+        except OSError as e:
+            logger.warning(f"Worker metrics not served on port {config.METRICS_WORKER_PORT}: {e}")
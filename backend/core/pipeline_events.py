@@ -0,0 +1,145 @@
+"""
+Timeline of every Celery task: enqueued, started, finished, retried and failed events.
+
+Events are recorded through Celery signals by whichever process publishes or runs the task, buffered
+and written in batches from a background thread. The API writes its batches to storage directly,
+workers post theirs to POST /api/v1/pipeline/events.
+
+Every event names its document. Tasks without a `document_uuid` argument, like text extraction, get the
+document of the task publishing them in a `document_uuid` message header.
+"""
+import inspect
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import orjson
+import requests
+from celery import current_app, current_task, signals
+
+from backend import config
+
+logger = logging.getLogger(__name__)
+
+
+def post_events(events: List[dict]) -> None:
+    """Send a batch to the API. Not through perform_request, the batches would be traced and logged themselves."""
+    response = requests.post(
+        f"{config.API_URL}/api/v1/pipeline/events",
+        data=orjson.dumps({"events": events}),
+        headers={"Content-Type": "application/json"},
+        timeout=10,
+    )
+    response.raise_for_status()
+
+
+class EventBuffer:
+    """Pipeline events of this process, handed to `sink` every PIPELINE_EVENTS_FLUSH_SECONDS or PIPELINE_EVENTS_BATCH_SIZE events."""
+
+    def __init__(self, sink: Callable[[List[dict]], None] = post_events):
+        self.sink = sink
+        self._reset()
+        # A prefork child starts empty, with its own lock and flusher thread
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._events = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, task_id: str, stage: str, event: str, document_uuid: Optional[str] = None) -> None:
+        if not config.PIPELINE_EVENTS_ENABLED:
+            return
+        record = {"task_id": task_id, "stage": stage, "event": event, "document_uuid": document_uuid, "occurred_at": datetime.utcnow()}
+        with self._lock:
+            self._events.append(record)
+            full = len(self._events) >= config.PIPELINE_EVENTS_BATCH_SIZE
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pipeline-events", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(config.PIPELINE_EVENTS_FLUSH_SECONDS)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return
+        try:
+            self.sink(events)
+        except Exception as e:
+            # The timeline is diagnostics, a lost batch must not hold up the pipeline
+            logger.warning(f"Dropped {len(events)} pipeline events: {e}")
+
+
+buffer = EventBuffer()
+
+
+def stage_name(task_name: str) -> str:
+    return task_name.rsplit(".", 1)[-1]
+
+
+def call_argument(task, args, kwargs, name: str) -> Optional[str]:
+    """The `name` argument of a task call, if it has one."""
+    try:
+        return inspect.signature(task.run).bind_partial(*(args or ()), **(kwargs or {})).arguments.get(name)
+    except TypeError:
+        return None
+
+
+def document_uuid_of(task, args, kwargs) -> Optional[str]:
+    return call_argument(task, args, kwargs, "document_uuid") or getattr(task.request, "document_uuid", None)
+
+
+def task_stage(task, args, kwargs) -> str:
+    """The pipeline stage a task call runs: its `stage` argument for the generic stage task, otherwise the task."""
+    return call_argument(task, args, kwargs, "stage") or stage_name(task.name)
+
+
+@signals.before_task_publish.connect
+def record_enqueued(sender=None, headers=None, body=None, **kwargs):
+    # Retries are published again under the same task id. The body is (args, kwargs, embed) in protocol 2
+    call_args = body[0] if isinstance(body, (tuple, list)) and body and isinstance(body[0], (tuple, list)) else ()
+    call_kwargs = body[1] if isinstance(body, (tuple, list)) and len(body) > 1 and isinstance(body[1], dict) else {}
+    task = current_app.tasks.get(sender)
+    document_uuid = call_argument(task, call_args, call_kwargs, "document_uuid") if task is not None else call_kwargs.get("document_uuid")
+    if document_uuid is None and current_task:
+        document_uuid = document_uuid_of(current_task, current_task.request.args, current_task.request.kwargs)
+    if document_uuid is not None:
+        headers["document_uuid"] = document_uuid
+    buffer.add(headers["id"], call_kwargs.get("stage") or stage_name(sender), "enqueued", document_uuid)
+
+
+@signals.task_prerun.connect
+def record_started(task_id=None, task=None, args=None, kwargs=None, **extra):
+    buffer.add(task_id, task_stage(task, args, kwargs), "started", document_uuid_of(task, args, kwargs))
+
+
+@signals.task_postrun.connect
+def record_finished(task_id=None, task=None, args=None, kwargs=None, **extra):
+    buffer.add(task_id, task_stage(task, args, kwargs), "finished", document_uuid_of(task, args, kwargs))
+
+
+@signals.task_retry.connect
+def record_retried(sender=None, request=None, **kwargs):
+    buffer.add(request.id, task_stage(sender, request.args, request.kwargs), "retried", document_uuid_of(sender, request.args, request.kwargs))
+
+
+@signals.task_failure.connect
+def record_failed(sender=None, task_id=None, args=None, kwargs=None, **extra):
+    buffer.add(task_id, task_stage(sender, args, kwargs), "failed", document_uuid_of(sender, args, kwargs))
+
+
+@signals.worker_process_shutdown.connect
+@signals.worker_shutdown.connect
+def flush_worker_events(**kwargs):
+    buffer.flush()
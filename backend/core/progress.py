@@ -0,0 +1,168 @@
+"""
+Live analysis progress over Redis pub/sub.
+
+The analysis worker publishes every stage transition of a document to the channel of the document
+and to the channel of its customer. Each channel also keeps its last PROGRESS_REPLAY_SIZE events in
+a Redis list, replayed to subscribers joining late. The API holds one Redis subscription per process
+and fans the events out to the SSE streams of progress_endpoints.
+"""
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
+from typing import AsyncIterator, Optional
+
+import orjson
+import redis
+import redis.asyncio
+
+from backend import config
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "progress"
+
+# Status of an analysis starting, a document's replay buffer starts over with it
+STARTED_STATUS = "processing"
+# Events after which a document's analysis goes no further
+FINAL_STATUSES = ("processed", "failed")
+
+# Events waiting for one slow SSE stream before newer ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+def document_channel(document_uuid: str) -> str:
+    return f"{CHANNEL_PREFIX}:document:{document_uuid}"
+
+
+def customer_channel(customer_id: str) -> str:
+    return f"{CHANNEL_PREFIX}:customer:{customer_id}"
+
+
+def history_key(channel: str) -> str:
+    return f"{channel}:history"
+
+
+@lru_cache(maxsize=None)
+def redis_client() -> redis.Redis:
+    # The connection pool reconnects in forked children by itself
+    return redis.Redis.from_url(config.PROGRESS_REDIS_URL, socket_timeout=5, socket_connect_timeout=2)
+
+
+def publish(document_uuid: str, stage: str, status: str, customer_id: Optional[str] = None, **details) -> None:
+    """Publish a stage transition of a document, to its customer's channel too when `customer_id` is known."""
+    if not config.PROGRESS_REDIS_URL:
+        return
+    event = {
+        "id": uuid.uuid4().hex,
+        "document_uuid": document_uuid,
+        "customer_id": customer_id,
+        "stage": stage,
+        "status": status,
+        "at": datetime.utcnow().isoformat(),
+        **details,
+    }
+    data = orjson.dumps(event)
+    channels = [document_channel(document_uuid)] + ([customer_channel(customer_id)] if customer_id else [])
+    try:
+        with redis_client().pipeline() as pipe:
+            if status == STARTED_STATUS:
+                pipe.delete(history_key(channels[0]))
+            for channel in channels:
+                pipe.rpush(history_key(channel), data)
+                pipe.ltrim(history_key(channel), -config.PROGRESS_REPLAY_SIZE, -1)
+                pipe.expire(history_key(channel), config.PROGRESS_REPLAY_TTL)
+                pipe.publish(channel, data)
+            pipe.execute()
+    except redis.RedisError as e:
+        # Progress is informational, the analysis goes on without it
+        logger.warning(f"Progress of {document_uuid} ({stage} {status}) not published: {e}")
+
+
+class ProgressHub:
+    """One Redis subscription to every progress channel, its events handed to the SSE streams listening to each channel."""
+
+    def __init__(self):
+        self._queues = defaultdict(set)
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+        self._redis = None
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}:*")
+                async for message in pubsub.listen():
+                    if message["type"] == "psubscribe":
+                        self._subscribed.set()
+                    elif message["type"] == "pmessage":
+                        self._dispatch(message["channel"].decode(), message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._subscribed.clear()
+                logger.warning(f"Progress subscription lost, resubscribing: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def _dispatch(self, channel: str, data: bytes) -> None:
+        for queue in self._queues.get(channel, ()):
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                logger.warning(f"Progress stream of {channel} is not keeping up, event dropped")
+
+    async def ready(self, timeout: float = 5) -> bool:
+        """Whether the subscription is up, started on first use."""
+        if self._listener is None or self._listener.done():
+            self._redis = redis.asyncio.Redis.from_url(config.PROGRESS_REDIS_URL, socket_connect_timeout=2)
+            self._subscribed.clear()
+            self._listener = asyncio.create_task(self._listen())
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def subscribe(self, channel: str, last_event_id: Optional[str] = None) -> AsyncIterator[dict]:
+        """
+        Events of `channel`: those still in its replay buffer after `last_event_id` (all of them without one), then live ones.
+
+        Subscribed before the buffer is read, an event published in between arrives twice and is skipped the second time.
+        """
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._queues[channel].add(queue)
+        try:
+            if not await self.ready():
+                raise ConnectionError("Progress subscription is down")
+            history = [orjson.loads(data) for data in await self._redis.lrange(history_key(channel), 0, -1)]
+            ids = [event["id"] for event in history]
+            seen = set(ids)
+            if last_event_id in seen:
+                history = history[ids.index(last_event_id) + 1:]
+            for event in history:
+                yield event
+            while True:
+                event = orjson.loads(await queue.get())
+                if event["id"] not in seen:
+                    yield event
+        finally:
+            self._queues[channel].discard(queue)
+            if not self._queues[channel]:
+                del self._queues[channel]
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+
+hub = ProgressHub()
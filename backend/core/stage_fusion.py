@@ -0,0 +1,145 @@
+"""
+In-process fusion of consecutive analysis stages.
+
+A stage hands its document over with hand_over(next_stage, **kwargs). Outside a fused run that is next_stage.delay(),
+in one the worker runs the first stage handed over to itself as soon as the current one returns: no broker round trip, prefetch or
+cold start on another worker. Before each in-process stage the run saves a checkpoint on the document, whose PATCH
+response is the document the stage would otherwise fetch again.
+
+A run starts no further stage once it is past STAGE_FUSION_BUDGET_SECONDS or STAGE_FUSION_MAX_STAGES, or the worker
+is shutting down. That stage, and one that fails in-process, is enqueued instead and gets the retries of its own task.
+A retried or redelivered stage resumes its run from the checkpoint, the stages already done are not repeated.
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import orjson
+from celery import Task
+from celery.worker import state as worker_state
+
+from backend import config
+from backend.core import metrics, pipeline_events, tracing
+from backend.core.pipeline_events import document_uuid_of, task_stage
+from backend.utils.helpers import get_document, metadata_url, safe_request
+
+logger = logging.getLogger(__name__)
+
+# The fused run of the task this thread is running
+_local = threading.local()
+
+
+class FusedRun:
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.started = time.monotonic()
+        self.stages = 1
+        # (task, kwargs) of the stage handed over to, if any
+        self.next = None
+        # The document as the checkpoint left it, for the next stage
+        self.document = None
+
+    def stop_reason(self) -> Optional[str]:
+        """Why no further stage is run in-process, None while the run can go on."""
+        # A warm shutdown sets should_stop to exit code 0
+        if worker_state.should_stop is not None or worker_state.should_terminate is not None:
+            return "shutdown"
+        if self.stages >= config.STAGE_FUSION_MAX_STAGES:
+            return "max_stages"
+        if time.monotonic() - self.started >= config.STAGE_FUSION_BUDGET_SECONDS:
+            return "budget"
+        return None
+
+
+def hand_over(next_stage: Task, **kwargs) -> None:
+    """
+    Continue the analysis with `next_stage`, in this worker during a fused run.
+
+    A run goes on with the first stage handed over to, further ones are parallel branches and enqueued for other workers.
+    """
+    run = getattr(_local, "run", None)
+    if run is None or run.next is not None:
+        next_stage.delay(**kwargs)
+    else:
+        run.next = (next_stage, kwargs)
+
+
+def get_stage_document(document_uuid: str) -> dict:
+    """The document of a stage, as its checkpoint returned it in a fused run."""
+    run = getattr(_local, "run", None)
+    if run is not None and run.document is not None and run.document["uuid"] == document_uuid:
+        document, run.document = run.document, None
+        return document
+    return get_document(document_uuid=document_uuid)
+
+
+def save_checkpoint(run: FusedRun, stage: Task, kwargs: dict) -> None:
+    document_uuid = kwargs["document_uuid"]
+    response = safe_request(
+        request_type="PATCH",
+        url=metadata_url(document_uuid, kwargs.get("generation")),
+        data={"pipeline_checkpoint": {"task_id": run.task_id, "stage": stage.name, "kwargs": kwargs, "at": datetime.utcnow().isoformat()}},
+    )
+    if response is None:
+        raise Exception(f"API call failed for checkpointing document {document_uuid}")
+    run.document = orjson.loads(response.content)
+
+
+class FusedStage(Task):
+    """Base of the analysis stages: a stage run by a worker runs the stages it hands over to in-process too."""
+
+    def __call__(self, *args, **kwargs):
+        if not config.STAGE_FUSION_ENABLED or getattr(_local, "run", None) is not None or self.request.called_directly:
+            return super().__call__(*args, **kwargs)
+
+        _local.run = run = FusedRun(self.request.id)
+        try:
+            run.next = self._resume_point(args, kwargs)
+            result = None if run.next else super().__call__(*args, **kwargs)
+            while run.next is not None:
+                stage, stage_kwargs = run.next
+                run.next = None
+                self._continue(run, stage, stage_kwargs)
+            return result
+        finally:
+            _local.run = None
+
+    def _resume_point(self, args, kwargs) -> Optional[tuple]:
+        # Only a task of a run that already started can have left a checkpoint
+        if not (self.request.retries or (self.request.delivery_info or {}).get("redelivered")):
+            return None
+        document_uuid = document_uuid_of(self, args, kwargs)
+        checkpoint = get_document(document_uuid=document_uuid).get("pipeline_checkpoint") if document_uuid else None
+        if not checkpoint or checkpoint["task_id"] != self.request.id:
+            return None
+        logger.info(f"Resuming the fused run of {document_uuid} at {checkpoint['stage']}")
+        return self.app.tasks[checkpoint["stage"]], checkpoint["kwargs"]
+
+    @staticmethod
+    def _continue(run: FusedRun, stage: Task, kwargs: dict) -> None:
+        name = task_stage(stage, (), kwargs)
+        reason = run.stop_reason()
+        if reason is None:
+            # Recorded in the pipeline timeline like a task, without an enqueue
+            stage_id = uuid.uuid4().hex
+            document_uuid = kwargs.get("document_uuid")
+            pipeline_events.buffer.add(stage_id, name, "started", document_uuid)
+            try:
+                save_checkpoint(run, stage, kwargs)
+                with tracing.tracer.start_as_current_span(f"fused {name}", attributes={"document.uuid": document_uuid or ""}):
+                    stage(**kwargs)
+            except Exception as e:
+                logger.warning(f"Fused {name} of {document_uuid} failed, enqueueing it: {e}")
+                pipeline_events.buffer.add(stage_id, name, "retried", document_uuid)
+                run.next = run.document = None
+                reason = "error"
+            else:
+                pipeline_events.buffer.add(stage_id, name, "finished", document_uuid)
+                metrics.FUSED_STAGES.labels(name, "fused").inc()
+                run.stages += 1
+                return
+        metrics.FUSED_STAGES.labels(name, reason).inc()
+        stage.delay(**kwargs)
@@ -0,0 +1,74 @@
+"""
+Superseding the analysis of a document uploaded again.
+
+Every upload writes a new `generation` on its document, and the analysis tasks carry the generation they were
+started for. supersede() cancels the analysis of the replaced upload: its running tasks, as the pipeline timeline
+knows them, are revoked, and the ledger gets the tokens it spent and, as `saved`, the rest of its estimate.
+A stage of the old generation that was still queued sees it is stale before making any LLM call, and writes
+of the old generation are refused with 409. A stage that finished its LLM call before being refused still
+gets its tokens recorded.
+
+Revoking is best-effort: the timeline misses tasks whose events are not flushed yet, and stages run in-process
+by a fused run have ids of their own that no worker knows. Those stop at the generation check instead.
+"""
+import logging
+import uuid
+from typing import Optional
+
+from backend import config
+from backend.core import metrics
+from backend.core.celery import celery_app
+
+logger = logging.getLogger(__name__)
+
+# Statuses of an analysis that has tokens left to spend
+IN_FLIGHT_STATUSES = ("pending", "processing", "deferred")
+
+
+def new_generation() -> str:
+    return uuid.uuid4().hex
+
+
+def supersede(storage, document: dict) -> int:
+    """Cancel the analysis of a document about to be replaced by a new upload, returns the tokens saved."""
+    task_ids = storage.list_running_tasks(document["uuid"])
+    if task_ids:
+        try:
+            celery_app.control.revoke(task_ids, terminate=config.SUPERSEDE_TERMINATE_RUNNING)
+            logger.info(f"Revoked {len(task_ids)} running tasks of the superseded analysis of {document['uuid']}")
+        except Exception as e:
+            # The tasks are still stopped by the generation check, only later
+            logger.warning(f"Tasks of the superseded analysis of {document['uuid']} not revoked: {e}")
+
+    if document["analysis_status"] not in IN_FLIGHT_STATUSES:
+        return 0
+    # The old analysis never reaches record_cost, its tokens are recorded here
+    spent = sum(((document.get("pipeline_state") or {}).get("completed") or {}).values())
+    saved = max((document.get("estimated_tokens") or 0) - spent, 0)
+    if spent:
+        storage.add_ledger_entry(document["uuid"], tokens=spent)
+    if saved:
+        storage.add_ledger_entry(document["uuid"], tokens=saved, entry_type="saved")
+    metrics.SUPERSEDED_ANALYSES.labels(document["analysis_status"]).inc()
+    metrics.SUPERSEDED_TOKENS.labels("spent").inc(spent)
+    metrics.SUPERSEDED_TOKENS.labels("saved").inc(saved)
+    logger.info(f"Superseded the {document['analysis_status']} analysis of {document['uuid']}: {spent} tokens spent, about {saved} saved")
+    return saved
+
+
+def record_stale_completion(storage, document_uuid: str, stage: str, tokens: int) -> None:
+    """Record the tokens of a stage whose completion was refused as stale, the superseded analysis spent them too."""
+    if not tokens:
+        return
+    storage.add_ledger_entry(document_uuid, tokens=tokens)
+    metrics.SUPERSEDED_TOKENS.labels("spent").inc(tokens)
+    logger.info(f"Recorded {tokens} tokens of the stale {stage} of {document_uuid}")
+
+
+def is_stale(document: dict, generation: Optional[str], stage: str) -> bool:
+    """Whether a stage started for `generation` belongs to an analysis superseded since, tasks without a generation never are."""
+    if generation is None or document.get("generation") == generation:
+        return False
+    logger.info(f"Stopping stale {stage} of {document['uuid']}, generation {generation} was superseded")
+    metrics.STALE_STAGES.labels(stage).inc()
+    return True
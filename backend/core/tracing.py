@@ -0,0 +1,146 @@
+"""
+OpenTelemetry tracing of a document from its upload through every Celery stage, LLM call and webhook.
+
+Trace context travels in W3C traceparent headers: injected into every published Celery task and every
+request of perform_request, extracted by the worker before a task runs and by the API middleware.
+Spans go to the TRACING_EXPORTER, tracing is a no-op when it is "none".
+"""
+import fcntl
+import logging
+import os
+from typing import Optional, Sequence
+
+from celery import signals
+from opentelemetry import context, propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import (BatchSpanProcessor,
+                                            ConsoleSpanExporter, SpanExporter,
+                                            SpanExportResult)
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+from backend import config
+from backend.core.pipeline_events import document_uuid_of, task_stage
+
+logger = logging.getLogger(__name__)
+
+tracer = trace.get_tracer("eternyiq")
+
+# Spans of running tasks and their context tokens, by task id
+_task_spans = {}
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends finished spans as JSON lines to a file shared by any number of processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        with open(self.path, "a", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(lines)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return SpanExportResult.SUCCESS
+
+
+def create_exporter(name: str = None) -> Optional[SpanExporter]:
+    """The span exporter called `name` (TRACING_EXPORTER by default), None when tracing is off."""
+    name = (name or config.TRACING_EXPORTER).lower()
+    if name == "none":
+        return None
+    if name == "console":
+        return ConsoleSpanExporter()
+    if name == "file":
+        return FileSpanExporter(config.TRACING_FILE_PATH)
+    if name == "otlp":
+        # Optional dependency, configured by the OTEL_EXPORTER_OTLP_* environment variables
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import \
+            OTLPSpanExporter
+        return OTLPSpanExporter()
+    raise ValueError(f"Unsupported tracing exporter: {name}")
+
+
+def setup_tracing(service_name: str) -> None:
+    """Send the spans of this process to the configured exporter."""
+    exporter = create_exporter()
+    if exporter is None:
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    # The batch processor restarts its export thread in forked children
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Tracing {service_name} to {config.TRACING_EXPORTER}")
+
+
+def inject_headers(headers: Optional[dict] = None) -> dict:
+    """`headers` with the trace context of the current span added."""
+    headers = dict(headers or {})
+    propagate.inject(headers)
+    return headers
+
+
+def start_server_span(name: str, headers) -> trace.Span:
+    """A span continuing the trace of an incoming request's headers."""
+    return tracer.start_span(name, context=propagate.extract(headers), kind=SpanKind.SERVER)
+
+
+@signals.before_task_publish.connect
+def inject_task_headers(headers=None, **kwargs):
+    propagate.inject(headers)
+
+
+@signals.task_prerun.connect
+def start_task_span(task_id=None, task=None, args=None, kwargs=None, **extra):
+    parent = propagate.extract(vars(task.request))
+    span = tracer.start_span(f"celery {task.name}", context=parent, kind=SpanKind.CONSUMER, attributes={
+        "celery.task_id": task_id,
+        "celery.task_name": task.name,
+        "celery.retries": task.request.retries or 0,
+        "pipeline.stage": task_stage(task, args, kwargs),
+    })
+    document_uuid = document_uuid_of(task, args, kwargs)
+    if document_uuid:
+        span.set_attribute("document.uuid", document_uuid)
+    _task_spans[task_id] = (span, context.attach(trace.set_span_in_context(span, parent)))
+
+
+@signals.task_retry.connect
+def record_task_retry(request=None, reason=None, **kwargs):
+    if request is not None and request.id in _task_spans:
+        _task_spans[request.id][0].add_event("retry", {"reason": str(reason)})
+
+
+@signals.task_failure.connect
+def record_task_failure(task_id=None, exception=None, **kwargs):
+    if task_id in _task_spans:
+        span = _task_spans[task_id][0]
+        span.record_exception(exception)
+        span.set_status(Status(StatusCode.ERROR, str(exception)))
+
+
+@signals.task_postrun.connect
+def end_task_span(task_id=None, state=None, **kwargs):
+    if task_id not in _task_spans:
+        return
+    span, token = _task_spans.pop(task_id)
+    span.set_attribute("celery.state", state or "UNKNOWN")
+    span.end()
+    context.detach(token)
+
+
+@signals.worker_init.connect
+def setup_worker_tracing(**kwargs):
+    setup_tracing("eternyiq-worker")
+
+
+@signals.worker_process_shutdown.connect
+def flush_worker_spans(**kwargs):
+    # Prefork children exit without running atexit handlers
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "force_flush"):
+        provider.force_flush()
@@ -4,6 +4,9 @@ from typing import Any, Optional
 
 from pydantic import BaseModel
 
+# Columns holding JSON documents (SQLite JSON1 text / PostgreSQL JSONB)
+ARTEFACT_JSON_FIELDS = ("ai_features_and_insights", "ai_alerts_and_actions", "ai_eterny_legacy_schema", "pipeline_checkpoint", "pipeline_state")
+
 
 class AImode(str, Enum):
     standard = "standard"
@@ -19,9 +22,13 @@ class AIAlert(str, Enum):
 
 
 class AnalysisStatus(str, Enum):
+    # Accepted while the pipeline was busy, waits for admission before it is enqueued
+    deferred = "deferred"
     pending = "pending"
     processing = "processing"
     processed = "processed"
+    # The analysis ran out of retries
+    failed = "failed"
 
 
 class Artefact(BaseModel):
@@ -50,6 +57,14 @@ class Artefact(BaseModel):
     ai_eterny_legacy_schema: Optional[Any] = ""
     document_raw_text: Optional[str] = ""
     webhook_url: Optional[str] = ""
+    batch_id: Optional[str] = None
+    estimated_tokens: Optional[int] = None
+    # Next stage of a fused run of stages in one worker, see backend.core.stage_fusion
+    pipeline_checkpoint: Optional[Any] = None
+    # Pipeline the analysis runs and the tokens of its completed stages: {"pipeline": name, "completed": {stage: tokens}}
+    pipeline_state: Optional[Any] = None
+    # Written by every upload, the analysis tasks of an earlier upload of the same document see they are stale
+    generation: Optional[str] = None
 
 
 class ArtefactUpdate(BaseModel):
@@ -71,3 +86,29 @@ class ArtefactUpdate(BaseModel):
     ai_eterny_legacy_schema: Optional[Any] = ""
     document_raw_text: Optional[str] = ""
     webhook_url: Optional[str] = ""
+    estimated_tokens: Optional[int] = None
+    pipeline_checkpoint: Optional[Any] = None
+    pipeline_state: Optional[Any] = None
+
+
+class StageCompletion(BaseModel):
+    """A pipeline stage's outputs, written together with its completion."""
+    stage: str
+    tokens: int = 0
+    data: ArtefactUpdate = ArtefactUpdate()
+    # Upload generation the stage ran for, a stale one is refused
+    generation: Optional[str] = None
+
+
+class LedgerPayload(BaseModel):
+    tokens: int
+    entry_type: str = "spent"
+
+
+class LedgerEntry(BaseModel):
+    id: int
+    document_uuid: str
+    customer_id: Optional[str] = None
+    entry_type: str
+    tokens: int
+    created_at: datetime
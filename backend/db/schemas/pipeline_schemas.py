@@ -0,0 +1,16 @@
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel
+
+
+class PipelineEvent(BaseModel):
+    task_id: str
+    stage: str
+    event: Literal["enqueued", "started", "finished", "retried", "failed"]
+    document_uuid: Optional[str] = None
+    occurred_at: datetime
+
+
+class PipelineEvents(BaseModel):
+    events: List[PipelineEvent]
@@ -0,0 +1,30 @@
+from functools import lru_cache
+
+from backend import config
+from backend.db.storage.base import InvalidJSONError, Storage, StorageError
+
+
+def create_storage(backend: str = None) -> Storage:
+    """Instantiate the configured storage backend."""
+    backend = (backend or config.STORAGE_BACKEND).lower()
+    if backend == "sqlite":
+        from backend.db.storage.sqlite import SQLiteStorage
+        return SQLiteStorage(config.DB_PATH, busy_timeout=config.SQLITE_BUSY_TIMEOUT)
+    if backend in ("postgres", "postgresql"):
+        from backend.db.storage.postgres import PostgresStorage
+        return PostgresStorage(
+            config.POSTGRES_DSN,
+            min_size=config.POSTGRES_POOL_MIN_SIZE,
+            max_size=config.POSTGRES_POOL_MAX_SIZE,
+        )
+    raise ValueError(f"Unsupported storage backend: {backend}")
+
+
+@lru_cache(maxsize=None)
+def get_storage() -> Storage:
+    """Process-wide storage instance, also used as a FastAPI dependency, its operations timed in the metrics."""
+    from backend.core.metrics import instrument_storage
+    return instrument_storage(create_storage())
+
+
+__all__ = ["InvalidJSONError", "Storage", "StorageError", "create_storage", "get_storage"]
@@ -0,0 +1,180 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional
+
+# Columns accepted when inserting a new `files` row
+ARTEFACT_INSERT_COLUMNS = (
+    "uuid", "customer_id", "filename", "uploaded_at",
+    "ai_output_language", "ai_analysis_mode", "analysis_status", "analysis_started_at", "analysis_completed_at",
+    "webhook_url",
+    "file_size",
+    "hash_sha256",
+    "batch_id",
+    "estimated_tokens",
+    "generation",
+)
+
+
+class StorageError(Exception):
+    """Base class for storage backend errors."""
+
+
+class InvalidJSONError(StorageError, ValueError):
+    """A value written to a JSON column is not valid JSON."""
+
+
+class Storage(ABC):
+    """
+    Persistence operations for artefacts (`files`), RAG messages, the token ledger and pipeline events.
+
+    Implementations return plain dicts with JSON columns already decoded, so callers never
+    touch backend specific rows, placeholders or JSON encodings.
+    """
+
+    name: str = "abstract"
+
+    @abstractmethod
+    def init_schema(self) -> None:
+        """Create tables and indexes if they do not exist yet."""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Release connections held by the backend."""
+
+    # Artefacts
+
+    @abstractmethod
+    def get_artefact(self, uuid: str) -> Optional[Dict[str, Any]]:
+        """Return the artefact row for `uuid` or None."""
+
+    @abstractmethod
+    def insert_artefact(self, record: Dict[str, Any]) -> None:
+        """Insert a single artefact, `record` keys are a subset of ARTEFACT_INSERT_COLUMNS."""
+
+    @abstractmethod
+    def get_artefacts(self, uuids: List[str]) -> List[Dict[str, Any]]:
+        """Return the existing artefact rows among `uuids`."""
+
+    @abstractmethod
+    def bulk_insert_artefacts(self, records: List[Dict[str, Any]], replace: bool = False) -> int:
+        """
+        Insert many artefacts in a single transaction, returns the number of rows written.
+
+        With `replace`, existing rows with the same uuids are deleted in that same transaction.
+        """
+
+    @abstractmethod
+    def update_artefact(self, uuid: str, data: Dict[str, Any], generation: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Update the given columns and return the updated row, None if the artefact does not exist.
+
+        With `generation`, only an artefact of that upload generation is updated, None otherwise.
+        """
+
+    @abstractmethod
+    def complete_pipeline_stage(
+        self, uuid: str, stage: str, tokens: int, data: Dict[str, Any], generation: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Update the given columns and add `stage` with its `tokens` to pipeline_state.completed, in one statement.
+
+        Returns the row as this update left it, concurrent completions each see the stages completed before
+        them. None if the artefact does not exist, or with `generation` is of another upload generation.
+        """
+
+    @abstractmethod
+    def delete_artefact(self, uuid: str) -> None:
+        """Delete the artefact row if present."""
+
+    @abstractmethod
+    def list_artefacts(self, limit: int = 10, offset: int = 0, analysis_status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """List artefacts, optionally filtered by analysis status."""
+
+    @abstractmethod
+    def count_artefacts_by_status(self, batch_id: str) -> Dict[str, int]:
+        """Number of artefacts per analysis status within an ingestion batch."""
+
+    @abstractmethod
+    def claim_pending_artefacts(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Atomically move up to `limit` pending artefacts to `processing` and return them.
+
+        Concurrent callers never receive the same artefact.
+        """
+
+    @abstractmethod
+    def claim_deferred_artefacts(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Atomically move up to `limit` deferred artefacts, oldest first, back to `pending` and return them."""
+
+    @abstractmethod
+    def in_flight_totals(self, customer_id: Optional[str] = None, stalled_before: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Pending and processing artefacts, of one customer or of all: {"documents": n, "estimated_tokens": n}.
+
+        Artefacts without a token estimate count as none. With `stalled_before`, artefacts processing since
+        before then are taken for stalled and not counted.
+        """
+
+    # RAG messages
+
+    @abstractmethod
+    def add_message(self, document_uuid: str, message_type: Literal["question", "answer"], content: str) -> Dict[str, Any]:
+        """Store a message and return it including `id` and `created_at`."""
+
+    @abstractmethod
+    def list_messages(self, document_uuid: str, order: Literal["asc", "desc"] = "desc") -> List[Dict[str, Any]]:
+        """Return the conversation for a document ordered by id."""
+
+    # Token ledger
+
+    @abstractmethod
+    def add_ledger_entry(self, document_uuid: str, tokens: int, entry_type: str = "spent") -> Dict[str, Any]:
+        """Record tokens against a document (and its customer, if the document still exists)."""
+
+    @abstractmethod
+    def get_ledger_total(self, document_uuid: str, entry_type: str = "spent") -> int:
+        """Sum of ledger tokens recorded for a document."""
+
+    # Content-addressed blobs
+
+    @abstractmethod
+    def acquire_blob(self, hash_sha256: str, size: int) -> int:
+        """Add a reference to a blob (creating its record if needed), returns the new reference count."""
+
+    @abstractmethod
+    def release_blob(self, hash_sha256: str) -> Optional[int]:
+        """Drop a reference to a blob, returns the new reference count or None for an unknown blob."""
+
+    @abstractmethod
+    def list_unreferenced_blobs(self, released_before: datetime, limit: int = 1000) -> List[str]:
+        """Hashes of blobs without references since before `released_before`."""
+
+    @abstractmethod
+    def delete_unreferenced_blob(self, hash_sha256: str) -> bool:
+        """Delete the blob record if it is still unreferenced, True when it was deleted."""
+
+    # Pipeline events
+
+    @abstractmethod
+    def add_pipeline_events(self, events: List[Dict[str, Any]]) -> int:
+        """
+        Append task events in a single transaction, returns the number of rows written.
+
+        Events carry `task_id`, `stage`, `event`, `occurred_at` (naive UTC datetime) and optionally `document_uuid`.
+        """
+
+    @abstractmethod
+    def list_pipeline_events(self, since: datetime, until: datetime) -> List[Dict[str, Any]]:
+        """Events that occurred in [since, until) ordered by time, with the customer of their document when it still exists."""
+
+    @abstractmethod
+    def list_document_pipeline_events(self, document_uuid: str) -> List[Dict[str, Any]]:
+        """Events of the tasks of one document ordered by time, shaped as list_pipeline_events() returns them."""
+
+    @abstractmethod
+    def list_running_tasks(self, document_uuid: str) -> List[str]:
+        """Ids of the tasks of a document enqueued or started and not finished, retried or failed since they were last started."""
+
+    @abstractmethod
+    def count_pipeline_events(self, since: datetime, until: datetime, event: str) -> int:
+        """Number of `event` events that occurred in [since, until)."""
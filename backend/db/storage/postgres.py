@@ -0,0 +1,430 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+import orjson
+
+from backend.db.schemas.artefacts_schemas import ARTEFACT_JSON_FIELDS
+from backend.db.storage.base import (ARTEFACT_INSERT_COLUMNS, InvalidJSONError,
+                                     Storage)
+
+logger = logging.getLogger(__name__)
+
+
+class PostgresStorage(Storage):
+    """PostgreSQL backend with a connection pool, JSONB columns, COPY bulk inserts and SKIP LOCKED claiming."""
+
+    name = "postgres"
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        # psycopg is only required when the PostgreSQL backend is selected
+        from psycopg.rows import dict_row
+        from psycopg.types.json import set_json_dumps, set_json_loads
+        from psycopg_pool import ConnectionPool
+
+        set_json_loads(orjson.loads)
+        set_json_dumps(lambda obj: orjson.dumps(obj).decode())
+        self.pool = ConnectionPool(
+            dsn,
+            min_size=min_size,
+            max_size=max_size,
+            kwargs={"row_factory": dict_row},
+            open=True,
+        )
+
+    def init_schema(self) -> None:
+        with self.pool.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    id BIGSERIAL PRIMARY KEY,
+                    uuid TEXT NOT NULL UNIQUE,
+                    customer_id TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    uploaded_at TIMESTAMP NOT NULL,
+                    analysis_status TEXT NOT NULL DEFAULT 'pending',
+                    analysis_started_at TIMESTAMP,
+                    analysis_completed_at TIMESTAMP,
+                    ai_output_language TEXT,
+                    ai_analysis_mode TEXT DEFAULT 'standard',
+                    ai_alert_status TEXT,
+                    ai_expires TIMESTAMP,
+                    ai_is_expired BOOLEAN,
+                    ai_category TEXT,
+                    ai_sub_category TEXT,
+                    ai_summary_short TEXT,
+                    ai_summary_long TEXT,
+                    ai_analysis_criteria TEXT,
+                    ai_features_and_insights JSONB,
+                    ai_alerts_and_actions JSONB,
+                    ai_eterny_legacy_schema JSONB,
+                    file_size BIGINT,
+                    hash_sha256 TEXT,
+                    document_raw_text TEXT,
+                    webhook_url TEXT,
+                    batch_id TEXT,
+                    estimated_tokens BIGINT,
+                    pipeline_checkpoint JSONB,
+                    pipeline_state JSONB,
+                    generation TEXT
+                )
+            """)
+            conn.execute("ALTER TABLE files ADD COLUMN IF NOT EXISTS batch_id TEXT")
+            conn.execute("ALTER TABLE files ADD COLUMN IF NOT EXISTS estimated_tokens BIGINT")
+            conn.execute("ALTER TABLE files ADD COLUMN IF NOT EXISTS pipeline_checkpoint JSONB")
+            conn.execute("ALTER TABLE files ADD COLUMN IF NOT EXISTS pipeline_state JSONB")
+            conn.execute("ALTER TABLE files ADD COLUMN IF NOT EXISTS generation TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_pending ON files (id) WHERE analysis_status = 'pending'")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_deferred ON files (id) WHERE analysis_status = 'deferred'")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_files_in_flight ON files (customer_id) WHERE analysis_status IN ('pending', 'processing')"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_batch_id ON files (batch_id) WHERE batch_id IS NOT NULL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id BIGSERIAL PRIMARY KEY,
+                    document_uuid TEXT NOT NULL,
+                    message_type TEXT NOT NULL CHECK(message_type IN ('question', 'answer')),
+                    content TEXT NOT NULL,
+                    created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_document_uuid ON messages (document_uuid)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS token_ledger (
+                    id BIGSERIAL PRIMARY KEY,
+                    document_uuid TEXT NOT NULL,
+                    customer_id TEXT,
+                    entry_type TEXT NOT NULL DEFAULT 'spent',
+                    tokens BIGINT NOT NULL,
+                    created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_token_ledger_document_uuid ON token_ledger (document_uuid)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash_sha256 TEXT PRIMARY KEY,
+                    size BIGINT NOT NULL,
+                    refcount INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+                    released_at TIMESTAMP
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs (released_at) WHERE refcount = 0")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pipeline_events (
+                    id BIGSERIAL PRIMARY KEY,
+                    task_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    event TEXT NOT NULL CHECK(event IN ('enqueued', 'started', 'finished', 'retried', 'failed')),
+                    document_uuid TEXT,
+                    occurred_at TIMESTAMP NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_events_occurred_at ON pipeline_events (occurred_at)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_pipeline_events_document_uuid ON pipeline_events (document_uuid) WHERE document_uuid IS NOT NULL"
+            )
+
+    def close(self) -> None:
+        self.pool.close()
+
+    # Artefacts
+
+    def get_artefact(self, uuid: str) -> Optional[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT * FROM files WHERE uuid = %s", (uuid,)).fetchone()
+
+    def get_artefacts(self, uuids: List[str]) -> List[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT * FROM files WHERE uuid = ANY(%s)", (list(uuids),)).fetchall()
+
+    def insert_artefact(self, record: Dict[str, Any]) -> None:
+        columns = [c for c in ARTEFACT_INSERT_COLUMNS if c in record]
+        with self.pool.connection() as conn:
+            conn.execute(
+                f"INSERT INTO files ({', '.join(columns)}) VALUES ({', '.join('%s' for _ in columns)})",
+                tuple(record[c] for c in columns)
+            )
+
+    def bulk_insert_artefacts(self, records: List[Dict[str, Any]], replace: bool = False) -> int:
+        if not records:
+            return 0
+        columns = [c for c in ARTEFACT_INSERT_COLUMNS if c in records[0]]
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                if replace:
+                    cur.execute("DELETE FROM files WHERE uuid = ANY(%s)", ([r["uuid"] for r in records],))
+                with cur.copy(f"COPY files ({', '.join(columns)}) FROM STDIN") as copy:
+                    for record in records:
+                        copy.write_row(tuple(record.get(c) for c in columns))
+        return len(records)
+
+    @staticmethod
+    def _assignments(data: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+        fields = []
+        values = []
+        for key, value in data.items():
+            placeholder = "%s"
+            if key in ARTEFACT_JSON_FIELDS:
+                if value in ("", None):
+                    value = None
+                else:
+                    # Pre-serialised strings are cast (and validated) by PostgreSQL
+                    placeholder = "%s::jsonb"
+                    if not isinstance(value, str):
+                        value = orjson.dumps(value).decode()
+            fields.append(f"{key} = {placeholder}")
+            values.append(value)
+        return fields, values
+
+    @staticmethod
+    def _where_current(uuid: str, generation: Optional[str]) -> Tuple[str, list]:
+        if generation is None:
+            return "uuid = %s", [uuid]
+        return "uuid = %s AND generation = %s", [uuid, generation]
+
+    def update_artefact(self, uuid: str, data: Dict[str, Any], generation: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        import psycopg
+
+        fields, values = self._assignments(data)
+        where, where_values = self._where_current(uuid, generation)
+
+        with self.pool.connection() as conn:
+            try:
+                return conn.execute(
+                    f"UPDATE files SET {', '.join(fields)} WHERE {where} RETURNING *",
+                    values + where_values
+                ).fetchone()
+            except psycopg.errors.InvalidTextRepresentation as e:
+                raise InvalidJSONError(str(e)) from e
+
+    def complete_pipeline_stage(
+        self, uuid: str, stage: str, tokens: int, data: Dict[str, Any], generation: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        import psycopg
+
+        fields, values = self._assignments(data)
+        # Concurrent completions wait on the row lock and build on each other's state
+        fields.append(
+            "pipeline_state = jsonb_set(COALESCE(pipeline_state, '{}'::jsonb) || "
+            "jsonb_build_object('completed', COALESCE(pipeline_state->'completed', '{}'::jsonb)), "
+            "ARRAY['completed', %s], to_jsonb(%s::bigint))"
+        )
+        values += [stage, tokens]
+        where, where_values = self._where_current(uuid, generation)
+
+        with self.pool.connection() as conn:
+            try:
+                return conn.execute(
+                    f"UPDATE files SET {', '.join(fields)} WHERE {where} RETURNING *",
+                    values + where_values
+                ).fetchone()
+            except psycopg.errors.InvalidTextRepresentation as e:
+                raise InvalidJSONError(str(e)) from e
+
+    def delete_artefact(self, uuid: str) -> None:
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM files WHERE uuid = %s", (uuid,))
+
+    def list_artefacts(self, limit: int = 10, offset: int = 0, analysis_status: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            if analysis_status:
+                return conn.execute(
+                    "SELECT * FROM files WHERE analysis_status = %s ORDER BY id LIMIT %s OFFSET %s",
+                    (analysis_status, limit, offset)
+                ).fetchall()
+            return conn.execute("SELECT * FROM files ORDER BY id LIMIT %s OFFSET %s", (limit, offset)).fetchall()
+
+    def count_artefacts_by_status(self, batch_id: str) -> Dict[str, int]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT analysis_status, COUNT(*) AS count FROM files WHERE batch_id = %s GROUP BY analysis_status",
+                (batch_id,)
+            ).fetchall()
+        return {row["analysis_status"]: row["count"] for row in rows}
+
+    def claim_pending_artefacts(self, limit: int = 10) -> List[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                """
+                UPDATE files SET analysis_status = 'processing', analysis_started_at = %s
+                WHERE id IN (
+                    SELECT id FROM files WHERE analysis_status = 'pending'
+                    ORDER BY id LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+                """,
+                (datetime.now(), limit)
+            ).fetchall()
+        return sorted(rows, key=lambda r: r["id"])
+
+    def claim_deferred_artefacts(self, limit: int = 10) -> List[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                """
+                UPDATE files SET analysis_status = 'pending'
+                WHERE id IN (
+                    SELECT id FROM files WHERE analysis_status = 'deferred'
+                    ORDER BY id LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+                """,
+                (limit,)
+            ).fetchall()
+        return sorted(rows, key=lambda r: r["id"])
+
+    def in_flight_totals(self, customer_id: Optional[str] = None, stalled_before: Optional[datetime] = None) -> Dict[str, int]:
+        query = """
+            SELECT COUNT(*) AS documents, COALESCE(SUM(estimated_tokens), 0) AS estimated_tokens
+            FROM files WHERE analysis_status IN ('pending', 'processing')
+        """
+        params = []
+        if stalled_before is not None:
+            query += " AND NOT (analysis_status = 'processing' AND analysis_started_at IS NOT NULL AND analysis_started_at < %s)"
+            params.append(stalled_before)
+        if customer_id is not None:
+            query += " AND customer_id = %s"
+            params.append(customer_id)
+        with self.pool.connection() as conn:
+            row = conn.execute(query, params).fetchone()
+        return {"documents": row["documents"], "estimated_tokens": int(row["estimated_tokens"])}
+
+    # RAG messages
+
+    def add_message(self, document_uuid: str, message_type: Literal["question", "answer"], content: str) -> Dict[str, Any]:
+        with self.pool.connection() as conn:
+            return conn.execute(
+                """
+                INSERT INTO messages (document_uuid, message_type, content) VALUES (%s, %s, %s)
+                RETURNING id, document_uuid, message_type, content, created_at
+                """,
+                (document_uuid, message_type, content)
+            ).fetchone()
+
+    def list_messages(self, document_uuid: str, order: Literal["asc", "desc"] = "desc") -> List[Dict[str, Any]]:
+        direction = "ASC" if order == "asc" else "DESC"
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT id, document_uuid, message_type, content, created_at "
+                f"FROM messages WHERE document_uuid = %s ORDER BY id {direction}",
+                (document_uuid,)
+            ).fetchall()
+
+    # Token ledger
+
+    def add_ledger_entry(self, document_uuid: str, tokens: int, entry_type: str = "spent") -> Dict[str, Any]:
+        with self.pool.connection() as conn:
+            return conn.execute(
+                """
+                INSERT INTO token_ledger (document_uuid, customer_id, entry_type, tokens)
+                VALUES (%s, (SELECT customer_id FROM files WHERE uuid = %s), %s, %s)
+                RETURNING *
+                """,
+                (document_uuid, document_uuid, entry_type, tokens)
+            ).fetchone()
+
+    def get_ledger_total(self, document_uuid: str, entry_type: str = "spent") -> int:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT COALESCE(SUM(tokens), 0) AS total FROM token_ledger WHERE document_uuid = %s AND entry_type = %s",
+                (document_uuid, entry_type)
+            ).fetchone()
+        return int(row["total"])
+
+    # Content-addressed blobs
+
+    def acquire_blob(self, hash_sha256: str, size: int) -> int:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                """
+                INSERT INTO blobs (hash_sha256, size, refcount) VALUES (%s, %s, 1)
+                ON CONFLICT (hash_sha256) DO UPDATE SET refcount = blobs.refcount + 1, released_at = NULL
+                RETURNING refcount
+                """,
+                (hash_sha256, size)
+            ).fetchone()
+        return row["refcount"]
+
+    def release_blob(self, hash_sha256: str) -> Optional[int]:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                """
+                UPDATE blobs SET
+                    refcount = GREATEST(refcount - 1, 0),
+                    released_at = CASE WHEN refcount <= 1 THEN %s ELSE released_at END
+                WHERE hash_sha256 = %s
+                RETURNING refcount
+                """,
+                (datetime.utcnow(), hash_sha256)
+            ).fetchone()
+        return row["refcount"] if row else None
+
+    def list_unreferenced_blobs(self, released_before: datetime, limit: int = 1000) -> List[str]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT hash_sha256 FROM blobs WHERE refcount = 0 AND released_at < %s ORDER BY released_at LIMIT %s",
+                (released_before, limit)
+            ).fetchall()
+        return [row["hash_sha256"] for row in rows]
+
+    def delete_unreferenced_blob(self, hash_sha256: str) -> bool:
+        with self.pool.connection() as conn:
+            cursor = conn.execute("DELETE FROM blobs WHERE hash_sha256 = %s AND refcount = 0", (hash_sha256,))
+            return cursor.rowcount > 0
+
+    # Pipeline events
+
+    def add_pipeline_events(self, events: List[Dict[str, Any]]) -> int:
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    "INSERT INTO pipeline_events (task_id, stage, event, document_uuid, occurred_at) VALUES (%s, %s, %s, %s, %s)",
+                    [(e["task_id"], e["stage"], e["event"], e.get("document_uuid"), e["occurred_at"]) for e in events]
+                )
+        return len(events)
+
+    def list_pipeline_events(self, since: datetime, until: datetime) -> List[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            return conn.execute(
+                """
+                SELECT e.task_id, e.stage, e.event, e.document_uuid, e.occurred_at, f.customer_id
+                FROM pipeline_events e LEFT JOIN files f ON f.uuid = e.document_uuid
+                WHERE e.occurred_at >= %s AND e.occurred_at < %s
+                ORDER BY e.occurred_at, e.id
+                """,
+                (since, until)
+            ).fetchall()
+
+    def list_document_pipeline_events(self, document_uuid: str) -> List[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            return conn.execute(
+                """
+                SELECT e.task_id, e.stage, e.event, e.document_uuid, e.occurred_at, f.customer_id
+                FROM pipeline_events e LEFT JOIN files f ON f.uuid = e.document_uuid
+                WHERE e.document_uuid = %s
+                ORDER BY e.occurred_at, e.id
+                """,
+                (document_uuid,)
+            ).fetchall()
+
+    def list_running_tasks(self, document_uuid: str) -> List[str]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT task_id FROM pipeline_events WHERE document_uuid = %s
+                GROUP BY task_id
+                HAVING MAX(occurred_at) FILTER (WHERE event IN ('finished', 'retried', 'failed')) IS NULL
+                    OR MAX(occurred_at) FILTER (WHERE event = 'started') > MAX(occurred_at) FILTER (WHERE event IN ('finished', 'retried', 'failed'))
+                """,
+                (document_uuid,)
+            ).fetchall()
+        return [row["task_id"] for row in rows]
+
+    def count_pipeline_events(self, since: datetime, until: datetime, event: str) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) AS count FROM pipeline_events WHERE occurred_at >= %s AND occurred_at < %s AND event = %s",
+                (since, until, event)
+            ).fetchone()["count"]
@@ -0,0 +1,462 @@
+import logging
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+import orjson
+
+from backend.db.schemas.artefacts_schemas import ARTEFACT_JSON_FIELDS
+from backend.db.storage.base import (ARTEFACT_INSERT_COLUMNS, InvalidJSONError,
+                                     Storage)
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStorage(Storage):
+    """SQLite backend, JSON columns are TEXT validated and minified by JSON1."""
+
+    name = "sqlite"
+
+    MAX_PARAMETERS = 500
+
+    def __init__(self, db_path: str, busy_timeout: float = 30.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per operation; WAL + busy timeout lets concurrent writers queue instead of failing
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous = NORMAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _decode(row) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        record = dict(row)
+        for key in ARTEFACT_JSON_FIELDS:
+            value = record.get(key)
+            if isinstance(value, str) and value:
+                try:
+                    record[key] = orjson.loads(value)
+                except orjson.JSONDecodeError:
+                    logger.warning(f"Field {key} could not be JSON decoded, setting to None")
+                    record[key] = None
+        return record
+
+    def init_schema(self) -> None:
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    uuid TEXT NOT NULL UNIQUE,
+                    customer_id TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    uploaded_at TEXT NOT NULL,
+                    analysis_status TEXT NOT NULL DEFAULT 'pending',
+                    analysis_started_at TEXT,
+                    analysis_completed_at TEXT,
+                    ai_output_language TEXT,
+                    ai_analysis_mode TEXT DEFAULT 'standard',
+                    ai_alert_status TEXT,
+                    ai_expires TEXT,
+                    ai_is_expired INTEGER,
+                    ai_category TEXT,
+                    ai_sub_category TEXT,
+                    ai_summary_short TEXT,
+                    ai_summary_long TEXT,
+                    ai_analysis_criteria TEXT,
+                    ai_features_and_insights TEXT CHECK (ai_features_and_insights IS NULL OR json_valid(ai_features_and_insights)),
+                    ai_alerts_and_actions TEXT CHECK (ai_alerts_and_actions IS NULL OR json_valid(ai_alerts_and_actions)),
+                    ai_eterny_legacy_schema TEXT CHECK (ai_eterny_legacy_schema IS NULL OR json_valid(ai_eterny_legacy_schema)),
+                    file_size INTEGER,
+                    hash_sha256 TEXT,
+                    document_raw_text TEXT,
+                    webhook_url TEXT,
+                    batch_id TEXT,
+                    estimated_tokens INTEGER,
+                    pipeline_checkpoint TEXT CHECK (pipeline_checkpoint IS NULL OR json_valid(pipeline_checkpoint)),
+                    pipeline_state TEXT CHECK (pipeline_state IS NULL OR json_valid(pipeline_state)),
+                    generation TEXT
+                )
+            """)
+            self._ensure_column(conn, "files", "batch_id", "TEXT")
+            self._ensure_column(conn, "files", "estimated_tokens", "INTEGER")
+            self._ensure_column(conn, "files", "pipeline_checkpoint", "TEXT CHECK (pipeline_checkpoint IS NULL OR json_valid(pipeline_checkpoint))")
+            self._ensure_column(conn, "files", "pipeline_state", "TEXT CHECK (pipeline_state IS NULL OR json_valid(pipeline_state))")
+            self._ensure_column(conn, "files", "generation", "TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_analysis_status ON files (analysis_status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_batch_id ON files (batch_id) WHERE batch_id IS NOT NULL")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_files_in_flight ON files (customer_id) WHERE analysis_status IN ('pending', 'processing')"
+            )
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    document_uuid TEXT NOT NULL,
+                    message_type TEXT NOT NULL CHECK(message_type IN ('question', 'answer')),
+                    content TEXT NOT NULL,
+                    created_at DATETIME NOT NULL DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')),
+                    FOREIGN KEY (document_uuid) REFERENCES files(uuid) ON DELETE CASCADE
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_document_uuid ON messages (document_uuid)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS token_ledger (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    document_uuid TEXT NOT NULL,
+                    customer_id TEXT,
+                    entry_type TEXT NOT NULL DEFAULT 'spent',
+                    tokens INTEGER NOT NULL,
+                    created_at DATETIME NOT NULL DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'))
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_token_ledger_document_uuid ON token_ledger (document_uuid)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash_sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    refcount INTEGER NOT NULL DEFAULT 0,
+                    created_at DATETIME NOT NULL DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')),
+                    released_at TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs (released_at) WHERE refcount = 0")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pipeline_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    event TEXT NOT NULL CHECK(event IN ('enqueued', 'started', 'finished', 'retried', 'failed')),
+                    document_uuid TEXT,
+                    occurred_at TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_events_occurred_at ON pipeline_events (occurred_at)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_pipeline_events_document_uuid ON pipeline_events (document_uuid) WHERE document_uuid IS NOT NULL"
+            )
+            conn.commit()
+
+    @staticmethod
+    def _ensure_column(conn, table: str, column: str, definition: str) -> None:
+        # Databases created before the column existed are migrated in place
+        columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            logger.info(f"Adding column {table}.{column}")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def close(self) -> None:
+        pass
+
+    # Artefacts
+
+    def get_artefact(self, uuid: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM files WHERE uuid = ?", (uuid,)).fetchone()
+        return self._decode(row)
+
+    def get_artefacts(self, uuids: List[str]) -> List[Dict[str, Any]]:
+        rows = []
+        with self._connect() as conn:
+            # Chunked to stay below SQLite's bound parameter limit
+            for start in range(0, len(uuids), self.MAX_PARAMETERS):
+                chunk = uuids[start:start + self.MAX_PARAMETERS]
+                rows += conn.execute(
+                    f"SELECT * FROM files WHERE uuid IN ({', '.join('?' for _ in chunk)})", chunk
+                ).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def insert_artefact(self, record: Dict[str, Any]) -> None:
+        self.bulk_insert_artefacts([record])
+
+    def bulk_insert_artefacts(self, records: List[Dict[str, Any]], replace: bool = False) -> int:
+        if not records:
+            return 0
+        columns = [c for c in ARTEFACT_INSERT_COLUMNS if c in records[0]]
+        query = f"INSERT INTO files ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        with self._connect() as conn:
+            with conn:
+                if replace:
+                    conn.executemany("DELETE FROM files WHERE uuid = ?", [(r["uuid"],) for r in records])
+                conn.executemany(query, [tuple(r.get(c) for c in columns) for r in records])
+        return len(records)
+
+    @staticmethod
+    def _assignments(data: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+        fields = []
+        values = []
+        for key, value in data.items():
+            placeholder = "?"
+            if key in ARTEFACT_JSON_FIELDS:
+                # Accept both native JSON and pre-serialised strings, let JSON1 validate and minify
+                if value in ("", None):
+                    value = None
+                else:
+                    placeholder = "json(?)"
+                    if not isinstance(value, str):
+                        value = orjson.dumps(value).decode()
+            fields.append(f"{key} = {placeholder}")
+            values.append(value)
+        return fields, values
+
+    @staticmethod
+    def _where_current(uuid: str, generation: Optional[str]) -> Tuple[str, list]:
+        if generation is None:
+            return "uuid = ?", [uuid]
+        return "uuid = ? AND generation = ?", [uuid, generation]
+
+    def update_artefact(self, uuid: str, data: Dict[str, Any], generation: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        fields, values = self._assignments(data)
+        where, where_values = self._where_current(uuid, generation)
+
+        with self._connect() as conn:
+            try:
+                row = conn.execute(f"UPDATE files SET {', '.join(fields)} WHERE {where} RETURNING *", values + where_values).fetchone()
+            except sqlite3.OperationalError as e:
+                if "JSON" not in str(e):
+                    raise
+                raise InvalidJSONError(str(e)) from e
+            conn.commit()
+        return self._decode(row)
+
+    def complete_pipeline_stage(
+        self, uuid: str, stage: str, tokens: int, data: Dict[str, Any], generation: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        fields, values = self._assignments(data)
+        fields.append("pipeline_state = json_set(COALESCE(pipeline_state, '{}'), ?, ?)")
+        values += [f'$.completed."{stage}"', tokens]
+        where, where_values = self._where_current(uuid, generation)
+
+        with self._connect() as conn:
+            try:
+                # RETURNING reads the row inside the update, before another completion can change it
+                row = conn.execute(f"UPDATE files SET {', '.join(fields)} WHERE {where} RETURNING *", values + where_values).fetchone()
+            except sqlite3.OperationalError as e:
+                if "JSON" not in str(e):
+                    raise
+                raise InvalidJSONError(str(e)) from e
+            conn.commit()
+        return self._decode(row)
+
+    def delete_artefact(self, uuid: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM files WHERE uuid = ?", (uuid,))
+            conn.commit()
+
+    def list_artefacts(self, limit: int = 10, offset: int = 0, analysis_status: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            if analysis_status:
+                rows = conn.execute(
+                    "SELECT * FROM files WHERE analysis_status = ? ORDER BY id LIMIT ? OFFSET ?",
+                    (analysis_status, limit, offset)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM files ORDER BY id LIMIT ? OFFSET ?", (limit, offset)).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def count_artefacts_by_status(self, batch_id: str) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT analysis_status, COUNT(*) FROM files WHERE batch_id = ? GROUP BY analysis_status",
+                (batch_id,)
+            ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def claim_pending_artefacts(self, limit: int = 10) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE takes the write lock up front so two claimers cannot select the same rows
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                """
+                UPDATE files SET analysis_status = 'processing', analysis_started_at = ?
+                WHERE id IN (SELECT id FROM files WHERE analysis_status = 'pending' ORDER BY id LIMIT ?)
+                RETURNING *
+                """,
+                (datetime.now().isoformat(), limit)
+            ).fetchall()
+            conn.commit()
+        return sorted((self._decode(row) for row in rows), key=lambda r: r["id"])
+
+    def claim_deferred_artefacts(self, limit: int = 10) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                """
+                UPDATE files SET analysis_status = 'pending'
+                WHERE id IN (SELECT id FROM files WHERE analysis_status = 'deferred' ORDER BY id LIMIT ?)
+                RETURNING *
+                """,
+                (limit,)
+            ).fetchall()
+            conn.commit()
+        return sorted((self._decode(row) for row in rows), key=lambda r: r["id"])
+
+    def in_flight_totals(self, customer_id: Optional[str] = None, stalled_before: Optional[datetime] = None) -> Dict[str, int]:
+        query = "SELECT COUNT(*), COALESCE(SUM(estimated_tokens), 0) FROM files WHERE analysis_status IN ('pending', 'processing')"
+        params = []
+        if stalled_before is not None:
+            query += " AND NOT (analysis_status = 'processing' AND analysis_started_at IS NOT NULL AND analysis_started_at < ?)"
+            params.append(stalled_before.isoformat())
+        if customer_id is not None:
+            query += " AND customer_id = ?"
+            params.append(customer_id)
+        with self._connect() as conn:
+            row = conn.execute(query, params).fetchone()
+        return {"documents": row[0], "estimated_tokens": row[1]}
+
+    # RAG messages
+
+    def add_message(self, document_uuid: str, message_type: Literal["question", "answer"], content: str) -> Dict[str, Any]:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO messages (document_uuid, message_type, content) VALUES (?, ?, ?)",
+                (document_uuid, message_type, content)
+            )
+            conn.commit()
+            row = conn.execute(
+                "SELECT id, document_uuid, message_type, content, created_at FROM messages WHERE id = ?",
+                (cursor.lastrowid,)
+            ).fetchone()
+        return dict(row)
+
+    def list_messages(self, document_uuid: str, order: Literal["asc", "desc"] = "desc") -> List[Dict[str, Any]]:
+        direction = "ASC" if order == "asc" else "DESC"
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, document_uuid, message_type, content, created_at "
+                f"FROM messages WHERE document_uuid = ? ORDER BY id {direction}",
+                (document_uuid,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    # Token ledger
+
+    def add_ledger_entry(self, document_uuid: str, tokens: int, entry_type: str = "spent") -> Dict[str, Any]:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO token_ledger (document_uuid, customer_id, entry_type, tokens)
+                VALUES (?, (SELECT customer_id FROM files WHERE uuid = ?), ?, ?)
+                """,
+                (document_uuid, document_uuid, entry_type, tokens)
+            )
+            conn.commit()
+            row = conn.execute("SELECT * FROM token_ledger WHERE id = ?", (cursor.lastrowid,)).fetchone()
+        return dict(row)
+
+    def get_ledger_total(self, document_uuid: str, entry_type: str = "spent") -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COALESCE(SUM(tokens), 0) FROM token_ledger WHERE document_uuid = ? AND entry_type = ?",
+                (document_uuid, entry_type)
+            ).fetchone()
+        return row[0]
+
+    # Content-addressed blobs
+
+    def acquire_blob(self, hash_sha256: str, size: int) -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                INSERT INTO blobs (hash_sha256, size, refcount) VALUES (?, ?, 1)
+                ON CONFLICT (hash_sha256) DO UPDATE SET refcount = refcount + 1, released_at = NULL
+                RETURNING refcount
+                """,
+                (hash_sha256, size)
+            ).fetchone()
+            conn.commit()
+        return row[0]
+
+    def release_blob(self, hash_sha256: str) -> Optional[int]:
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                UPDATE blobs SET
+                    refcount = MAX(refcount - 1, 0),
+                    released_at = CASE WHEN refcount <= 1 THEN ? ELSE released_at END
+                WHERE hash_sha256 = ?
+                RETURNING refcount
+                """,
+                (datetime.utcnow().isoformat(), hash_sha256)
+            ).fetchone()
+            conn.commit()
+        return row[0] if row else None
+
+    def list_unreferenced_blobs(self, released_before: datetime, limit: int = 1000) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT hash_sha256 FROM blobs WHERE refcount = 0 AND released_at < ? ORDER BY released_at LIMIT ?",
+                (released_before.isoformat(), limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def delete_unreferenced_blob(self, hash_sha256: str) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute("DELETE FROM blobs WHERE hash_sha256 = ? AND refcount = 0", (hash_sha256,))
+            conn.commit()
+        return cursor.rowcount > 0
+
+    # Pipeline events
+
+    def add_pipeline_events(self, events: List[Dict[str, Any]]) -> int:
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO pipeline_events (task_id, stage, event, document_uuid, occurred_at) VALUES (?, ?, ?, ?, ?)",
+                [(e["task_id"], e["stage"], e["event"], e.get("document_uuid"), e["occurred_at"].isoformat()) for e in events]
+            )
+            conn.commit()
+        return len(events)
+
+    def list_pipeline_events(self, since: datetime, until: datetime) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT e.task_id, e.stage, e.event, e.document_uuid, e.occurred_at, f.customer_id
+                FROM pipeline_events e LEFT JOIN files f ON f.uuid = e.document_uuid
+                WHERE e.occurred_at >= ? AND e.occurred_at < ?
+                ORDER BY e.occurred_at, e.id
+                """,
+                (since.isoformat(), until.isoformat())
+            ).fetchall()
+        return [{**dict(row), "occurred_at": datetime.fromisoformat(row["occurred_at"])} for row in rows]
+
+    def list_document_pipeline_events(self, document_uuid: str) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT e.task_id, e.stage, e.event, e.document_uuid, e.occurred_at, f.customer_id
+                FROM pipeline_events e LEFT JOIN files f ON f.uuid = e.document_uuid
+                WHERE e.document_uuid = ?
+                ORDER BY e.occurred_at, e.id
+                """,
+                (document_uuid,)
+            ).fetchall()
+        return [{**dict(row), "occurred_at": datetime.fromisoformat(row["occurred_at"])} for row in rows]
+
+    def list_running_tasks(self, document_uuid: str) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT task_id FROM pipeline_events WHERE document_uuid = ?
+                GROUP BY task_id
+                HAVING MAX(CASE WHEN event IN ('finished', 'retried', 'failed') THEN occurred_at END) IS NULL
+                    OR MAX(CASE WHEN event = 'started' THEN occurred_at END) > MAX(CASE WHEN event IN ('finished', 'retried', 'failed') THEN occurred_at END)
+                """,
+                (document_uuid,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count_pipeline_events(self, since: datetime, until: datetime, event: str) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM pipeline_events WHERE occurred_at >= ? AND occurred_at < ? AND event = ?",
+                (since.isoformat(), until.isoformat(), event)
+            ).fetchone()[0]
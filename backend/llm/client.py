@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from backend import config
+from backend.core import metrics
+from backend.llm.hedging import Hedger
+from backend.llm.pool import Endpoint, EndpointPool
+from backend.llm.providers import create_provider
+from backend.llm.stage import completion_stage, current_stage, set_stage
+from backend.utils.text_compaction import count_tokens
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["LLMClient", "completion_stage"]
+
+
+class LLMClient:
+    """
+    Drop-in for the OpenAI client's `chat.completions.create`, with hedged requests to the LLM_PROVIDER.
+
+    Completions run on a background event loop of this process with the async clients, so the request
+    that loses a hedge can be cancelled instead of running to completion in a blocked thread. Streaming
+    completions go straight to a sync client. The provider is created lazily and again after a fork,
+    Celery prefork children never share the parent's connections or endpoint health.
+    """
+
+    def __init__(self, sync_client=None, async_client=None):
+        self._sync_client = sync_client
+        self._async_client = async_client
+        self._injected = sync_client is not None or async_client is not None
+        self.provider = None
+        self._pid = None
+        self._loop = None
+        self._lock = threading.Lock()
+        self.hedger = Hedger()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _ensure_process(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._injected:
+                self.provider = EndpointPool([Endpoint("injected", sync_client=self._sync_client, async_client=self._async_client)])
+            else:
+                self.provider = create_provider()
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name="llm-client", daemon=True).start()
+            self.hedger = Hedger()
+            self._pid = os.getpid()
+
+    def create(self, **kwargs):
+        self._ensure_process()
+        if kwargs.get("stream"):
+            return self.provider.create(**kwargs)
+        future = asyncio.run_coroutine_threadsafe(self.acreate(stage=current_stage(), **kwargs), self._loop)
+        return future.result()
+
+    async def acreate(self, stage: str = None, **kwargs):
+        # Requests of the hedge run in tasks copying this context, the endpoint pool reads the prompt from it
+        set_stage(stage)
+        model = kwargs["model"]
+        hedge_kwargs = {**kwargs, "model": config.HEDGE_DEPLOYMENTS.get(model, model)}
+        hedge_tokens = sum(count_tokens(message["content"]) for message in kwargs.get("messages", []))
+        # Endpoints the primary request used, its hedge goes to another one when the provider has it
+        used = set()
+        start = time.perf_counter()
+        try:
+            response = await self.hedger.run(
+                (stage or "completion", model),
+                lambda: self.provider.acreate(avoid=used, **kwargs),
+                lambda: self.provider.acreate(avoid=used, **hedge_kwargs),
+                hedge_tokens=hedge_tokens,
+                completion_tokens=kwargs.get("max_tokens", kwargs.get("max_completion_tokens")),
+            )
+        except BaseException:
+            metrics.observe_completion(stage, model, time.perf_counter() - start, failed=True)
+            raise
+        metrics.observe_completion(stage, model, time.perf_counter() - start, usage=getattr(response, "usage", None))
+        return response
+
+    def stats(self) -> dict:
+        """Provider, endpoint health and hedging counters of this process."""
+        self._ensure_process()
+        return {"provider": self.provider.name, "endpoints": self.provider.stats(), "hedging": self.hedger.budget.stats()}
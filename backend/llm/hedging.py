@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Optional
+
+from backend import config
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Rolling completion latencies per (prompt, model), in this process."""
+
+    def __init__(self, window: int, min_samples: int):
+        self.min_samples = min_samples
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, key: tuple, seconds: float) -> None:
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def percentile(self, key: tuple, q: float) -> Optional[float]:
+        """The q-th percentile of the window, None until `min_samples` latencies are recorded."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(int(len(samples) * q / 100), len(samples) - 1)]
+
+
+class HedgeBudget:
+    """
+    Extra tokens spent on hedges, capped at `ratio` of the tokens of all primary requests.
+
+    `burst_tokens` lets the first hedges of a fresh process through before much primary traffic is counted.
+    """
+
+    def __init__(self, ratio: float, burst_tokens: int):
+        self.ratio = ratio
+        self.burst_tokens = burst_tokens
+        self.primary_tokens = 0
+        self.hedge_tokens = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def record_primary(self, tokens: int) -> None:
+        with self._lock:
+            self.primary_tokens += tokens
+
+    def try_spend(self, tokens: int) -> bool:
+        with self._lock:
+            if self.hedge_tokens + tokens > self.primary_tokens * self.ratio + self.burst_tokens:
+                self.denied += 1
+                return False
+            self.hedge_tokens += tokens
+            self.hedges += 1
+            return True
+
+    def charge(self, tokens: int) -> None:
+        """Count tokens of a hedge that are only known once it is decided, the completion of the losing request."""
+        with self._lock:
+            self.hedge_tokens += tokens
+
+    def record_win(self) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "denied": self.denied,
+                "hedge_tokens": self.hedge_tokens,
+                "primary_tokens": self.primary_tokens,
+            }
+
+
+async def hedged(
+    primary: Callable[[], Awaitable],
+    hedge: Callable[[], Awaitable],
+    delay: Optional[float],
+    budget: HedgeBudget,
+    hedge_tokens: int,
+    completion_tokens: Optional[int] = None,
+    label: str = "completion",
+):
+    """
+    Await `primary()`, start `hedge()` as well once it has run `delay` seconds and the budget allows.
+
+    The first successful response wins and the other request is cancelled, which closes its connection.
+    When one of them fails the other one is still awaited. `hedge_tokens` (the prompt) is charged to the budget
+    when the hedge is sent, the completion of the losing request once it is decided: its usage when it finished,
+    `completion_tokens` (max_tokens) or else the winner's completion tokens when it was cancelled.
+    """
+    primary_task = asyncio.ensure_future(primary())
+    if delay is None:
+        return await primary_task
+
+    done, _ = await asyncio.wait({primary_task}, timeout=delay)
+    if done or not budget.try_spend(hedge_tokens):
+        return await primary_task
+
+    logger.warning(f"{label} still running after {delay:.1f}s, sending a hedged request")
+    hedge_task = asyncio.ensure_future(hedge())
+    pending = {primary_task, hedge_task}
+    winner = None
+    try:
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Both may finish in the same round, a success wins over the other's failure
+            succeeded = [task for task in done if task.exception() is None]
+            if succeeded:
+                winner = primary_task if primary_task in succeeded else hedge_task
+                if winner is hedge_task:
+                    budget.record_win()
+                logger.info(f"{label}: {'hedged' if winner is hedge_task else 'primary'} request won")
+                return winner.result()
+            for task in done:
+                logger.warning(f"{label}: {'hedged' if task is hedge_task else 'primary'} request failed: {task.exception()}")
+            if not pending:
+                raise primary_task.exception() if primary_task in done else hedge_task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+        if winner is not None:
+            loser = hedge_task if winner is primary_task else primary_task
+            budget.charge(_wasted_completion_tokens(loser, loser in pending, winner, completion_tokens))
+
+
+def _usage_completion_tokens(task: asyncio.Future) -> int:
+    usage = getattr(task.result(), "usage", None)
+    return getattr(usage, "completion_tokens", None) or 0
+
+
+def _wasted_completion_tokens(loser: asyncio.Future, cancelled: bool, winner: asyncio.Future, completion_tokens: Optional[int]) -> int:
+    if not cancelled:
+        # A failed request produced no completion
+        return 0 if loser.exception() is not None else _usage_completion_tokens(loser)
+    return completion_tokens if completion_tokens is not None else _usage_completion_tokens(winner)
+
+
+class Hedger:
+    """Hedging policy of this process: rolling latencies, the percentile to hedge at and the token budget."""
+
+    def __init__(self):
+        self.tracker = LatencyTracker(config.HEDGE_WINDOW, config.HEDGE_MIN_SAMPLES)
+        self.budget = HedgeBudget(config.HEDGE_BUDGET_RATIO, config.HEDGE_BURST_TOKENS)
+
+    async def run(self, key: tuple, primary: Callable[[], Awaitable], hedge: Callable[[], Awaitable], hedge_tokens: int,
+                  completion_tokens: Optional[int] = None):
+        """Run a completion keyed by (prompt, model), hedged past the rolling HEDGE_PERCENTILE latency."""
+        delay = self.tracker.percentile(key, config.HEDGE_PERCENTILE) if config.HEDGE_ENABLED else None
+        if delay is not None:
+            delay = max(delay, config.HEDGE_MIN_DELAY)
+
+        async def timed_primary():
+            # Only the primary's latency is tracked, a won hedge would pull the percentile down to hedge ever earlier.
+            # A cancelled primary counts with its elapsed time, a lower bound of its latency.
+            start = time.perf_counter()
+            try:
+                response = await primary()
+            except asyncio.CancelledError:
+                self.tracker.record(key, time.perf_counter() - start)
+                raise
+            self.tracker.record(key, time.perf_counter() - start)
+            return response
+
+        response = await hedged(timed_primary, hedge, delay, self.budget, hedge_tokens, completion_tokens, label=f"{key[0]} on {key[1]}")
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.budget.record_primary(usage.total_tokens)
+        return response
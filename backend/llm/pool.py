@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+import openai
+from openai import AsyncAzureOpenAI, AzureOpenAI
+
+from backend import config
+from backend.core import metrics
+from backend.llm.providers.base import Provider
+from backend.llm.stage import current_stage
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest latency in an endpoint's moving average
+LATENCY_EWMA_ALPHA = 0.2
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """Errors that say the endpoint is unhealthy (throttling, server errors, timeouts), not that the request is wrong."""
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class Endpoint:
+    """One Azure OpenAI resource of the pool, its clients and its health in this process."""
+
+    def __init__(self, name: str, weight: float = 1, deployments: dict = None, sync_client=None, async_client=None):
+        self.name = name
+        self.weight = weight
+        self.deployments = deployments or {}
+        self.sync_client = sync_client
+        self.async_client = async_client
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency = None
+        self.outcomes = deque(maxlen=config.LLM_POOL_WINDOW)
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.probing = False
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> "Endpoint":
+        """An endpoint of LLM_ENDPOINTS, SDK retries are off so failed requests move to another endpoint instead."""
+        options = dict(
+            azure_endpoint=settings["endpoint"],
+            api_key=settings.get("api_key", config.AZURE_OPENAI_API_KEY),
+            api_version=settings.get("api_version", config.OPENAI_API_VERSION),
+            timeout=config.LLM_REQUEST_TIMEOUT,
+            max_retries=0,
+        )
+        return cls(
+            settings.get("name", settings["endpoint"]),
+            weight=float(settings.get("weight", 1)),
+            deployments=settings.get("deployments"),
+            sync_client=AzureOpenAI(**options),
+            async_client=AsyncAzureOpenAI(**options),
+        )
+
+    def request_kwargs(self, kwargs: dict) -> dict:
+        """The completion arguments with the model replaced by this endpoint's deployment of it."""
+        return {**kwargs, "model": self.deployments.get(kwargs["model"], kwargs["model"])}
+
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def stats(self, now: float) -> dict:
+        return {
+            "name": self.name,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "error_rate": round(self.error_rate(), 3),
+            "latency_ms": round(self.latency * 1000) if self.latency is not None else None,
+            "ejected": self.ejected_until > now,
+            "ejections": self.ejections,
+        }
+
+
+class EndpointPool(Provider):
+    """
+    Endpoints that serve the same deployments, picked by weighted least outstanding requests.
+
+    A slow endpoint holds more requests open and gets fewer new ones, the moving average latency breaks
+    ties. Endpoints whose rolling error rate reaches LLM_POOL_EJECT_ERROR_RATE, or that fail
+    LLM_POOL_EJECT_CONSECUTIVE times in a row, are ejected for LLM_POOL_EJECT_SECONDS, doubling on every
+    ejection in a row up to LLM_POOL_MAX_EJECT_SECONDS. Afterwards a single probe request decides whether
+    the endpoint is re-admitted. When every endpoint is ejected the one back soonest is used anyway.
+    """
+
+    name = "azure"
+
+    def __init__(self, endpoints: List[Endpoint]):
+        self.endpoints = endpoints
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> "EndpointPool":
+        """The endpoints of LLM_ENDPOINTS, or the single AZURE_OPENAI_ENDPOINT."""
+        settings = config.LLM_ENDPOINTS or [{"name": "default", "endpoint": config.AZURE_OPENAI_ENDPOINT}]
+        return cls([Endpoint.from_settings(endpoint) for endpoint in settings])
+
+    def acquire(self, avoid: set = frozenset()) -> tuple:
+        """
+        Reserve the endpoint for the next request, preferring ones not in `avoid`.
+
+        Returns the endpoint and whether the request is the probe that decides its re-admission.
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = [endpoint for endpoint in self.endpoints if endpoint.ejected_until <= now and not endpoint.probing]
+            if available:
+                preferred = [endpoint for endpoint in available if endpoint.name not in avoid] or available
+                endpoint = min(preferred, key=lambda e: ((e.outstanding + 1) / e.weight, e.latency or 0.0))
+            else:
+                endpoint = min(self.endpoints, key=lambda e: e.ejected_until)
+                logger.warning(f"All LLM endpoints are ejected, using {endpoint.name}")
+            probe = bool(endpoint.ejections) and endpoint.ejected_until <= now and not endpoint.probing
+            endpoint.probing = endpoint.probing or probe
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint, probe
+
+    def release(self, endpoint: Endpoint, probe: bool, seconds: Optional[float] = None, failed: bool = False) -> None:
+        """
+        Record how a request of `acquire` ended: `failed` on an endpoint failure, its latency on success.
+
+        Neither for cancelled requests and client errors, which say nothing about the endpoint.
+        """
+        now = time.monotonic()
+        with self._lock:
+            endpoint.outstanding -= 1
+            if probe:
+                endpoint.probing = False
+            if failed:
+                endpoint.failures += 1
+                if endpoint.ejected_until > now and not probe:
+                    # Sent before the endpoint was ejected
+                    return
+                endpoint.outcomes.append(True)
+                endpoint.consecutive_failures += 1
+                if probe or endpoint.consecutive_failures >= config.LLM_POOL_EJECT_CONSECUTIVE or (
+                    len(endpoint.outcomes) >= config.LLM_POOL_MIN_REQUESTS and endpoint.error_rate() >= config.LLM_POOL_EJECT_ERROR_RATE
+                ):
+                    self._eject(endpoint, now)
+            elif seconds is not None:
+                endpoint.outcomes.append(False)
+                endpoint.consecutive_failures = 0
+                endpoint.latency = seconds if endpoint.latency is None else (
+                    LATENCY_EWMA_ALPHA * seconds + (1 - LATENCY_EWMA_ALPHA) * endpoint.latency
+                )
+                if probe:
+                    logger.info(f"LLM endpoint {endpoint.name} re-admitted after {endpoint.ejections} ejection(s)")
+                    endpoint.ejections = 0
+                    endpoint.outcomes.clear()
+
+    def _eject(self, endpoint: Endpoint, now: float) -> None:
+        endpoint.ejections += 1
+        seconds = min(config.LLM_POOL_EJECT_SECONDS * 2 ** (endpoint.ejections - 1), config.LLM_POOL_MAX_EJECT_SECONDS)
+        endpoint.ejected_until = now + seconds
+        endpoint.outcomes.clear()
+        endpoint.consecutive_failures = 0
+        logger.warning(f"LLM endpoint {endpoint.name} ejected for {seconds:.0f}s")
+
+    async def acreate(self, avoid: set = None, **kwargs):
+        """
+        Async chat completion on the best endpoint, moved to another one on endpoint failures.
+
+        Endpoints used are added to `avoid`, a hedge of the same completion passes the set along to land elsewhere.
+        """
+        avoid = set() if avoid is None else avoid
+        tried = set()
+        for attempt in range(config.LLM_POOL_MAX_ATTEMPTS):
+            endpoint, probe = self.acquire(avoid | tried)
+            if endpoint.name in tried:
+                await asyncio.sleep(config.LLM_POOL_RETRY_BACKOFF * 2 ** (attempt - 1))
+            tried.add(endpoint.name)
+            avoid.add(endpoint.name)
+            start = time.perf_counter()
+            try:
+                response = await endpoint.async_client.chat.completions.create(**endpoint.request_kwargs(kwargs))
+            except BaseException as error:
+                failed = is_endpoint_failure(error)
+                self.release(endpoint, probe, failed=failed)
+                metrics.observe_endpoint_error(current_stage(), kwargs["model"], endpoint.name, error)
+                if not failed or attempt == config.LLM_POOL_MAX_ATTEMPTS - 1:
+                    raise
+                logger.warning(f"LLM endpoint {endpoint.name} failed: {error}, retrying")
+                continue
+            self.release(endpoint, probe, time.perf_counter() - start)
+            return response
+
+    def create(self, **kwargs):
+        """Sync chat completion, used for streams, latency up to the response headers."""
+        tried = set()
+        for attempt in range(config.LLM_POOL_MAX_ATTEMPTS):
+            endpoint, probe = self.acquire(tried)
+            if endpoint.name in tried:
+                time.sleep(config.LLM_POOL_RETRY_BACKOFF * 2 ** (attempt - 1))
+            tried.add(endpoint.name)
+            start = time.perf_counter()
+            try:
+                response = endpoint.sync_client.chat.completions.create(**endpoint.request_kwargs(kwargs))
+            except BaseException as error:
+                failed = is_endpoint_failure(error)
+                self.release(endpoint, probe, failed=failed)
+                metrics.observe_endpoint_error(current_stage(), kwargs["model"], endpoint.name, error)
+                if not failed or attempt == config.LLM_POOL_MAX_ATTEMPTS - 1:
+                    raise
+                logger.warning(f"LLM endpoint {endpoint.name} failed: {error}, retrying")
+                continue
+            self.release(endpoint, probe, time.perf_counter() - start)
+            return response
+
+    def stats(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [endpoint.stats(now) for endpoint in self.endpoints]
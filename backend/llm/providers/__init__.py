@@ -0,0 +1,30 @@
+from backend import config
+from backend.llm.providers.base import Provider
+
+
+def create_provider(name: str = None) -> Provider:
+    """Instantiate the configured LLM provider."""
+    name = (name or config.LLM_PROVIDER).lower()
+    if name == "azure":
+        from backend.llm.pool import EndpointPool
+        return EndpointPool.from_config()
+    if name == "stub":
+        from backend.llm.providers.stub import StubProvider
+        return StubProvider(
+            config.LLM_STUB_LATENCY,
+            config.LLM_STUB_LATENCY_SIGMA,
+            config.LLM_STUB_SECONDS_PER_1K_TOKENS,
+            config.LLM_STUB_COMPLETION_TOKENS,
+            config.LLM_STUB_COMPLETION_TOKENS_SIGMA,
+            seed=config.LLM_STUB_SEED,
+        )
+    if name == "record":
+        from backend.llm.providers.cassette import Cassette, RecordingProvider
+        return RecordingProvider(create_provider(config.LLM_RECORD_PROVIDER), Cassette(config.LLM_CASSETTE_PATH))
+    if name == "replay":
+        from backend.llm.providers.cassette import Cassette, ReplayProvider
+        return ReplayProvider(Cassette(config.LLM_CASSETTE_PATH), latency_scale=config.LLM_REPLAY_LATENCY_SCALE)
+    raise ValueError(f"Unsupported LLM provider: {name}")
+
+
+__all__ = ["Provider", "create_provider"]
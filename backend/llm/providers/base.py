@@ -0,0 +1,29 @@
+from abc import ABC, abstractmethod
+
+
+class Provider(ABC):
+    """
+    Where LLMClient sends completions.
+
+    Both methods take the arguments of the OpenAI client's `chat.completions.create` and return what
+    it returns, so prompts, schemas and parsing stay the same whichever provider answers.
+    """
+
+    name: str = "abstract"
+
+    @abstractmethod
+    async def acreate(self, avoid: set = None, **kwargs):
+        """
+        Async chat completion, never streamed.
+
+        `avoid` names endpoints the caller would rather not use (the primary of a hedge), providers
+        add the ones they used.
+        """
+
+    @abstractmethod
+    def create(self, **kwargs):
+        """Sync chat completion, used for streams."""
+
+    def stats(self) -> list:
+        """Per-endpoint counters of this process."""
+        return []
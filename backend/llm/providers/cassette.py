@@ -0,0 +1,142 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Iterator
+
+import orjson
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from backend.llm.providers.base import Provider
+
+logger = logging.getLogger(__name__)
+
+# Prompts carry today's date, replays must match on any day
+DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+class CassetteMissError(LookupError):
+    """The cassette has no recorded completion for a request."""
+
+
+def request_key(kwargs: dict) -> str:
+    """Identity of a completion request: all its arguments with dates masked."""
+    canonical = orjson.dumps(kwargs, option=orjson.OPT_SORT_KEYS, default=str).decode()
+    return hashlib.sha256(DATE.sub("YYYY-MM-DD", canonical).encode()).hexdigest()
+
+
+class Cassette:
+    """Recorded completions in a JSON lines file, one interaction per line, appended by any number of processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        """Recorded interactions by request key, in recording order."""
+        interactions = defaultdict(list)
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        interaction = orjson.loads(line)
+                        interactions[interaction["key"]].append(interaction)
+        return interactions
+
+    def append(self, interaction: dict) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        line = orjson.dumps(interaction) + b"\n"
+        with self._lock, open(self.path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(line)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RecordingProvider(Provider):
+    """Passes completions to `provider` and records each one, with its latency, to the cassette."""
+
+    name = "record"
+
+    def __init__(self, provider: Provider, cassette: Cassette):
+        self.provider = provider
+        self.cassette = cassette
+
+    async def acreate(self, avoid: set = None, **kwargs):
+        start = time.perf_counter()
+        response = await self.provider.acreate(avoid=avoid, **kwargs)
+        self._record(kwargs, time.perf_counter() - start, response=response.model_dump(mode="json"))
+        return response
+
+    def create(self, **kwargs):
+        start = time.perf_counter()
+        response = self.provider.create(**kwargs)
+        if kwargs.get("stream"):
+            return self._record_stream(kwargs, start, response)
+        self._record(kwargs, time.perf_counter() - start, response=response.model_dump(mode="json"))
+        return response
+
+    def _record_stream(self, kwargs: dict, start: float, stream) -> Iterator:
+        chunks = []
+        for chunk in stream:
+            chunks.append(chunk.model_dump(mode="json"))
+            yield chunk
+        self._record(kwargs, time.perf_counter() - start, chunks=chunks)
+
+    def _record(self, kwargs: dict, seconds: float, **recorded) -> None:
+        self.cassette.append({"key": request_key(kwargs), "model": kwargs["model"], "seconds": round(seconds, 4), **recorded})
+
+    def stats(self) -> list:
+        return self.provider.stats()
+
+
+class ReplayProvider(Provider):
+    """
+    Answers completions from the cassette, after `latency_scale` times their recorded latency.
+
+    A request recorded several times gets its recordings in turn. Unrecorded requests raise CassetteMissError.
+    """
+
+    name = "replay"
+
+    def __init__(self, cassette: Cassette, latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self.interactions = cassette.load()
+        self.requests = 0
+        self.misses = 0
+        self._turns = defaultdict(int)
+        self._lock = threading.Lock()
+        logger.info(f"Replaying {sum(map(len, self.interactions.values()))} completions from {cassette.path}")
+
+    def _next(self, kwargs: dict) -> dict:
+        key = request_key(kwargs)
+        with self._lock:
+            self.requests += 1
+            recorded = self.interactions.get(key)
+            if not recorded:
+                self.misses += 1
+                raise CassetteMissError(f"No recorded completion for a {kwargs['model']} request ({key})")
+            interaction = recorded[self._turns[key] % len(recorded)]
+            self._turns[key] += 1
+        return interaction
+
+    async def acreate(self, avoid: set = None, **kwargs):
+        interaction = self._next(kwargs)
+        await asyncio.sleep(interaction["seconds"] * self.latency_scale)
+        return ChatCompletion.model_validate(interaction["response"])
+
+    def create(self, **kwargs):
+        interaction = self._next(kwargs)
+        time.sleep(interaction["seconds"] * self.latency_scale)
+        if "chunks" in interaction:
+            return (ChatCompletionChunk.model_validate(chunk) for chunk in interaction["chunks"])
+        return ChatCompletion.model_validate(interaction["response"])
+
+    def stats(self) -> list:
+        return [{"name": self.name, "requests": self.requests, "misses": self.misses}]
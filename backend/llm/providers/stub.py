@@ -0,0 +1,111 @@
+import asyncio
+import random
+import threading
+import time
+import uuid
+from typing import Iterator, Optional
+
+import orjson
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from backend.llm.providers.base import Provider
+from backend.utils.text_compaction import count_tokens
+
+TEXT_ANSWER = "The document was analyzed.\n- Check deadlines\n- Check payments\nCriteria cover the key terms."
+FILLER_LINE = "\n- Placeholder finding about the document terms."
+# Answer of prompts that ask for JSON in their instructions instead of a response schema
+JSON_ANSWER = {"placeholder": "Placeholder text"}
+
+
+def schema_instance(schema: dict):
+    """A placeholder value of a JSON schema, dates left empty."""
+    if "enum" in schema:
+        return schema["enum"][0]
+    if schema["type"] == "object":
+        return {name: schema_instance(prop) for name, prop in schema["properties"].items()}
+    if schema["type"] == "array":
+        return [schema_instance(schema["items"]) for _ in range(2)]
+    if schema["type"] == "boolean":
+        return False
+    return "" if "date" in schema.get("description", "").lower() else "Placeholder text"
+
+
+def stub_completion(kwargs: dict, completion_tokens: Optional[int] = None) -> dict:
+    """
+    A chat completion, as the API returns it, for `chat.completions.create` arguments.
+
+    Structured output requests get a placeholder instance of their schema, prompts asking for JSON a
+    JSON object, text requests a bulleted answer padded to about `completion_tokens`. Usage counts
+    `completion_tokens` when given.
+    """
+    response_format = kwargs.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        content = orjson.dumps(schema_instance(response_format["json_schema"]["schema"])).decode()
+    elif any("json" in message["content"].lower() for message in kwargs["messages"] if message["role"] == "system"):
+        content = orjson.dumps(JSON_ANSWER).decode()
+    else:
+        lines = max((completion_tokens or 0) - count_tokens(TEXT_ANSWER), 0) // count_tokens(FILLER_LINE)
+        content = TEXT_ANSWER + FILLER_LINE * lines
+    prompt_tokens = sum(count_tokens(message["content"]) for message in kwargs["messages"])
+    completion_tokens = completion_tokens or count_tokens(content)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": kwargs["model"],
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def stub_chunks(completion: dict) -> Iterator[dict]:
+    """The chunks of a streamed `completion`, one per word."""
+    chunk = {key: completion[key] for key in ("id", "created", "model")}
+    for word in completion["choices"][0]["message"]["content"].split(" "):
+        yield {**chunk, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+    yield {**chunk, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+
+
+class StubProvider(Provider):
+    """
+    Simulated completions without network, for load tests.
+
+    Latency is log-normal around `latency` seconds plus `seconds_per_1k_tokens` of prompt and completion,
+    completion lengths are log-normal around `completion_tokens`. A `seed` makes the draws reproducible.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency: float, latency_sigma: float, seconds_per_1k_tokens: float, completion_tokens: int,
+                 completion_tokens_sigma: float, seed: Optional[int] = None):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.completion_tokens = completion_tokens
+        self.completion_tokens_sigma = completion_tokens_sigma
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self, kwargs: dict) -> tuple:
+        with self._lock:
+            self.requests += 1
+            latency = self._random.lognormvariate(0, self.latency_sigma) * self.latency
+            tokens = max(int(self._random.lognormvariate(0, self.completion_tokens_sigma) * self.completion_tokens), 1)
+        completion = stub_completion(kwargs, tokens)
+        return completion, latency + completion["usage"]["total_tokens"] / 1000 * self.seconds_per_1k_tokens
+
+    async def acreate(self, avoid: set = None, **kwargs):
+        completion, seconds = self._draw(kwargs)
+        await asyncio.sleep(seconds)
+        return ChatCompletion.model_validate(completion)
+
+    def create(self, **kwargs):
+        completion, seconds = self._draw(kwargs)
+        time.sleep(seconds)
+        if kwargs.get("stream"):
+            return (ChatCompletionChunk.model_validate(chunk) for chunk in stub_chunks(completion))
+        return ChatCompletion.model_validate(completion)
+
+    def stats(self) -> list:
+        return [{"name": self.name, "requests": self.requests}]
@@ -0,0 +1,80 @@
+import bisect
+import logging
+from typing import List, Optional
+
+from backend import config
+
+logger = logging.getLogger(__name__)
+
+# Lowest ladder rung per stage, stages that reason over dates and obligations never go to the smallest model
+STAGE_MIN_TIERS = {
+    "alerts_and_actions": 1,
+    "fused_analysis": 1,
+}
+# Analysis modes that start one rung higher than their input size alone would
+MODE_TIER_BOOST = {
+    "detailed": 1,
+}
+
+
+def route_model(default_model: str, input_tokens: int, stage: str = None, ai_analysis_mode: str = None) -> str:
+    """
+    The deployment of MODEL_LADDER (smallest first) for a completion, `default_model` when no ladder is configured.
+
+    The rung comes from the estimated input tokens against MODEL_ROUTING_TOKEN_THRESHOLDS, one rung
+    higher for detailed analysis, and at least the stage's minimum rung.
+    """
+    ladder = config.MODEL_LADDER
+    if not ladder:
+        return default_model
+
+    tier = bisect.bisect_left(config.MODEL_ROUTING_TOKEN_THRESHOLDS, input_tokens)
+    tier += MODE_TIER_BOOST.get(ai_analysis_mode, 0)
+    tier = min(max(tier, STAGE_MIN_TIERS.get(stage, 0)), len(ladder) - 1)
+    model = ladder[tier]
+    logger.info(f"Routing {stage or 'completion'} ({input_tokens} tokens, {ai_analysis_mode or 'no'} mode) to {model}")
+    return model
+
+
+def escalate_model(model: str) -> Optional[str]:
+    """The next larger deployment of the ladder, None at the top or when the model is not on it."""
+    ladder = config.MODEL_LADDER
+    if model not in ladder or model == ladder[-1]:
+        return None
+    return ladder[ladder.index(model) + 1]
+
+
+def schema_errors(instance, schema: dict, path: str = "$") -> List[str]:
+    """
+    Where a structured output does not match its JSON schema.
+
+    Covers the subset the prompts use: object properties, required and additionalProperties, array
+    items, enum and the scalar types.
+    """
+    expected = schema.get("type")
+    types = {
+        "object": dict, "array": list, "string": str, "boolean": bool,
+        "integer": int, "number": (int, float), "null": type(None),
+    }
+    if expected in types:
+        valid = isinstance(instance, types[expected])
+        if expected in ("integer", "number") and isinstance(instance, bool):
+            valid = False
+        if not valid:
+            return [f"{path}: expected {expected}, got {type(instance).__name__}"]
+    if "enum" in schema and instance not in schema["enum"]:
+        return [f"{path}: {instance!r} is not one of {schema['enum']}"]
+
+    errors = []
+    if expected == "object":
+        properties = schema.get("properties", {})
+        errors += [f"{path}: missing {name}" for name in schema.get("required", []) if name not in instance]
+        if schema.get("additionalProperties") is False:
+            errors += [f"{path}: unexpected {name}" for name in instance if name not in properties]
+        for name, value in instance.items():
+            if name in properties:
+                errors += schema_errors(value, properties[name], f"{path}.{name}")
+    elif expected == "array" and "items" in schema:
+        for index, item in enumerate(instance):
+            errors += schema_errors(item, schema["items"], f"{path}[{index}]")
+    return errors
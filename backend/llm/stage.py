@@ -0,0 +1,24 @@
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+_stage = contextvars.ContextVar("llm_stage", default=None)
+
+
+@contextmanager
+def completion_stage(stage: str):
+    """Name the prompt of the completions made inside the block, hedging and metrics keep figures per prompt and model."""
+    token = _stage.set(stage)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+def current_stage() -> Optional[str]:
+    return _stage.get()
+
+
+def set_stage(stage: Optional[str]) -> None:
+    """Name the prompt for the rest of the current task, for completions running on the client's event loop."""
+    _stage.set(stage)
@@ -1,13 +1,22 @@
+import asyncio
 import logging
+import time
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.templating import Jinja2Templates
+from opentelemetry import trace
+from starlette.datastructures import Headers
 from starlette.middleware.sessions import SessionMiddleware
 
 from backend import config
+from backend.api.api_v1.endpoints.documents_endpoints import \
+    publish_analysis_tasks
 from backend.api.api_v1.routers import api_router
-from backend.dependencies import init_db
+from backend.core import admission, metrics, pipeline_events, progress, tracing
+from backend.core.celery import celery_app
+from backend.dependencies import get_storage, init_db
 
 API_V1_STR = "/api/v1"
 
@@ -19,11 +28,14 @@ logger.setLevel(logging.INFO)
 # Set up logging for the kernel
 logging.getLogger("kernel").setLevel(logging.DEBUG)
 
+tracing.setup_tracing("eternyiq-api")
+
 app = FastAPI(
     title="EternyIQ API",
     openapi_url=f"{API_V1_STR}/openapi.json",
     docs_url="/docs",
-    redoc_url="/redocs"
+    redoc_url="/redocs",
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -40,15 +52,102 @@ app.add_middleware(
     SessionMiddleware, secret_key=config.SECRET_KEY, max_age=3600  # 1 hour
 )
 
+# Room for the non-file multipart form fields sent along with an upload
+UPLOAD_FORM_OVERHEAD = 1024 * 1024
+
+
+class RequestObservation:
+    """
+    Trace, latency metric and upload size limit of every HTTP request, in one pure ASGI middleware.
+
+    Unlike BaseHTTPMiddleware layers it adds no task and no body stream of its own per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        headers = Headers(scope=scope)
+        start = time.perf_counter()
+        status = None
+
+        def route_path() -> str:
+            # Route templates, not paths, keep one series per endpoint
+            route = scope.get("route")
+            return route.path if route else "unmatched"
+
+        async def observed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                # Latency up to the response headers, streamed responses like progress events are not timed to their end
+                status = message["status"]
+                metrics.HTTP_REQUEST_SECONDS.labels(method, route_path(), status).observe(time.perf_counter() - start)
+            await send(message)
+
+        # Continues the trace of workers calling back into the API through perform_request
+        span = tracing.start_server_span(method, headers)
+        with trace.use_span(span, end_on_exit=True):
+            try:
+                # Reject oversized uploads from Content-Length before the multipart body is read and spooled
+                content_length = headers.get("content-length", "")
+                max_size = config.MAX_BULK_UPLOAD_SIZE if scope["path"].endswith("/bulk") else config.MAX_UPLOAD_SIZE
+                if method == "POST" and content_length.isdigit() and int(content_length) > max_size + UPLOAD_FORM_OVERHEAD:
+                    response = ORJSONResponse(
+                        status_code=413,
+                        content={"detail": f"Request exceeds the maximum allowed size of {max_size} bytes"}
+                    )
+                    await response(scope, receive, observed_send)
+                else:
+                    await self.app(scope, receive, observed_send)
+            finally:
+                span.update_name(f"{method} {route_path()}")
+                span.set_attribute("http.response.status_code", status or 500)
+
+
+app.add_middleware(RequestObservation)
+
+# Asks the broker at most every METRICS_QUEUE_DEPTH_REFRESH_SECONDS, however often /metrics is scraped
+queue_depth_collector = metrics.QueueDepthCollector(celery_app)
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(metrics.render(queue_depth_collector), media_type=metrics.CONTENT_TYPE)
+
+
 # Include routers
 app.include_router(api_router, prefix=API_V1_STR)
 
 templates = Jinja2Templates(directory="templates")
 
 
+# Enqueues deferred documents once the pipeline has room
+release_deferred_task = None
+
+
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
+    global release_deferred_task
     init_db()
+    # Tasks published by the API are recorded straight into storage
+    pipeline_events.buffer.sink = get_storage().add_pipeline_events
+    release_deferred_task = asyncio.create_task(
+        admission.release_deferred_periodically(admission.controller, get_storage(), publish_analysis_tasks)
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if release_deferred_task is not None:
+        release_deferred_task.cancel()
+        await asyncio.gather(release_deferred_task, return_exceptions=True)
+    pipeline_events.buffer.flush()
+    await progress.hub.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,180 @@
+import logging
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import orjson
+
+from backend import config
+from backend.utils.text_compaction import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Paragraphs longer than this are split into groups of lines so a single page-long block cannot eat the budget
+MAX_CHUNK_TOKENS = 400
+GAP_MARKER = "\n[...]\n"
+
+DATE = re.compile(r"\b(?:\d{1,2}[./-]\s?\d{1,2}[./-]\s?\d{2,4}|\d{4}-\d{2}-\d{2}|\d{1,2}\.?\s+[A-Za-zÀ-ſ]{3,}\.?\s+\d{4})\b")
+AMOUNT = re.compile(r"(?:[$€£]|\b(?:CZK|EUR|USD|GBP|Kč)\b)\s?\d|\d[\d\s.,]*\s?(?:[$€£%]|\b(?:CZK|EUR|USD|GBP|Kč)\b)")
+OBLIGATION = re.compile(
+    r"\b(?:shall|must|terminat\w*|expir\w*|deadline|notice|penalt\w*|payment|due|renew\w*|liabilit\w*|oblig\w*|"
+    r"lhůt\w*|splatn\w*|výpověd\w*|pokut\w*|platnost\w*|povinn\w*|sankc\w*)\b",
+    re.IGNORECASE,
+)
+WORD = re.compile(r"\w{4,}")
+
+
+class StageBudget(NamedTuple):
+    max_tokens: int
+    # Inputs the stage accepts, most faithful first, the first one that fits the budget is sent
+    sources: Tuple[str, ...]
+    # Earlier output whose words rank the chunks for the retrieved_chunks source
+    query_field: Optional[str] = None
+
+
+class StageInput(NamedTuple):
+    text: str
+    source: str
+    tokens: int
+    raw_tokens: int
+
+
+STAGE_BUDGETS: Dict[str, StageBudget] = {
+    "smart_summary": StageBudget(config.CONTEXT_BUDGET_SMART_SUMMARY, ("document_raw_text", "key_sections")),
+    "analysis_criteria": StageBudget(config.CONTEXT_BUDGET_ANALYSIS_CRITERIA, ("document_raw_text", "key_sections")),
+    "alerts_and_actions": StageBudget(
+        config.CONTEXT_BUDGET_ALERTS_AND_ACTIONS,
+        ("document_raw_text", "retrieved_chunks", "ai_summary_long"),
+        query_field="ai_analysis_criteria",
+    ),
+    "fused_analysis": StageBudget(config.CONTEXT_BUDGET_FUSED_ANALYSIS, ("document_raw_text", "key_sections")),
+    "map_eterny_legacy_schemas": StageBudget(
+        config.CONTEXT_BUDGET_LEGACY_SCHEMAS, ("document_raw_text", "key_sections", "ai_summary_long")
+    ),
+}
+
+
+def split_chunks(text: str) -> List[str]:
+    """Paragraphs of the text, long paragraphs split into groups of lines."""
+    chunks = []
+    for paragraph in re.split(r"\n\s*\n|\f", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= MAX_CHUNK_TOKENS:
+            chunks.append(paragraph)
+            continue
+        group, group_tokens = [], 0
+        for line in paragraph.splitlines():
+            line_tokens = count_tokens(line)
+            if group and group_tokens + line_tokens > MAX_CHUNK_TOKENS:
+                chunks.append("\n".join(group))
+                group, group_tokens = [], 0
+            group.append(line)
+            group_tokens += line_tokens
+        if group:
+            chunks.append("\n".join(group))
+    return chunks
+
+
+def salience(chunk: str) -> float:
+    """How much a chunk looks like terms the analysis stages care about: dates, amounts and obligations."""
+    return 2 * len(DATE.findall(chunk)) + 2 * len(AMOUNT.findall(chunk)) + len(OBLIGATION.findall(chunk))
+
+
+def _relevance_scores(chunks: List[str], query: str) -> List[float]:
+    # Inverse document frequency weighted overlap of the query words, a lightweight lexical retriever
+    chunk_words = [set(WORD.findall(chunk.lower())) for chunk in chunks]
+    document_frequency = Counter(word for words in chunk_words for word in words)
+    query_words = set(WORD.findall(query.lower()))
+    return [
+        sum(math.log(1 + len(chunks) / document_frequency[word]) for word in query_words & words)
+        for words in chunk_words
+    ]
+
+
+def select_chunks(text: str, max_tokens: int, query: str = None) -> str:
+    """
+    The highest scoring chunks of the text that fit `max_tokens`, in document order.
+
+    Chunks are ranked by salience, and by relevance to `query` first when one is given. The opening
+    chunk (title, parties) is always kept. Omitted stretches are marked with [...].
+    """
+    chunks = split_chunks(text)
+    if not chunks:
+        return ""
+    scores = [salience(chunk) for chunk in chunks]
+    if query:
+        scores = [relevance * 10 + score for relevance, score in zip(_relevance_scores(chunks, query), scores)]
+    ranked = [0] + sorted(range(1, len(chunks)), key=lambda index: scores[index], reverse=True)
+
+    selected, used = set(), 0
+    marker_tokens = count_tokens(GAP_MARKER)
+    for index in ranked:
+        tokens = count_tokens(chunks[index]) + marker_tokens
+        if used + tokens > max_tokens:
+            continue
+        selected.add(index)
+        used += tokens
+
+    parts = []
+    for index in sorted(selected):
+        if parts:
+            parts.append("\n\n" if index - 1 in selected else GAP_MARKER)
+        parts.append(chunks[index])
+    if selected and max(selected) < len(chunks) - 1:
+        parts.append(GAP_MARKER)
+    return "".join(parts).strip()
+
+
+def _candidate(source: str, budget: StageBudget, document: dict, max_tokens: int) -> str:
+    raw_text = document.get("document_raw_text") or ""
+    if source == "key_sections":
+        return select_chunks(raw_text, max_tokens)
+    if source == "retrieved_chunks":
+        query = document.get(budget.query_field) if budget.query_field else None
+        return select_chunks(raw_text, max_tokens, query=str(query) if query else None)
+    return document.get(source) or ""
+
+
+def build_stage_input(stage: str, document: dict, reserved_tokens: int = 0) -> StageInput:
+    """
+    Assemble the document input of an analysis stage within its token budget.
+
+    Goes through the stage's sources in order and returns the first that fits `max_tokens` minus
+    `reserved_tokens` (other variable parts of the prompt). Chunk selections are trimmed to fit, when
+    nothing fits the smallest candidate is cut at the budget.
+    """
+    budget = STAGE_BUDGETS[stage]
+    max_tokens = max(budget.max_tokens - reserved_tokens, 0)
+    raw_tokens = count_tokens(document.get("document_raw_text") or "")
+
+    candidates = []
+    for source in budget.sources:
+        text = _candidate(source, budget, document, max_tokens)
+        if not text:
+            continue
+        tokens = count_tokens(text)
+        if tokens <= max_tokens:
+            break
+        candidates.append((tokens, source, text))
+    else:
+        tokens, source, text = min(candidates, default=(0, "document_raw_text", ""))
+        text = truncate_tokens(text, max_tokens)
+        tokens = count_tokens(text)
+
+    logger.info(f"Stage {stage} input: {source}, {raw_tokens} -> {tokens} tokens (budget {max_tokens})")
+    return StageInput(text=text, source=source, tokens=tokens, raw_tokens=raw_tokens)
+
+
+@lru_cache(maxsize=1)
+def legacy_schemas(prompts_path: str = "prompts/prompts.json") -> str:
+    """The response schemas of the analysis prompts as compact JSON, without the prompt texts and examples."""
+    with open(prompts_path, "rb") as f:
+        prompts = orjson.loads(f.read())
+    return orjson.dumps({
+        name: prompt["schema"] for name, prompt in prompts.items()
+        if "schema" in prompt and not name.startswith("example_")
+    }).decode()
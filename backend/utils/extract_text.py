@@ -1,23 +1,33 @@
 import logging
+import subprocess
 from pathlib import Path
+from typing import Callable, NamedTuple
 
 from docx import Document
 from odf import teletype
 from odf.opendocument import load
 from odf.text import P
-from pdfminer.high_level import extract_text
+
+from backend import config
+from backend.utils.pdf_engine import iter_pdf_pages
 
 logger = logging.getLogger(__name__)
 
+DOCUMENT_EXTENSIONS = {".pdf", ".doc", ".docx", ".rtf", ".txt", ".md", ".odt"}
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif"}
+
+
+class UnsupportedDocumentError(ValueError):
+    """The file type has no text extractor."""
+
 
 def extract_pdf_text(file_path: Path) -> str:
     """Extract text from PDF file."""
     try:
-        # Extract text using pdfminer.six
-        text = extract_text(str(file_path))
-        # Clean up the extracted text
-        cleaned_text = ' '.join(text.split()).strip()
-        return cleaned_text or "No text could be extracted from the PDF"
+        # Pages are extracted in parallel, by pdftotext when available, pdfminer.six otherwise.
+        # Lines and form feed page breaks are kept, text compaction uses them to find headers and footers
+        text = "\f".join(page.strip("\f") for page in iter_pdf_pages(file_path)).strip()
+        return text or "No text could be extracted from the PDF"
     except Exception as e:
         logger.error(f"Error extracting PDF text: {str(e)}")
         raise
@@ -99,3 +109,54 @@ def extract_md_text(file_path: Path) -> str:
     except Exception as e:
         logger.error(f"Error extracting MD text: {str(e)}")
         raise
+
+
+def extract_doc_text(file_path: Path) -> str:
+    """Extract text from a legacy DOC file using antiword."""
+    try:
+        result = subprocess.run(
+            ['antiword', str(file_path)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True
+        )
+        return result.stdout.decode('utf-8')
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Antiword failed to process {file_path}: {str(e)}")
+        raise
+
+
+class Extractor(NamedTuple):
+    name: str
+    # Bump when the extractor's output changes, cached texts of older versions are then discarded
+    version: str
+    extract: Callable[[Path], str]
+
+
+EXTRACTORS = {
+    ".pdf": Extractor("pdf", f"2-{config.PDF_ENGINE}", extract_pdf_text),
+    ".doc": Extractor("doc", "1", extract_doc_text),
+    ".docx": Extractor("docx", "1", extract_docx_text),
+    ".rtf": Extractor("rtf", "1", extract_rtf_text),
+    ".txt": Extractor("txt", "1", extract_txt_text),
+    ".md": Extractor("md", "1", extract_md_text),
+    ".odt": Extractor("odt", "1", extract_odt_text),
+}
+
+
+def get_extractor(file_path: Path) -> Extractor:
+    """The extractor for a document, picked by file extension."""
+    extension = Path(file_path).suffix.lower()
+    if extension in IMAGE_EXTENSIONS:
+        # XXX TODO utilise LLM to extract text from image
+        # XXX TODO LLM should extract metadata as well such as document type and any descriptive info it can produce really and store this as raw_text
+        raise UnsupportedDocumentError("Text extraction from images (PNG, JPEG, WEBP, GIF) is not supported yet")
+    extractor = EXTRACTORS.get(extension)
+    if extractor is None:
+        raise UnsupportedDocumentError("Unsupported file format. Supported formats: PDF, DOC, DOCX, RTF, TXT, MD, ODT")
+    return extractor
+
+
+def extract_text_from_path(file_path: Path) -> str:
+    """Extract text from any supported document."""
+    return get_extractor(file_path).extract(Path(file_path))
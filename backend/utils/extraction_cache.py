@@ -0,0 +1,202 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Optional
+
+from backend import config
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionCache:
+    """
+    Extracted document texts on disk, keyed by (sha256, extractor name, extractor version).
+
+    Texts are plain files under `cache_dir`, a SQLite index next to them tracks sizes, last access
+    and hit/miss counters, so every API and worker process sharing the directory shares the cache.
+    The least recently used texts are evicted once their total size exceeds `max_bytes`. The first
+    lookup of an extractor version in a process drops the entries of that extractor's other versions.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.db")
+        self._current_versions = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    hash_sha256 TEXT NOT NULL,
+                    extractor TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (hash_sha256, extractor, version)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    extractor TEXT PRIMARY KEY,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    misses INTEGER NOT NULL DEFAULT 0,
+                    evictions INTEGER NOT NULL DEFAULT 0,
+                    invalidations INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.commit()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous = NORMAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _path(self, hash_sha256: str, extractor: str, version: str) -> str:
+        return os.path.join(self.cache_dir, hash_sha256[:2], f"{hash_sha256}.{extractor}.{version}.txt")
+
+    @staticmethod
+    def _count(conn, extractor: str, counter: str, amount: int = 1) -> None:
+        conn.execute(
+            f"INSERT INTO counters (extractor, {counter}) VALUES (?, ?) "
+            f"ON CONFLICT (extractor) DO UPDATE SET {counter} = {counter} + excluded.{counter}",
+            (extractor, amount)
+        )
+
+    def _remove_files(self, rows) -> None:
+        for row in rows:
+            try:
+                os.remove(self._path(row["hash_sha256"], row["extractor"], row["version"]))
+            except FileNotFoundError:
+                pass
+
+    def _drop_other_versions(self, extractor: str, version: str) -> None:
+        if self._current_versions.get(extractor) == version:
+            return
+        with self._connect() as conn:
+            rows = conn.execute(
+                "DELETE FROM entries WHERE extractor = ? AND version != ? RETURNING hash_sha256, extractor, version",
+                (extractor, version)
+            ).fetchall()
+            if rows:
+                self._count(conn, extractor, "invalidations", len(rows))
+            conn.commit()
+        self._remove_files(rows)
+        if rows:
+            logger.info(f"Dropped {len(rows)} cached texts of outdated {extractor} extractor versions")
+        self._current_versions[extractor] = version
+
+    def get(self, hash_sha256: str, extractor: str, version: str) -> Optional[str]:
+        """The cached text, None on a miss."""
+        self._drop_other_versions(extractor, version)
+        text = None
+        try:
+            with open(self._path(hash_sha256, extractor, version), "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            pass
+
+        with self._connect() as conn:
+            if text is not None:
+                updated = conn.execute(
+                    "UPDATE entries SET last_access = ? WHERE hash_sha256 = ? AND extractor = ? AND version = ?",
+                    (time.time(), hash_sha256, extractor, version)
+                ).rowcount
+                # A file without an index row is a write or an eviction in progress
+                text = text if updated else None
+            self._count(conn, extractor, "hits" if text is not None else "misses")
+            conn.commit()
+        return text
+
+    def put(self, hash_sha256: str, extractor: str, version: str, text: str) -> None:
+        """Store a text, then evict least recently used texts beyond `max_bytes`."""
+        path = self._path(hash_sha256, extractor, version)
+        data = text.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, path)
+
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO entries (hash_sha256, extractor, version, size, last_access) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (hash_sha256, extractor, version) DO UPDATE SET size = excluded.size, last_access = excluded.last_access
+                """,
+                (hash_sha256, extractor, version, len(data), time.time())
+            )
+            conn.commit()
+        self._evict()
+
+    def _evict(self) -> None:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                conn.rollback()
+                return
+            evicted = []
+            for row in conn.execute("SELECT hash_sha256, extractor, version, size FROM entries ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                evicted.append(row)
+                total -= row["size"]
+            conn.executemany(
+                "DELETE FROM entries WHERE hash_sha256 = ? AND extractor = ? AND version = ?",
+                [(row["hash_sha256"], row["extractor"], row["version"]) for row in evicted]
+            )
+            for row in evicted:
+                self._count(conn, row["extractor"], "evictions")
+            conn.commit()
+        self._remove_files(evicted)
+        logger.info(f"Evicted {len(evicted)} cached texts")
+
+    def stats(self) -> dict:
+        """Size of the cache and hit/miss counters, overall and per extractor."""
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            sizes = {
+                row["extractor"]: row for row in
+                conn.execute("SELECT extractor, COUNT(*) AS entries, SUM(size) AS bytes FROM entries GROUP BY extractor")
+            }
+            counters = {row["extractor"]: dict(row) for row in conn.execute("SELECT * FROM counters")}
+
+        by_extractor = {}
+        for extractor in sorted(set(sizes) | set(counters)):
+            row = counters.get(extractor, {})
+            by_extractor[extractor] = {
+                "entries": sizes[extractor]["entries"] if extractor in sizes else 0,
+                "bytes": sizes[extractor]["bytes"] if extractor in sizes else 0,
+                **{counter: row.get(counter, 0) for counter in ("hits", "misses", "evictions", "invalidations")},
+            }
+        hits = sum(e["hits"] for e in by_extractor.values())
+        misses = sum(e["misses"] for e in by_extractor.values())
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+            "extractors": by_extractor,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_extraction_cache() -> Optional[ExtractionCache]:
+    """Process-wide extraction cache, None when disabled."""
+    if not config.EXTRACTION_CACHE_ENABLED:
+        return None
+    return ExtractionCache(config.EXTRACTION_CACHE_DIR, config.EXTRACTION_CACHE_MAX_BYTES)
@@ -0,0 +1,51 @@
+import copy
+
+from backend import config
+
+# Staged prompts the fused call replaces, in the order their outputs build on each other
+FUSED_STAGES = ("smart_summary", "analysis_criteria", "features_and_insights", "alerts_and_actions")
+
+ANALYSIS_CRITERIA_PROPERTY = {
+    "type": "string",
+    "description": (
+        "Plain-text analysis plan: a start statement line, one line per criterion prefixed with '- ' "
+        "and a closing summary statement line."
+    ),
+}
+
+
+def fusion_enabled(ai_analysis_mode: str) -> bool:
+    return ai_analysis_mode in config.FUSED_ANALYSIS_MODES
+
+
+def fused_schema(prompts: dict) -> dict:
+    """
+    One strict response format with the fields of every fused stage, built from the stage schemas.
+
+    analysis_criteria has no schema of its own (plain text), it becomes a string field. Fields are
+    ordered like the stages, so the model writes the criteria before the features and alerts based on them.
+    """
+    properties = {}
+    for stage in FUSED_STAGES:
+        if "schema" in prompts[stage]:
+            properties.update(copy.deepcopy(prompts[stage]["schema"]["json_schema"]["schema"]["properties"]))
+        else:
+            properties[stage] = ANALYSIS_CRITERIA_PROPERTY
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "FusedAnalysisSchema",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def fused_prompt(prompts: dict) -> dict:
+    """The fused_analysis prompt of prompts.json with the combined response format."""
+    return {**prompts["fused_analysis"], "schema": fused_schema(prompts)}
@@ -1,42 +1,50 @@
+import datetime
 import logging
 import re
+from typing import Optional
 
+import orjson
 import requests
+from opentelemetry.trace import SpanKind
 
 from backend import config
+from backend.core import tracing
 
 logger = logging.getLogger(__name__)
 
 
 def perform_request(request_type: str, url: str, data: dict, headers: dict = None) -> requests.Response:
-    try:
-        logger.info(f"Performing {request_type} request to {url} with data {data} and headers {headers}")
-
-        if request_type.upper() == "GET":
-            response = requests.get(url, params=data, headers=headers)
-        elif request_type.upper() == "POST":
-            response = requests.post(url, json=data, headers=headers)
-        elif request_type.upper() == "PUT":
-            response = requests.put(url, json=data, headers=headers)
-        elif request_type.upper() == "DELETE":
-            response = requests.delete(url, json=data, headers=headers)
-        elif request_type.upper() == "PATCH":
-            response = requests.patch(url, json=data, headers=headers)
-        else:
-            raise ValueError(f"Unsupported request type: {request_type}")
-
-        response.raise_for_status()
-        return response
-
-    except requests.HTTPError as e:
-        logger.error(f"HTTP error occurred: {str(e)}")
-        raise
-    except requests.RequestException as e:
-        logger.error(f"Error occurred: {str(e)}")
-        raise
-    except ValueError as e:
-        logger.error(str(e))
-        raise
+    method = request_type.upper()
+    with tracing.tracer.start_as_current_span(f"HTTP {method}", kind=SpanKind.CLIENT, attributes={"http.request.method": method, "url.full": url}) as span:
+        # The API and webhook receivers continue the trace from the traceparent header
+        headers = tracing.inject_headers(headers)
+        try:
+            logger.info(f"Performing {request_type} request to {url} with headers {headers}")
+
+            if method == "GET":
+                response = requests.get(url, params=data, headers=headers)
+            elif method in ("POST", "PUT", "DELETE", "PATCH"):
+                # Serialise the body with orjson, it is an order of magnitude faster than requests' json= on large documents.
+                # Bodies that are already JSON text (a forwarded artefact) are sent as they are
+                json_headers = {"Content-Type": "application/json", **headers}
+                body = data if isinstance(data, (str, bytes)) else orjson.dumps(data)
+                response = requests.request(method, url, data=body, headers=json_headers)
+            else:
+                raise ValueError(f"Unsupported request type: {request_type}")
+
+            span.set_attribute("http.response.status_code", response.status_code)
+            response.raise_for_status()
+            return response
+
+        except requests.HTTPError as e:
+            logger.error(f"HTTP error occurred: {str(e)}")
+            raise
+        except requests.RequestException as e:
+            logger.error(f"Error occurred: {str(e)}")
+            raise
+        except ValueError as e:
+            logger.error(str(e))
+            raise
 
 
 def safe_request(*, request_type, url, data, headers=None):
@@ -108,9 +116,40 @@ def construct_docu_info_in_text(document) -> str:
     return doc_info
 
 
+def metadata_url(document_uuid: str, generation: Optional[str] = None) -> str:
+    """PATCH URL of an artefact's metadata, refused with 409 once the document is uploaded again if `generation` is given."""
+    url = config.API_URL + f"/api/v1/artefact/metadata/{document_uuid}"
+    return f"{url}?generation={generation}" if generation else url
+
+
 def get_document(document_uuid: str) -> dict:
+    return orjson.loads(get_document_response(document_uuid=document_uuid).content)
+
+
+def get_document_response(document_uuid: str) -> requests.Response:
+    """Fetch the artefact without decoding it, for callers that forward the JSON body as is."""
     return safe_request(
         request_type="GET",
         url=f"{config.API_URL}/api/v1/artefact/{document_uuid}",
         data={},
-    ).json()
+    )
+
+
+def summary_metadata(data: dict) -> dict:
+    """Artefact columns of a smart summary completion."""
+    ai_is_expired = False
+    ai_expires = None
+    document_expires_str = data["document_expires"]
+    if document_expires_str:
+        document_expires = datetime.datetime.fromisoformat(document_expires_str)
+        ai_expires = document_expires.isoformat()
+        ai_is_expired = data["is_expired"]
+
+    return {
+        "ai_category": data["top_category"],
+        "ai_sub_category": data["sub_category"],
+        "ai_summary_short": data["summary_short"],
+        "ai_summary_long": data["summary_long"],
+        "ai_expires": ai_expires,
+        "ai_is_expired": ai_is_expired
+    }
@@ -0,0 +1,143 @@
+import io
+import logging
+import multiprocessing
+import os
+import re
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from backend import config
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("auto", "pdftotext", "pdfminer")
+
+
+def count_pages(file_path: Path) -> int:
+    """Number of pages, from poppler's pdfinfo when installed, pdfminer otherwise."""
+    try:
+        result = subprocess.run(["pdfinfo", str(file_path)], capture_output=True, check=True, timeout=60)
+        match = re.search(rb"^Pages:\s+(\d+)", result.stdout, re.MULTILINE)
+        if match:
+            return int(match.group(1))
+    except (OSError, subprocess.SubprocessError):
+        pass
+
+    from pdfminer.pdfpage import PDFPage
+    with open(file_path, "rb") as fp:
+        return sum(1 for _ in PDFPage.get_pages(fp))
+
+
+def pdftotext_pages(file_path: Path, first: int, last: int) -> Optional[List[str]]:
+    """Text of pages first..last (1-based, inclusive) from poppler's pdftotext, None when it is unavailable or fails."""
+    try:
+        result = subprocess.run(
+            ["pdftotext", "-f", str(first), "-l", str(last), "-enc", "UTF-8", str(file_path), "-"],
+            capture_output=True,
+            check=True,
+            timeout=config.EXTRACTION_TIME_LIMIT,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug(f"pdftotext failed on {file_path} pages {first}-{last}: {e}")
+        return None
+
+    # pdftotext ends every page with a form feed
+    pages = result.stdout.decode("utf-8", errors="replace").split("\f")
+    expected = last - first + 1
+    if len(pages) < expected:
+        return None
+    return pages[:expected]
+
+
+def pdfminer_pages(file_path: Path, first: int, last: int) -> List[str]:
+    """Text of pages first..last (1-based, inclusive) from pdfminer, the document is parsed once for the range."""
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    resource_manager = PDFResourceManager(caching=True)
+    pages = []
+    with open(file_path, "rb") as fp:
+        for page in PDFPage.get_pages(fp, pagenos=set(range(first - 1, last))):
+            output = io.StringIO()
+            device = TextConverter(resource_manager, output, laparams=LAParams())
+            PDFPageInterpreter(resource_manager, device).process_page(page)
+            device.close()
+            pages.append(output.getvalue())
+    return pages
+
+
+def extract_page_range(file_path: Path, first: int, last: int, engine: str = "auto") -> List[str]:
+    """
+    Text of pages first..last with the given engine.
+
+    `auto` tries pdftotext first and falls back to pdfminer for the whole range when pdftotext is
+    missing or fails, and for single pages where pdftotext found no text.
+    """
+    if engine == "pdfminer":
+        return pdfminer_pages(file_path, first, last)
+
+    pages = pdftotext_pages(file_path, first, last)
+    if engine == "pdftotext":
+        if pages is None:
+            raise RuntimeError(f"pdftotext could not extract pages {first}-{last} of {file_path}")
+        return pages
+    if pages is None:
+        return pdfminer_pages(file_path, first, last)
+
+    for index, text in enumerate(pages):
+        if not text.strip():
+            retry = pdfminer_pages(file_path, first + index, first + index)
+            pages[index] = retry[0] if retry else text
+    return pages
+
+
+def _extract_job(job: tuple) -> List[str]:
+    return extract_page_range(*job)
+
+
+def _map_in_processes(jobs: List[tuple], workers: int) -> Iterator[List[str]]:
+    # Results come back in job order, each as soon as it and the jobs before it are done
+    if multiprocessing.current_process().daemon:
+        # Celery prefork children are daemonic, multiprocessing refuses to fork from them but billiard does not
+        from billiard.pool import Pool
+
+        pool = Pool(workers)
+        try:
+            yield from pool.imap(_extract_job, jobs)
+        finally:
+            pool.terminate()
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        yield from executor.map(_extract_job, jobs)
+    finally:
+        # Do not wait for the remaining ranges when the consumer stops early or a time limit hits
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_pdf_pages(file_path: Path, engine: str = None, workers: int = None, pages_per_chunk: int = None) -> Iterator[str]:
+    """Yield the text of every page in order, extracting ranges of `pages_per_chunk` pages in parallel processes."""
+    engine = engine or config.PDF_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Unsupported PDF engine: {engine}, expected one of {', '.join(ENGINES)}")
+    # Every extraction worker process runs its own pool, together they stay within the CPU count
+    workers = workers or config.PDF_WORKERS or max(1, (os.cpu_count() or 1) // max(config.EXTRACTION_WORKERS, 1))
+    pages_per_chunk = pages_per_chunk or config.PDF_PAGES_PER_CHUNK
+
+    page_count = count_pages(file_path)
+    jobs = [
+        (file_path, first, min(first + pages_per_chunk - 1, page_count), engine)
+        for first in range(1, page_count + 1, pages_per_chunk)
+    ]
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield from extract_page_range(*job)
+        return
+
+    for pages in _map_in_processes(jobs, min(workers, len(jobs))):
+        yield from pages
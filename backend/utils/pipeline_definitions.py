@@ -0,0 +1,160 @@
+"""
+Analysis pipelines defined as data, in PIPELINES_PATH (prompts/pipelines.json by default).
+
+A pipeline is a set of named stages per analysis mode. A stage either runs a prompt of prompts.json or an
+action of the analysis worker, once all stages it runs `after` have completed. Prompt stages declare:
+
+- `inputs`: the prompt placeholders (document_text, document_extra1..3) as templates of document columns and
+  {stage_input} (the document text within the stage's context budget), {today} and {legacy_schemas}
+- `outputs`: artefact columns and the completion field each is taken from, `message` for plain-text prompts
+  (parsed as JSON with `parse_message`), and `output_mappers` turning the completion into several columns
+- `inject_date`, `output_language` (instead of the document's), `context_budget` (STAGE_BUDGETS entry, the stage name by default)
+
+Every stage may set `max_retries` (10 by default).
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import orjson
+
+from backend import config
+from backend.utils.fused_analysis import fusion_enabled
+
+# The pipeline of analysis modes listed in FUSED_ANALYSIS_MODES
+FUSED_PIPELINE = "fused"
+
+STAGE_NAME = re.compile(r"^[a-z][a-z0-9_]*$")
+# {name} in an input template, JSON braces and other text are left alone
+TEMPLATE_VARIABLE = re.compile(r"\{([a-z_][a-z0-9_]*)\}")
+STAGE_INPUT = "stage_input"
+PLACEHOLDERS = ("document_text", "document_extra1", "document_extra2", "document_extra3")
+DEFAULT_MAX_RETRIES = 10
+
+
+class Stage(NamedTuple):
+    name: str
+    after: Tuple[str, ...] = ()
+    prompt: Optional[str] = None
+    action: Optional[str] = None
+    inputs: Dict[str, str] = {}
+    inject_date: bool = False
+    output_language: Optional[str] = None
+    context_budget: Optional[str] = None
+    outputs: Dict[str, str] = {}
+    output_mappers: Tuple[str, ...] = ()
+    parse_message: bool = False
+    max_retries: int = DEFAULT_MAX_RETRIES
+
+
+class Pipeline(NamedTuple):
+    name: str
+    stages: Dict[str, Stage]
+
+    def entry_stages(self) -> List[str]:
+        """Stages that start the pipeline, they depend on nothing."""
+        return [name for name, stage in self.stages.items() if not stage.after]
+
+    def ready_stages(self, completed, just_completed: str) -> List[str]:
+        """Stages waiting on `just_completed` whose dependencies are all in `completed`."""
+        return [
+            name for name, stage in self.stages.items()
+            if just_completed in stage.after and name not in completed and all(dependency in completed for dependency in stage.after)
+        ]
+
+    def critical_path(self, seconds: Dict[str, float]) -> float:
+        """Seconds from the first stage to the last, with stages taking `seconds` each (0 when missing) and independent ones in parallel."""
+        finished = {}
+
+        def finish(name: str) -> float:
+            if name not in finished:
+                stage = self.stages[name]
+                finished[name] = max((finish(dependency) for dependency in stage.after), default=0.0) + seconds.get(name, 0.0)
+            return finished[name]
+
+        return max((finish(name) for name in self.stages), default=0.0)
+
+
+def template_names(template: str) -> List[str]:
+    return TEMPLATE_VARIABLE.findall(template)
+
+
+def render_template(template: str, variables: Dict[str, str]) -> str:
+    def substitute(match) -> str:
+        if match.group(1) not in variables:
+            raise ValueError(f"Unknown variable {{{match.group(1)}}} in stage input {template!r}")
+        return variables[match.group(1)]
+
+    return TEMPLATE_VARIABLE.sub(substitute, template)
+
+
+def parse_stage(name: str, spec: dict) -> Stage:
+    if not STAGE_NAME.match(name):
+        raise ValueError(f"Invalid stage name {name!r}, use lowercase letters, digits and underscores")
+    if bool(spec.get("prompt")) == bool(spec.get("action")):
+        raise ValueError(f"Stage {name} needs either a prompt or an action")
+    unknown = set(spec.get("inputs", {})) - set(PLACEHOLDERS)
+    if unknown:
+        raise ValueError(f"Stage {name} has unknown inputs {sorted(unknown)}, the placeholders are {PLACEHOLDERS}")
+    return Stage(
+        name=name,
+        after=tuple(spec.get("after", ())),
+        prompt=spec.get("prompt"),
+        action=spec.get("action"),
+        inputs=dict(spec.get("inputs", {})),
+        inject_date=bool(spec.get("inject_date", False)),
+        output_language=spec.get("output_language"),
+        context_budget=spec.get("context_budget", name),
+        outputs=dict(spec.get("outputs", {})),
+        output_mappers=tuple(spec.get("output_mappers", ())),
+        parse_message=bool(spec.get("parse_message", False)),
+        max_retries=int(spec.get("max_retries", DEFAULT_MAX_RETRIES)),
+    )
+
+
+def parse_pipeline(name: str, spec: dict) -> Pipeline:
+    """A pipeline definition, checked for unknown dependencies and cycles."""
+    stages = {stage_name: parse_stage(stage_name, stage_spec) for stage_name, stage_spec in spec.items()}
+    if not stages:
+        raise ValueError(f"Pipeline {name} has no stages")
+    for stage in stages.values():
+        missing = [dependency for dependency in stage.after if dependency not in stages]
+        if missing:
+            raise ValueError(f"Stage {stage.name} of pipeline {name} runs after unknown stages {missing}")
+
+    # Depth-first search, a stage met again while its dependencies are visited closes a cycle
+    visiting, visited = set(), set()
+
+    def visit(stage_name: str) -> None:
+        if stage_name in visited:
+            return
+        if stage_name in visiting:
+            raise ValueError(f"Pipeline {name} has a dependency cycle through {stage_name}")
+        visiting.add(stage_name)
+        for dependency in stages[stage_name].after:
+            visit(dependency)
+        visiting.discard(stage_name)
+        visited.add(stage_name)
+
+    for stage_name in stages:
+        visit(stage_name)
+    return Pipeline(name, stages)
+
+
+@lru_cache(maxsize=None)
+def load_pipelines(path: Optional[str] = None) -> Dict[str, Pipeline]:
+    with open(path or config.PIPELINES_PATH, "rb") as f:
+        definitions = orjson.loads(f.read())
+    return {name: parse_pipeline(name, spec) for name, spec in definitions.items()}
+
+
+def pipeline_name(ai_analysis_mode: str) -> str:
+    """Name of the pipeline documents of this analysis mode go through."""
+    return FUSED_PIPELINE if fusion_enabled(ai_analysis_mode) else ai_analysis_mode
+
+
+def get_pipeline(name: str) -> Pipeline:
+    pipelines = load_pipelines()
+    if name not in pipelines:
+        raise ValueError(f"No pipeline {name!r} in {config.PIPELINES_PATH}")
+    return pipelines[name]
@@ -0,0 +1,82 @@
+"""Queue wait and run time of pipeline stages, from the events of the pipeline_events table."""
+import math
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Events of one task recorded in the same instant happen in this order
+EVENT_ORDER = {"enqueued": 0, "started": 1, "retried": 2, "failed": 3, "finished": 4}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linearly interpolated percentile of sorted `values`."""
+    rank = (len(values) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def distribution(values: List[float]) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {"count": len(values), **{f"p{q}": round(percentile(values, q), 4) for q in PERCENTILES}, "max": round(values[-1], 4)}
+
+
+def task_runs(events: List[dict]) -> List[dict]:
+    """
+    One record per run of a task: its stage, customer, queue wait and run time in seconds, retried and failed flags.
+
+    A retry is published again under the same task id, each run waits from its own enqueue. Waits and run
+    times whose other end lies outside the events are None.
+    """
+    by_task = defaultdict(list)
+    for event in events:
+        by_task[event["task_id"]].append(event)
+
+    runs = []
+    for task_events in by_task.values():
+        task_events.sort(key=lambda e: (e["occurred_at"], EVENT_ORDER[e["event"]]))
+        customer_id = next((e["customer_id"] for e in task_events if e.get("customer_id")), None)
+        enqueued_at: Optional[object] = None
+        run = None
+        for event in task_events:
+            kind, at = event["event"], event["occurred_at"]
+            if kind == "enqueued":
+                enqueued_at = at
+            elif kind == "started":
+                # Clocks of the API and worker hosts may disagree by a little
+                queue_wait = max((at - enqueued_at).total_seconds(), 0.0) if enqueued_at else None
+                run = {"stage": event["stage"], "customer_id": customer_id, "started_at": at, "queue_wait": queue_wait,
+                       "run_time": None, "retried": False, "failed": False}
+                runs.append(run)
+                enqueued_at = None
+            elif run is not None:
+                if kind == "finished" and run["run_time"] is None:
+                    run["run_time"] = (at - run["started_at"]).total_seconds()
+                elif kind in ("retried", "failed"):
+                    run[kind] = True
+    return runs
+
+
+def summarize(runs: List[dict], key: str) -> Dict[str, dict]:
+    """Runs, retries, failures and the queue wait and run time percentiles of the runs grouped by `key`."""
+    groups = defaultdict(list)
+    for run in runs:
+        if run[key] is not None:
+            groups[run[key]].append(run)
+    return {
+        name: {
+            "runs": len(group),
+            "retried": sum(run["retried"] for run in group),
+            "failed": sum(run["failed"] for run in group),
+            "queue_wait": distribution([run["queue_wait"] for run in group if run["queue_wait"] is not None]),
+            "run_time": distribution([run["run_time"] for run in group if run["run_time"] is not None]),
+        }
+        for name, group in sorted(groups.items())
+    }
+
+
+def stage_seconds(runs: List[dict]) -> Dict[str, float]:
+    """Queue wait plus run time of the last run of every stage, the runs of one document in start order."""
+    return {run["stage"]: round((run["queue_wait"] or 0.0) + (run["run_time"] or 0.0), 4) for run in runs}
@@ -2,6 +2,15 @@ import datetime
 import json
 import logging
 
+import orjson
+from opentelemetry import trace
+
+from backend import config
+from backend.core import tracing
+from backend.llm.client import completion_stage
+from backend.llm.routing import escalate_model, route_model, schema_errors
+from backend.utils.text_compaction import count_tokens
+
 logging.basicConfig(level=logging.INFO)
 
 logger = logging.getLogger(__name__)
@@ -15,6 +24,7 @@ def load_prompts() -> dict:
     return prompts
 
 
+@tracing.tracer.start_as_current_span("llm completion")
 def run_ai_completition(
         ai_client,
         prompt: dict,
@@ -23,11 +33,17 @@ def run_ai_completition(
         document_extra2=None,
         document_extra3=None,
         output_language="Czech",
-        inject_date=False
+        inject_date=False,
+        stage=None,
+        ai_analysis_mode=None
         ):
     """
     Generate a smart summary for the given prompt text using the loaded template.
+
+    The deployment is routed by input size, `stage` and `ai_analysis_mode` when MODEL_LADDER is set.
     """
+    span = trace.get_current_span()
+    span.update_name(f"llm {stage or 'completion'}")
     system_content = prompt["messages"][0]["content"].replace("{output_language}", output_language)
     user_template = prompt["messages"][1]["content"]
 
@@ -47,36 +63,69 @@ def run_ai_completition(
         date_to_prompt = "Today is " + str(datetime.datetime.now().date())
         user_content = date_to_prompt + ". " + user_content
 
-    if "schema" in prompt:
-        response = ai_client.chat.completions.create(
-            model=prompt["model"],
-            temperature=prompt["temperature"],
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": user_content}
-            ],
-            response_format=prompt["schema"]
-        )
+    messages = [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": user_content}
+    ]
+    model = route_model(prompt["model"], count_tokens(system_content + user_content), stage=stage, ai_analysis_mode=ai_analysis_mode)
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+    while True:
+        with completion_stage(stage):
+            if "schema" in prompt:
+                response = ai_client.chat.completions.create(
+                    model=model,
+                    temperature=prompt["temperature"],
+                    messages=messages,
+                    response_format=prompt["schema"]
+                )
+            else:
+                response = ai_client.chat.completions.create(
+                    model=model,
+                    temperature=prompt["temperature"],
+                    messages=messages
+                )
+        usage["prompt_tokens"] += response.usage.prompt_tokens
+        usage["completion_tokens"] += response.usage.completion_tokens
+        usage["total_tokens"] += response.usage.total_tokens
+
+        if "schema" not in prompt:
+            data = {"message": response.choices[0].message.content}
+            break
+
         message = response.choices[0].message
-        data = json.loads(message.content)
-    else:
-        response = ai_client.chat.completions.create(
-            model=prompt["model"],
-            temperature=prompt["temperature"],
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": user_content}
-            ]
-        )
-        message = response.choices[0].message.content
-        data = {"message": message}
-
-    usage = {
-        "prompt_tokens": response.usage.prompt_tokens,
-        "completion_tokens": response.usage.completion_tokens,
-        "total_tokens": response.usage.total_tokens
-    }
+        try:
+            data = orjson.loads(message.content)
+        except orjson.JSONDecodeError as e:
+            if not config.MODEL_LADDER:
+                raise
+            data, errors = None, [f"invalid JSON: {e}"]
+        else:
+            errors = schema_errors(data, prompt["schema"]["json_schema"]["schema"])
+        if not errors:
+            break
+        if not config.MODEL_LADDER:
+            # Without routing the output is used as it comes, as before the schema was checked; JSON that is
+            # not an object comes back as the message, like the output of a prompt without schema
+            logger.warning(f"Structured output of {model} does not match the schema: {'; '.join(errors[:5])}")
+            if not isinstance(data, dict):
+                data = {"message": message.content}
+            break
+        # Smaller deployments occasionally break the schema, retry one rung up the ladder
+        larger_model = escalate_model(model)
+        if larger_model is None:
+            raise ValueError(f"Structured output of {model} does not match the schema: {'; '.join(errors[:5])}")
+        logger.warning(f"Structured output of {model} does not match the schema ({'; '.join(errors[:3])}), escalating to {larger_model}")
+        model = larger_model
+
     data["usage"] = usage
-    logger.info(f"Token usage - prompt: {usage['prompt_tokens']}, completion: {usage['completion_tokens']}, total: {usage['total_tokens']}")
+    data["model"] = model
+    span.set_attributes({
+        "llm.prompt": stage or "completion",
+        "llm.model": model,
+        "llm.prompt_tokens": usage["prompt_tokens"],
+        "llm.completion_tokens": usage["completion_tokens"],
+    })
+    logger.info(f"Token usage ({model}) - prompt: {usage['prompt_tokens']}, completion: {usage['completion_tokens']}, total: {usage['total_tokens']}")
 
     return data
@@ -0,0 +1,140 @@
+import logging
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import List, NamedTuple, Tuple
+
+from backend import config
+
+logger = logging.getLogger(__name__)
+
+PAGE_BREAK = "\f"
+# Lines at the top and bottom of a page where running headers, footers and page numbers live
+EDGE_LINES = 3
+# Repeated lines shorter than this are only dropped from page edges, table cells like "N/A" stay
+MIN_BOILERPLATE_LENGTH = 40
+
+PAGE_NUMBER = re.compile(r"^\W*(?:page|p\.|seite|strana)?\s*\d{1,4}(?:\s*(?:of|/|z|von)\s*\d{1,4})?\W*$", re.IGNORECASE)
+DIGITS = re.compile(r"\d+")
+INLINE_WHITESPACE = re.compile(r"[ \t\u00a0\u2000-\u200b\u3000]+")
+LEADERS = re.compile(r"([.\-_=·…])\1{3,}")
+RULE = re.compile(r"^[\s.\-_=·…|+*~]*$")
+
+
+class CompactionResult(NamedTuple):
+    text: str
+    tokens_before: int
+    tokens_after: int
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    import tiktoken
+
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken encoding unavailable, estimating tokens from characters: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens of the text in cl100k_base, roughly 4 characters per token when the encoding cannot be loaded."""
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The text cut after `max_tokens` tokens."""
+    encoding = _encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def _normalize_line(line: str) -> str:
+    if RULE.match(line):
+        return ""
+    return INLINE_WHITESPACE.sub(" ", LEADERS.sub(" ", line)).strip()
+
+
+def _fingerprint(line: str) -> str:
+    # Running headers often differ only in a number (page, date, section)
+    return DIGITS.sub("#", line.lower())
+
+
+def _edges(lines: List[str]) -> set:
+    """Indexes of the first and last EDGE_LINES non-empty lines of a page."""
+    content = [index for index, line in enumerate(lines) if line]
+    return set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+
+
+def _repeated_lines(pages: List[List[str]]) -> Tuple[set, set]:
+    """
+    Lines repeated often enough to be headers, footers or boilerplate.
+
+    Returns fingerprints of page edge lines on enough pages (running headers differ only in a number)
+    and exact long lines repeated anywhere (disclaimers).
+    """
+    if len(pages) == 1:
+        # Without page breaks only long lines repeated verbatim count, e.g. disclaimers pasted under every section
+        counts = Counter(line for line in pages[0] if len(line) >= MIN_BOILERPLATE_LENGTH)
+        return set(), {line for line, count in counts.items() if count >= config.COMPACTION_MIN_REPEATS}
+
+    min_pages = max(2, round(len(pages) * config.COMPACTION_REPEAT_RATIO))
+    edge_counts, body_counts = Counter(), Counter()
+    for lines in pages:
+        edge_counts.update({_fingerprint(lines[index]) for index in _edges(lines)})
+        body_counts.update({line for line in lines if len(line) >= MIN_BOILERPLATE_LENGTH})
+    return (
+        {fingerprint for fingerprint, count in edge_counts.items() if count >= min_pages},
+        {line for line, count in body_counts.items() if count >= min_pages},
+    )
+
+
+def compact_text(text: str) -> str:
+    """
+    Shrink extracted text before it is sent to the model.
+
+    Lines repeated across pages (running headers, footers, disclaimers) are kept only where they first
+    appear, standalone page numbers are dropped, whitespace, dot leaders and table rules collapse to
+    single spaces and runs of blank lines to one blank line, so paragraphs stay apart.
+    """
+    pages = [[_normalize_line(line) for line in page.splitlines()] for page in text.split(PAGE_BREAK)]
+    repeated_edges, repeated_lines = _repeated_lines(pages)
+    paged = len(pages) > 1
+
+    seen = set()
+    output = []
+    for lines in pages:
+        edges = _edges(lines) if paged else set()
+        for index, line in enumerate(lines):
+            if index in edges:
+                if PAGE_NUMBER.match(line):
+                    continue
+                key = _fingerprint(line)
+                repeated = key in repeated_edges
+            else:
+                key = line
+                repeated = line in repeated_lines
+            if repeated:
+                if key in seen:
+                    continue
+                seen.add(key)
+            if line or (output and output[-1]):
+                output.append(line)
+        if output and output[-1]:
+            output.append("")
+    return "\n".join(output).strip()
+
+
+def compaction_enabled(ai_analysis_mode: str) -> bool:
+    return ai_analysis_mode in config.COMPACTION_MODES
+
+
+def compact_document_text(text: str) -> CompactionResult:
+    """Compact the text and count its tokens before and after."""
+    compacted = compact_text(text)
+    return CompactionResult(text=compacted, tokens_before=count_tokens(text), tokens_after=count_tokens(compacted))
@@ -0,0 +1,68 @@
+"""Tokens the analysis of a document will spend, estimated from its file size or from its extracted text."""
+import os
+from functools import lru_cache
+from typing import Dict, List, Set
+
+from backend import config
+from backend.utils.context_budget import STAGE_BUDGETS, legacy_schemas
+from backend.utils.extract_text import IMAGE_EXTENSIONS
+from backend.utils.fused_analysis import fused_prompt
+from backend.utils.pipeline_definitions import (STAGE_INPUT, Stage,
+                                                get_pipeline, pipeline_name,
+                                                template_names)
+from backend.utils.prompt_generators import load_prompts
+from backend.utils.text_compaction import count_tokens
+
+# File bytes per token of extracted text by extension, rough averages. Compressed and layout-heavy formats
+# carry many bytes per word, images are read by the LLM for about a thousand tokens whatever their size
+BYTES_PER_TOKEN = {".txt": 4, ".md": 4, ".rtf": 8, ".docx": 12, ".odt": 12, ".doc": 16, ".pdf": 24}
+IMAGE_TOKENS = 1000
+DEFAULT_BYTES_PER_TOKEN = 16
+
+
+def document_tokens_from_size(filename: str, file_size: int) -> int:
+    """Tokens of text a file of this type and size is expected to extract to, before it is extracted."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return IMAGE_TOKENS
+    return file_size // BYTES_PER_TOKEN.get(extension, DEFAULT_BYTES_PER_TOKEN)
+
+
+def analysis_stages(ai_analysis_mode: str) -> List[Stage]:
+    """LLM stages of the pipeline a document of this mode goes through."""
+    return [stage for stage in get_pipeline(pipeline_name(ai_analysis_mode)).stages.values() if stage.prompt]
+
+
+def stage_variables(stage: Stage) -> Set[str]:
+    return {name for template in stage.inputs.values() for name in template_names(template)}
+
+
+@lru_cache(maxsize=None)
+def prompt_tokens(pipeline: str, stage: str) -> int:
+    """Tokens of a stage's prompt and response format, without the document."""
+    spec = get_pipeline(pipeline).stages[stage]
+    prompts = load_prompts()
+    prompt = fused_prompt(prompts) if spec.prompt == "fused_analysis" else prompts[spec.prompt]
+    tokens = count_tokens(str(prompt["messages"])) + count_tokens(str(prompt.get("schema", "")))
+    if "legacy_schemas" in stage_variables(spec):
+        tokens += count_tokens(legacy_schemas())
+    return tokens
+
+
+def estimate_analysis_tokens(document_tokens: int, ai_analysis_mode: str) -> Dict[str, int]:
+    """
+    Prompt and completion tokens per stage for a document of `document_tokens` tokens.
+
+    Stages reading {stage_input} get at most their context budget of the document, the others
+    (features_and_insights reads the analysis criteria) an earlier output counted as one completion.
+    """
+    pipeline = pipeline_name(ai_analysis_mode)
+    estimate = {}
+    for stage in analysis_stages(ai_analysis_mode):
+        budget = STAGE_BUDGETS.get(stage.context_budget)
+        if STAGE_INPUT in stage_variables(stage):
+            document_input = min(document_tokens, budget.max_tokens) if budget else document_tokens
+        else:
+            document_input = config.ESTIMATED_COMPLETION_TOKENS
+        estimate[stage.name] = prompt_tokens(pipeline, stage.name) + document_input + config.ESTIMATED_COMPLETION_TOKENS
+    return estimate
@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import tempfile
+from typing import BinaryIO, NamedTuple
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from backend import config
+
+logger = logging.getLogger(__name__)
+
+
+class FileTooLargeError(ValueError):
+    """The uploaded or downloaded file exceeds MAX_UPLOAD_SIZE."""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"File exceeds the maximum allowed size of {max_size} bytes")
+        self.max_size = max_size
+
+
+class FileDigest(NamedTuple):
+    sha256: str
+    size: int
+
+
+class StoredFile(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+
+
+def _open_temp_file(dest_path: str) -> BinaryIO:
+    # The temporary file lives next to its destination so the final os.replace() is an atomic rename
+    dest_dir = os.path.dirname(dest_path)
+    os.makedirs(dest_dir, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=dest_dir, prefix=".upload-", delete=False)
+
+
+def _write_chunk(buffer: BinaryIO, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    buffer.write(chunk)
+
+
+def _commit_temp_file(buffer: BinaryIO, dest_path: str) -> None:
+    buffer.flush()
+    os.fsync(buffer.fileno())
+    buffer.close()
+    os.replace(buffer.name, dest_path)
+
+
+def _discard_temp_file(buffer: BinaryIO) -> None:
+    buffer.close()
+    if os.path.exists(buffer.name):
+        os.remove(buffer.name)
+
+
+async def save_upload_file(upload: UploadFile, dest_path: str, max_size: int = None,
+                           chunk_size: int = None) -> StoredFile:
+    """
+    Stream an UploadFile to `dest_path` in chunks, hashing it on the way.
+
+    The file is written to a temporary file and atomically moved into place, so readers never
+    see a partially written document. Blocking file I/O runs in the threadpool.
+    """
+    max_size = max_size or config.MAX_UPLOAD_SIZE
+    chunk_size = chunk_size or config.UPLOAD_CHUNK_SIZE
+    if upload.size is not None and upload.size > max_size:
+        raise FileTooLargeError(max_size)
+
+    hasher = hashlib.sha256()
+    size = 0
+    buffer = await run_in_threadpool(_open_temp_file, dest_path)
+    try:
+        while chunk := await upload.read(chunk_size):
+            size += len(chunk)
+            if size > max_size:
+                raise FileTooLargeError(max_size)
+            await run_in_threadpool(_write_chunk, buffer, hasher, chunk)
+        await run_in_threadpool(_commit_temp_file, buffer, dest_path)
+    except BaseException:
+        await run_in_threadpool(_discard_temp_file, buffer)
+        raise
+
+    return StoredFile(path=dest_path, sha256=hasher.hexdigest(), size=size)
+
+
+async def hash_upload_file(upload: UploadFile, max_size: int = None, chunk_size: int = None) -> FileDigest:
+    """
+    Hash an UploadFile without writing it anywhere, then rewind it.
+
+    Starlette has already spooled the upload, so this lets duplicates be detected before any write.
+    """
+    max_size = max_size or config.MAX_UPLOAD_SIZE
+    chunk_size = chunk_size or config.UPLOAD_CHUNK_SIZE
+    if upload.size is not None and upload.size > max_size:
+        raise FileTooLargeError(max_size)
+
+    hasher = hashlib.sha256()
+    size = 0
+    while chunk := await upload.read(chunk_size):
+        size += len(chunk)
+        if size > max_size:
+            raise FileTooLargeError(max_size)
+        await run_in_threadpool(hasher.update, chunk)
+    await upload.seek(0)
+    return FileDigest(sha256=hasher.hexdigest(), size=size)
+
+
+def copy_stream_to_file(reader: BinaryIO, dest_path: str, max_size: int = None, chunk_size: int = None) -> StoredFile:
+    """
+    Copy a readable binary stream (archive member, GCS reader, ...) to `dest_path` in chunks, hashing it on the way.
+
+    Blocking, run it in a thread. Written through a temporary file like save_upload_file().
+    """
+    max_size = max_size or config.MAX_UPLOAD_SIZE
+    chunk_size = chunk_size or config.UPLOAD_CHUNK_SIZE
+
+    hasher = hashlib.sha256()
+    size = 0
+    buffer = _open_temp_file(dest_path)
+    try:
+        while chunk := reader.read(chunk_size):
+            size += len(chunk)
+            if size > max_size:
+                raise FileTooLargeError(max_size)
+            _write_chunk(buffer, hasher, chunk)
+        _commit_temp_file(buffer, dest_path)
+    except BaseException:
+        _discard_temp_file(buffer)
+        raise
+
+    return StoredFile(path=dest_path, sha256=hasher.hexdigest(), size=size)
+
+
+def hash_file(file_path: str, chunk_size: int = None) -> FileDigest:
+    """sha256 and size of a file on disk, read in chunks."""
+    chunk_size = chunk_size or config.UPLOAD_CHUNK_SIZE
+    hasher = hashlib.sha256()
+    size = 0
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            size += len(chunk)
+            hasher.update(chunk)
+    return FileDigest(sha256=hasher.hexdigest(), size=size)
+
+
+def download_gcs_file(gcs_client, bucket_name: str, blob_path: str, dest_path: str,
+                      max_size: int = None, chunk_size: int = None) -> StoredFile:
+    """
+    Stream a GCS object to `dest_path` in chunks, hashing it on the way. Blocking, run it in a thread.
+
+    The object size is checked from its metadata before any byte is downloaded.
+    """
+    max_size = max_size or config.MAX_UPLOAD_SIZE
+    chunk_size = chunk_size or config.UPLOAD_CHUNK_SIZE
+
+    blob = gcs_client.bucket(bucket_name).get_blob(blob_path)
+    if blob is None:
+        raise FileNotFoundError(f"gs://{bucket_name}/{blob_path} does not exist")
+    if blob.size is not None and blob.size > max_size:
+        raise FileTooLargeError(max_size)
+
+    with blob.open("rb", chunk_size=chunk_size) as reader:
+        stored = copy_stream_to_file(reader, dest_path, max_size=max_size, chunk_size=chunk_size)
+
+    logger.info(f"Downloaded gs://{bucket_name}/{blob_path} ({stored.size} bytes)")
+    return stored
@@ -0,0 +1,99 @@
+"""
+Compare artefact serialization before and after the orjson/JSON1 fast path.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_artefact_serialization --raw-text-kb 2048 --items 500
+"""
+import argparse
+import json
+import random
+import string
+import timeit
+from datetime import datetime
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from backend.db.schemas.artefacts_schemas import ARTEFACT_JSON_FIELDS, Artefact
+
+
+def build_row(raw_text_kb: int, items: int) -> dict:
+    """Build a `files` row as SQLite returns it, with JSON columns stored as text."""
+    rnd = random.Random(42)
+
+    def words(n):
+        return " ".join("".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(3, 10))) for _ in range(n))
+
+    alerts = [
+        {
+            "findings_title": words(4),
+            "findings_description": words(40),
+            "suggested_action": words(20),
+            "findings_type": rnd.choice(["alert", "action_required", "reminder", "insights_available"]),
+        }
+        for _ in range(items)
+    ]
+    features = [{"title": words(3), "description": words(30), "applicable": bool(i % 3)} for i in range(items)]
+    legacy = {"entities": [{"name": words(2), "fields": {words(1): words(5) for _ in range(8)}} for _ in range(items)]}
+    return {
+        "id": 1,
+        "uuid": "customer_document.pdf",
+        "customer_id": "customer",
+        "filename": "document.pdf",
+        "uploaded_at": datetime.utcnow().isoformat(),
+        "analysis_status": "processed",
+        "ai_summary_long": words(200),
+        "ai_analysis_criteria": words(300),
+        "ai_features_and_insights": json.dumps(features),
+        "ai_alerts_and_actions": json.dumps(alerts),
+        "ai_eterny_legacy_schema": json.dumps(legacy),
+        "document_raw_text": words(raw_text_kb * 1024 // 7),
+        "file_size": raw_text_kb * 1024,
+        "webhook_url": "http://localhost/webhook",
+    }
+
+
+def before(row: dict) -> bytes:
+    """Old path: stdlib json decoding, jsonable_encoder + JSONResponse, worker re-dump for the webhook."""
+    artefact_dict = dict(row)
+    for key in ARTEFACT_JSON_FIELDS:
+        artefact_dict[key] = json.loads(artefact_dict[key])
+    artefact = Artefact(**artefact_dict)
+    body = json.dumps(jsonable_encoder(artefact), ensure_ascii=False, separators=(",", ":")).encode()
+    # execute_webhook: requests .json(), json.dumps(document), then requests' json= dumps it again
+    document = json.loads(body)
+    return json.dumps(json.dumps(document)).encode()
+
+
+def after(row: dict) -> bytes:
+    """New path: orjson decoding once, pydantic serialization + ORJSONResponse, webhook forwards the body."""
+    artefact_dict = dict(row)
+    for key in ARTEFACT_JSON_FIELDS:
+        artefact_dict[key] = orjson.loads(artefact_dict[key])
+    artefact = Artefact(**artefact_dict)
+    body = orjson.dumps(artefact.model_dump(mode="json"))
+    assert orjson.loads(body)["webhook_url"]
+    return orjson.dumps(body.decode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--raw-text-kb", type=int, default=1024, help="Size of document_raw_text in KB")
+    parser.add_argument("--items", type=int, default=200, help="Number of items per JSON column")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    row = build_row(args.raw_text_kb, args.items)
+    assert orjson.loads(orjson.loads(before(row))) == orjson.loads(orjson.loads(after(row)))
+
+    results = {}
+    for name, fn in (("before", before), ("after", after)):
+        timings = timeit.repeat(lambda: fn(row), number=1, repeat=args.repeat)
+        results[name] = min(timings)
+        print(f"{name:>6}: best {min(timings) * 1000:8.2f} ms  median {sorted(timings)[len(timings) // 2] * 1000:8.2f} ms")
+    print(f"speedup: {results['before'] / results['after']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
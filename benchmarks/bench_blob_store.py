@@ -0,0 +1,134 @@
+"""
+Disk usage and bytes written for a corpus with duplicates: per-customer copies vs the blob store.
+
+Every customer uploads the same set of documents plus a few unique ones, which is what happens when
+one template contract is sent to many customers. The legacy layout writes each upload to its own
+path; the blob store hashes first, writes unseen content once and hardlinks the customer paths.
+
+    python -m benchmarks.bench_blob_store --customers 50 --documents 20 --unique 2
+    # against a GCS stand-in (e.g. fake-gcs-server from docker-compose)
+    STORAGE_EMULATOR_HOST=http://localhost:4443 python -m benchmarks.bench_blob_store --backend gcs
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from backend.blobstore.base import BlobStore
+from backend.db.storage import Storage
+from backend.db.storage.sqlite import SQLiteStorage
+
+
+def make_corpus(customers: int, documents: int, unique: int, size: int) -> dict:
+    shared = [os.urandom(size) for _ in range(documents)]
+    return {
+        f"customer_{c}": shared + [os.urandom(size) for _ in range(unique)]
+        for c in range(customers)
+    }
+
+
+def written_bytes() -> int:
+    # wchar counts every byte handed to write(), independent of page cache flushing
+    with open("/proc/self/io") as f:
+        for line in f:
+            if line.startswith("wchar:"):
+                return int(line.split()[1])
+    return 0
+
+
+def disk_usage(*roots: str) -> int:
+    seen = set()
+    total = 0
+    for root in roots:
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                st = os.lstat(os.path.join(dirpath, name))
+                if (st.st_dev, st.st_ino) not in seen:
+                    seen.add((st.st_dev, st.st_ino))
+                    total += st.st_blocks * 512
+    return total
+
+
+def write_file(path: str, content: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def store_legacy(upload_dir: str, corpus: dict) -> None:
+    for customer_id, documents in corpus.items():
+        for i, content in enumerate(documents):
+            write_file(os.path.join(upload_dir, customer_id, f"{i}.pdf"), content)
+
+
+def store_blobs(upload_dir: str, corpus: dict, storage: Storage, blob_store: BlobStore) -> None:
+    # Same sequence as the upload endpoint: hash, take a reference, write only unseen content, link
+    for customer_id, documents in corpus.items():
+        for i, content in enumerate(documents):
+            hash_sha256 = hashlib.sha256(content).hexdigest()
+            storage.acquire_blob(hash_sha256, len(content))
+            if not blob_store.exists(hash_sha256):
+                staged_path = blob_store.staging_path()
+                write_file(staged_path, content)
+                blob_store.ingest(hash_sha256, staged_path)
+            blob_store.link(hash_sha256, os.path.join(upload_dir, customer_id, f"{i}.pdf"))
+
+
+def measure(name: str, fn, *roots: str) -> None:
+    before = written_bytes()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    written = written_bytes() - before
+    print(f"  {name:<12} {elapsed:8.3f}s  written {written / 2**20:10.1f} MiB  on disk {disk_usage(*roots) / 2**20:10.1f} MiB")
+
+
+def create_store(backend: str, blob_dir: str, bucket: str) -> BlobStore:
+    if backend == "gcs":
+        from google.cloud import storage as gcs
+
+        from backend.blobstore.gcs import GCSBlobStore
+
+        client = gcs.Client()
+        if client.lookup_bucket(bucket) is None:
+            client.create_bucket(bucket)
+        return GCSBlobStore(blob_dir, bucket, prefix=f"bench-{os.getpid()}/", client=client)
+
+    from backend.blobstore.local import LocalBlobStore
+    return LocalBlobStore(blob_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["local", "gcs"], default="local")
+    parser.add_argument("--bucket", default="eternyiq-blobs-bench")
+    parser.add_argument("--customers", type=int, default=50)
+    parser.add_argument("--documents", type=int, default=20, help="Documents every customer uploads")
+    parser.add_argument("--unique", type=int, default=2, help="Documents only one customer uploads")
+    parser.add_argument("--size", type=int, default=256 * 1024, help="Document size in bytes")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.customers, args.documents, args.unique, args.size)
+    uploads = args.customers * (args.documents + args.unique)
+    distinct = args.documents + args.customers * args.unique
+    print(f"{uploads} uploads, {distinct} distinct documents of {args.size / 1024:.0f} KiB, blob store: {args.backend}")
+
+    tmp = tempfile.mkdtemp(prefix="bench-blobs-")
+    try:
+        legacy_dir = os.path.join(tmp, "legacy")
+        measure("legacy", lambda: store_legacy(legacy_dir, corpus), legacy_dir)
+
+        upload_dir = os.path.join(tmp, "uploads")
+        blob_dir = os.path.join(tmp, "blobs")
+        storage = SQLiteStorage(os.path.join(tmp, "bench.db"))
+        storage.init_schema()
+        blob_store = create_store(args.backend, blob_dir, args.bucket)
+        measure("blob store", lambda: store_blobs(upload_dir, corpus, storage, blob_store), upload_dir, blob_dir)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
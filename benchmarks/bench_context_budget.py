@@ -0,0 +1,54 @@
+"""
+Prompt input tokens per analysis stage with and without the context budgets.
+
+Documents are generated like in bench_text_compaction and compacted first, as the pipeline does.
+Without budgets every stage gets the full text, and the legacy schema stage also gets the whole
+prompts.json.
+
+    python -m benchmarks.bench_context_budget --pages 5 50 200
+"""
+import argparse
+
+from backend.utils.context_budget import (STAGE_BUDGETS, build_stage_input,
+                                          legacy_schemas)
+from backend.utils.text_compaction import compact_text, count_tokens
+from benchmarks.bench_text_compaction import make_text
+
+SUMMARY = "Residential lease between ACME Property Management Ltd. and the tenant, with deposit, renewal and termination terms."
+CRITERIA = "- Check the lease expiry and renewal notice deadlines\n- Check the deposit amount and payment due dates\n- Check termination penalties"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 50, 200])
+    args = parser.parse_args()
+
+    with open("prompts/prompts.json") as f:
+        full_schema_tokens = count_tokens(f.read())
+    schema_tokens = count_tokens(legacy_schemas())
+
+    for pages in args.pages:
+        document = {
+            "document_raw_text": compact_text(make_text(pages)[0]),
+            "ai_summary_long": SUMMARY,
+            "ai_analysis_criteria": CRITERIA,
+        }
+        raw_tokens = count_tokens(document["document_raw_text"])
+        print(f"{pages} page document, {raw_tokens} tokens")
+        before_total = after_total = 0
+        for stage, budget in STAGE_BUDGETS.items():
+            reserved = schema_tokens if stage == "map_eterny_legacy_schemas" else 0
+            stage_input = build_stage_input(stage, document, reserved_tokens=reserved)
+            before = raw_tokens + (full_schema_tokens if reserved else 0)
+            after = stage_input.tokens + reserved
+            assert after <= max(budget.max_tokens, reserved), f"{stage} input exceeds its budget"
+            if raw_tokens + reserved <= budget.max_tokens:
+                assert stage_input.source == "document_raw_text", f"{stage} dropped text that fits its budget"
+            before_total += before
+            after_total += after
+            print(f"  {stage:<28} {stage_input.source:<18} {before:>8} -> {after:>8} tokens")
+        print(f"  {'all stages':<28} {'':<18} {before_total:>8} -> {after_total:>8} tokens  {1 - after_total / before_total:6.1%} saved")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Extraction latency without and with the extracted text cache, plus its eviction and invalidation rules.
+
+Runs the extraction task body in-process on generated PDFs: a cold pass fills the cache, a warm pass
+(the retry / re-analysis / duplicate upload case) is served from it.
+
+    python -m benchmarks.bench_extraction_cache --pages 60 --documents 5
+"""
+import argparse
+import atexit
+import os
+import shutil
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix="bench-extraction-cache-")
+atexit.register(shutil.rmtree, TMP_DIR, ignore_errors=True)
+# Settings are read at import time, point them at the throw-away directory first
+os.environ.setdefault("EXTRACTION_CACHE_DIR", os.path.join(TMP_DIR, "cache"))
+os.environ.setdefault("RABBITMQ_BROKER", "memory://")
+os.environ.setdefault("REDIS_URL", "cache+memory://")
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "unused")
+
+from backend.utils import extraction_cache  # NoQA: E402
+from benchmarks.bench_pdf_engine import make_pdf  # NoQA: E402
+from workers.extraction_worker import extract_document_text  # NoQA: E402
+
+
+def timed(name: str, paths: list) -> list:
+    start = time.perf_counter()
+    texts = [extract_document_text(path) for path in paths]
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<24} {len(paths):>4} documents  {elapsed:8.3f}s  {elapsed / len(paths) * 1000:9.1f} ms/document")
+    return texts
+
+
+def check_rules() -> None:
+    cache = extraction_cache.ExtractionCache(os.path.join(TMP_DIR, "rules"), max_bytes=30)
+    cache.put("a" * 64, "pdf", "1", "x" * 10)
+    cache.put("b" * 64, "pdf", "1", "x" * 10)
+    cache.put("c" * 64, "docx", "1", "x" * 10)
+    assert cache.get("a" * 64, "pdf", "1") is not None
+    cache.put("d" * 64, "pdf", "1", "x" * 10)
+    assert cache.get("b" * 64, "pdf", "1") is None, "least recently used entry was not evicted"
+    assert cache.get("a" * 64, "pdf", "1") is not None
+
+    bumped = extraction_cache.ExtractionCache(cache.cache_dir, cache.max_bytes)
+    assert bumped.get("a" * 64, "pdf", "2") is None
+    assert bumped.get("c" * 64, "docx", "1") is not None, "version bump of one extractor invalidated another"
+    stats = bumped.stats()
+    assert stats["extractors"]["pdf"]["entries"] == 0 and stats["extractors"]["pdf"]["invalidations"] == 2
+    print("  LRU eviction and per-extractor invalidation OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--documents", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = []
+    for i in range(args.documents):
+        path = os.path.join(TMP_DIR, f"{i}.pdf")
+        make_pdf(path, args.pages + i)
+        paths.append(path)
+    print(f"{args.documents} documents of ~{args.pages} pages")
+
+    cold = timed("cold (extract + store)", paths)
+    warm = timed("warm (cache hit)", paths)
+    assert cold == warm, "cached text differs from the extracted text"
+    stats = extraction_cache.get_extraction_cache().stats()
+    print(f"  hits {stats['hits']}, misses {stats['misses']}, {stats['bytes'] / 1024:.0f} KiB cached")
+    check_rules()
+
+
+if __name__ == "__main__":
+    main()
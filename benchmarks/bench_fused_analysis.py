@@ -0,0 +1,164 @@
+"""
+Latency, tokens and output agreement of the fused analysis call vs the staged pipeline.
+
+For every document the four staged completions (smart summary, analysis criteria, features &
+insights, alerts & actions) run one after another like the workers chain them, then the single
+fused completion runs on the same input. Agreement compares the fused output against the staged
+one: category, expiry, and the overlap of criteria, features and alerts.
+
+Runs against the Azure OpenAI deployment configured in the environment. --fake swaps in a client
+that answers with schema-shaped placeholders after a simulated latency, to check the harness offline.
+
+    python -m benchmarks.bench_fused_analysis --documents contract1.txt lease.txt
+    python -m benchmarks.bench_fused_analysis --fake --pages 5 20
+"""
+import argparse
+import datetime
+import re
+import statistics
+import time
+from types import SimpleNamespace
+
+import orjson
+
+from backend.llm.providers.stub import TEXT_ANSWER, schema_instance
+from backend.utils.context_budget import build_stage_input
+from backend.utils.fused_analysis import fused_prompt
+from backend.utils.prompt_generators import load_prompts, run_ai_completition
+from backend.utils.text_compaction import compact_text, count_tokens
+from benchmarks.bench_text_compaction import make_text
+
+WORD = re.compile(r"\w{4,}")
+
+
+class FakeClient:
+    """Answers every completion with a placeholder instance of the requested schema."""
+
+    def __init__(self, seconds_per_call: float, seconds_per_1k_tokens: float):
+        self.seconds_per_call = seconds_per_call
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, temperature, messages, response_format=None, **kwargs):
+        prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+        if response_format:
+            content = orjson.dumps(schema_instance(response_format["json_schema"]["schema"])).decode()
+        else:
+            content = TEXT_ANSWER
+        completion_tokens = count_tokens(content)
+        time.sleep(self.seconds_per_call + (prompt_tokens + completion_tokens) / 1000 * self.seconds_per_1k_tokens)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens),
+        )
+
+
+def staged(client, prompts: dict, document: dict, output_language: str) -> tuple:
+    today = str(datetime.datetime.now().date())
+    summary = run_ai_completition(
+        ai_client=client, prompt=prompts["smart_summary"], output_language=output_language, inject_date=True,
+        document_text=build_stage_input("smart_summary", document).text,
+    )
+    document = {**document, "ai_summary_long": summary["summary_long"]}
+    criteria = run_ai_completition(
+        ai_client=client, prompt=prompts["analysis_criteria"], output_language=output_language,
+        document_text=build_stage_input("analysis_criteria", document).text,
+    )
+    document["ai_analysis_criteria"] = criteria["message"]
+    features = run_ai_completition(
+        ai_client=client, prompt=prompts["features_and_insights"], output_language=output_language, inject_date=True,
+        document_extra1=criteria["message"],
+    )
+    alerts = run_ai_completition(
+        ai_client=client, prompt=prompts["alerts_and_actions"], output_language=output_language,
+        document_text=build_stage_input("alerts_and_actions", document).text, document_extra1=today,
+    )
+    results = [summary, criteria, features, alerts]
+    output = {
+        **summary,
+        "analysis_criteria": criteria["message"],
+        "features_and_insights": features["features_and_insights"],
+        "alerts_and_actions": alerts["alerts_and_actions"],
+    }
+    return output, sum(result["usage"]["prompt_tokens"] for result in results), sum(result["usage"]["completion_tokens"] for result in results)
+
+
+def fused(client, prompts: dict, document: dict, output_language: str) -> tuple:
+    data = run_ai_completition(
+        ai_client=client, prompt=fused_prompt(prompts), output_language=output_language,
+        document_text=build_stage_input("fused_analysis", document).text,
+        document_extra1=str(datetime.datetime.now().date()),
+    )
+    return data, data["usage"]["prompt_tokens"], data["usage"]["completion_tokens"]
+
+
+def overlap(a: list, b: list) -> float:
+    """Jaccard overlap of the words of two lists of texts."""
+    words_a = set(WORD.findall(" ".join(a).lower()))
+    words_b = set(WORD.findall(" ".join(b).lower()))
+    return len(words_a & words_b) / len(words_a | words_b) if words_a | words_b else 1.0
+
+
+def agreement(reference: dict, candidate: dict) -> dict:
+    criteria = [line for line in reference["analysis_criteria"].splitlines() if line.startswith("- ")]
+    fused_criteria = [line for line in candidate["analysis_criteria"].splitlines() if line.startswith("- ")]
+    return {
+        "category": float(reference["top_category"].lower() == candidate["top_category"].lower()),
+        "expiry": float(reference["document_expires"] == candidate["document_expires"] and reference["is_expired"] == candidate["is_expired"]),
+        "criteria": overlap(criteria, fused_criteria),
+        "features": overlap([f["feature"] for f in reference["features_and_insights"]], [f["feature"] for f in candidate["features_and_insights"]]),
+        "alerts": overlap(
+            [f"{a['findings_type']} {a['findings_title']}" for a in reference["alerts_and_actions"]],
+            [f"{a['findings_type']} {a['findings_title']}" for a in candidate["alerts_and_actions"]],
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", nargs="*", default=[], help="Text files with extracted document text")
+    parser.add_argument("--pages", type=int, nargs="*", default=[5, 20], help="Generated documents when no --documents are given")
+    parser.add_argument("--output-language", default="English")
+    parser.add_argument("--fake", action="store_true", help="Use a simulated client instead of Azure OpenAI")
+    parser.add_argument("--fake-seconds-per-call", type=float, default=0.8)
+    parser.add_argument("--fake-seconds-per-1k-tokens", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.fake:
+        client = FakeClient(args.fake_seconds_per_call, args.fake_seconds_per_1k_tokens)
+    else:
+        from backend.dependencies import ai_client as client
+
+    prompts = load_prompts()
+    documents = {}
+    for path in args.documents:
+        with open(path) as f:
+            documents[path] = compact_text(f.read())
+    if not documents:
+        documents = {f"generated {pages} pages": compact_text(make_text(pages)[0]) for pages in args.pages}
+
+    rows = []
+    for name, text in documents.items():
+        document = {"document_raw_text": text}
+        start = time.perf_counter()
+        reference, staged_prompt, staged_completion = staged(client, prompts, document, args.output_language)
+        staged_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        candidate, fused_prompt_tokens, fused_completion = fused(client, prompts, document, args.output_language)
+        fused_seconds = time.perf_counter() - start
+        scores = agreement(reference, candidate)
+        rows.append((staged_seconds, fused_seconds, scores))
+
+        print(f"{name}: {count_tokens(text)} tokens")
+        print(f"  staged  {staged_seconds:7.2f}s  prompt {staged_prompt:>7}  completion {staged_completion:>6} tokens")
+        print(f"  fused   {fused_seconds:7.2f}s  prompt {fused_prompt_tokens:>7}  completion {fused_completion:>6} tokens")
+        print("  agreement " + "  ".join(f"{key} {value:.2f}" for key, value in scores.items()))
+
+    print(
+        f"mean latency staged {statistics.mean(row[0] for row in rows):.2f}s, fused {statistics.mean(row[1] for row in rows):.2f}s, "
+        f"mean agreement {statistics.mean(statistics.mean(row[2].values()) for row in rows):.2f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Tail latency of completions with and without hedged requests against a simulated deployment.
+
+Latencies are log-normal around --median seconds and a share of requests stall for --stall seconds,
+the pattern that dominates our p99. Requests run from --concurrency threads through LLMClient, like
+worker processes do. Cancelled losers are counted to check that hedges do not leave requests running.
+
+    python -m benchmarks.bench_hedging --requests 400 --stall-rate 0.03
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from backend import config
+from backend.llm.client import LLMClient, completion_stage
+
+
+class StallingClient:
+    """Async chat completions with log-normal latency and occasional stalls."""
+
+    def __init__(self, median: float, stall: float, stall_rate: float):
+        self.median = median
+        self.stall = stall
+        self.stall_rate = stall_rate
+        self.started = 0
+        self.cancelled = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, **kwargs):
+        self.started += 1
+        latency = self.stall if random.random() < self.stall_rate else random.lognormvariate(0, 0.25) * self.median
+        try:
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="{}"))],
+            usage=SimpleNamespace(prompt_tokens=1000, completion_tokens=200, total_tokens=1200),
+        )
+
+
+def run(hedging: bool, args) -> None:
+    config.HEDGE_ENABLED = hedging
+    random.seed(1)
+    fake = StallingClient(args.median, args.stall, args.stall_rate)
+    client = LLMClient(sync_client=fake, async_client=fake)
+    messages = [{"role": "user", "content": "x " * 1000}]
+
+    def request(_):
+        start = time.perf_counter()
+        with completion_stage("smart_summary"):
+            client.chat.completions.create(model="gpt-4.1", temperature=0.5, messages=messages)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        latencies = sorted(pool.map(request, range(args.requests)))
+    quantiles = statistics.quantiles(latencies, n=100)
+    stats = client.hedger.budget.stats()
+    print(
+        f"  hedging {'on ' if hedging else 'off'}  p50 {quantiles[49]:6.3f}s  p95 {quantiles[94]:6.3f}s  p99 {quantiles[98]:6.3f}s  "
+        f"max {latencies[-1]:6.3f}s  requests {fake.started}  cancelled {fake.cancelled}  "
+        f"hedges {stats['hedges']} (won {stats['hedge_wins']}, denied {stats['denied']})  "
+        f"extra tokens {stats['hedge_tokens'] / max(stats['primary_tokens'], 1):.1%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--median", type=float, default=0.05, help="Median completion seconds")
+    parser.add_argument("--stall", type=float, default=2.0, help="Seconds a stalled completion takes")
+    parser.add_argument("--stall-rate", type=float, default=0.03)
+    args = parser.parse_args()
+
+    # Scaled down from production seconds so the benchmark finishes quickly
+    config.HEDGE_MIN_DELAY = 0
+    config.HEDGE_MIN_SAMPLES = 20
+    print(f"{args.requests} requests, median {args.median}s, {args.stall_rate:.0%} stall for {args.stall}s")
+    run(False, args)
+    run(True, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Throughput and peak memory of the CPU hot paths, one case per function and input size.
+
+Cases:
+- every text extractor of backend/utils/extract_text.py over a generated PDF/DOCX/ODT/RTF/TXT/MD corpus
+  of increasing size; legacy DOC files cannot be generated without Word, extract_doc_text is not covered
+- run_ai_completition prompt assembly for a text and a structured output prompt, with a client that
+  returns a prebuilt completion, so only templating, token counting, routing and response parsing are timed
+- Artefact construction and its JSON dump, as get_artefact and ORJSONResponse do them
+- construct_docu_info_in_text and format_analysis
+
+Throughput is the best of --repeat runs, in calls/s and MB/s of text: the extracted text for extractors,
+the document text for prompts and helpers, the JSON row for artefacts. Peak memory is the
+tracemalloc peak of one more call, allocations of pdftotext and of PDF worker processes are not counted.
+
+    python -m benchmarks.bench_hot_paths --pages 1 10 50 --repeat 5
+    python -m benchmarks.bench_hot_paths --only extract_pdf_text format_analysis --output hot_paths.json
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+import orjson
+from docx import Document
+from odf.opendocument import OpenDocumentText
+from odf.text import P
+from openai.types.chat import ChatCompletion
+
+from backend.db.schemas.artefacts_schemas import ARTEFACT_JSON_FIELDS, Artefact
+from backend.llm.providers.stub import (FILLER_LINE, TEXT_ANSWER,
+                                        stub_completion)
+from backend.utils import extract_text
+from backend.utils.helpers import construct_docu_info_in_text, format_analysis
+from backend.utils.prompt_generators import load_prompts, run_ai_completition
+from benchmarks.bench_artefact_serialization import build_row
+from benchmarks.bench_pdf_engine import make_pdf
+from benchmarks.bench_text_compaction import make_text
+
+LINES_PER_PAGE = 40
+PROMPT_STAGES = ("analysis_criteria", "smart_summary")
+
+
+def write_docx(path: str, lines: list) -> None:
+    document = Document()
+    for line in lines:
+        document.add_paragraph(line)
+    document.save(path)
+
+
+def write_odt(path: str, lines: list) -> None:
+    document = OpenDocumentText()
+    for line in lines:
+        document.text.addElement(P(text=line))
+    document.save(path)
+
+
+def write_rtf(path: str, lines: list) -> None:
+    body = "".join(f"\\pard {line}\\par\n" for line in lines)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{\\rtf1\\ansi\\deff0 {\\fonttbl {\\f0 Helvetica;}}\\f0\\fs20\n" + body + "}")
+
+
+def write_text(path: str, lines: list) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def make_corpus(directory: str, pages: list) -> list:
+    """(extractor name, pages, path) of one document per format and page count."""
+    writers = {".docx": write_docx, ".odt": write_odt, ".rtf": write_rtf, ".txt": write_text, ".md": write_text}
+    corpus = []
+    for count in pages:
+        lines = make_text(count, LINES_PER_PAGE)[1]
+        path = os.path.join(directory, f"document_{count}.pdf")
+        make_pdf(path, count, LINES_PER_PAGE)
+        corpus.append((extract_text.EXTRACTORS[".pdf"].extract.__name__, count, path))
+        for extension, write in writers.items():
+            path = os.path.join(directory, f"document_{count}{extension}")
+            write(path, lines)
+            corpus.append((extract_text.EXTRACTORS[extension].extract.__name__, count, path))
+    return corpus
+
+
+def measure(fn, repeat: int) -> dict:
+    """Best and median seconds of `repeat` calls, then the tracemalloc peak of one more call."""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"best": min(timings), "median": statistics.median(timings), "peak_bytes": peak}
+
+
+class CannedClient:
+    """Returns the same completion to every request, built once per prompt."""
+
+    def __init__(self, completion: ChatCompletion):
+        self.completion = completion
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        return self.completion
+
+
+def extractor_cases(corpus: list):
+    extractors = {extractor.extract.__name__: extractor.extract for extractor in extract_text.EXTRACTORS.values()}
+    for name, pages, path in corpus:
+        extract = extractors[name]
+        # Zipped formats are much smaller than their text, throughput is counted in extracted text
+        size = len(extract(Path(path)).encode())
+        yield name, f"{pages} pages", size, lambda extract=extract, path=Path(path): extract(path)
+
+
+def prompt_cases(pages: list):
+    prompts = load_prompts()
+    for count in pages:
+        text = make_text(count, LINES_PER_PAGE)[0]
+        for stage in PROMPT_STAGES:
+            prompt = prompts[stage]
+            kwargs = {"model": prompt["model"], "messages": prompt["messages"], "response_format": prompt.get("schema")}
+            client = CannedClient(ChatCompletion.model_validate(stub_completion(kwargs)))
+
+            def assemble(client=client, prompt=prompt, text=text, stage=stage):
+                return run_ai_completition(ai_client=client, prompt=prompt, document_text=text, document_extra1="2025-01-01",
+                                           output_language="English", inject_date=True, stage=stage)
+            yield f"run_ai_completition[{stage}]", f"{count} pages", len(text.encode()), assemble
+
+
+def artefact_cases(pages: list, items: int):
+    for count in pages:
+        raw_text_kb = max(count * LINES_PER_PAGE * 80 // 1024, 1)
+        row = build_row(raw_text_kb, items)
+        # Storage returns the JSON columns decoded
+        for key in ARTEFACT_JSON_FIELDS:
+            row[key] = orjson.loads(row[key])
+        size = len(orjson.dumps(row))
+        artefact = Artefact(**row)
+        yield "Artefact(**row)", f"{raw_text_kb} KB text", size, lambda row=row: Artefact(**row)
+        yield "orjson.dumps(artefact)", f"{raw_text_kb} KB text", size, lambda artefact=artefact: orjson.dumps(artefact.model_dump(mode="json"))
+
+
+def helper_cases(pages: list):
+    for count in pages:
+        text = make_text(count, LINES_PER_PAGE)[0]
+        document = SimpleNamespace(filename="document.pdf", file_size=len(text), ai_category="Contract",
+                                   ai_sub_category="Lease", document_raw_text=text)
+        yield "construct_docu_info_in_text", f"{count} pages", len(text.encode()), lambda document=document: construct_docu_info_in_text(document)
+        # Analysis plans grow with the document, about a bullet per page
+        analysis = TEXT_ANSWER + FILLER_LINE * count
+        yield "format_analysis", f"{count + 2} bullets", len(analysis.encode()), lambda analysis=analysis: format_analysis(analysis)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50], help="Sizes of the corpus, in pages")
+    parser.add_argument("--items", type=int, default=50, help="Items per JSON column of the artefact")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", help="Run the cases whose name starts with one of these")
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    # Token usage is logged on every completion
+    logging.getLogger("backend.utils.prompt_generators").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = make_corpus(tmp, args.pages)
+        cases = [
+            *extractor_cases(corpus),
+            *prompt_cases(args.pages),
+            *artefact_cases(args.pages, args.items),
+            *helper_cases(args.pages),
+        ]
+        if args.only:
+            cases = [case for case in cases if case[0].startswith(tuple(args.only))]
+
+        results = []
+        print(f"{'case':<40} {'input':>14} {'bytes':>10} {'best ms':>10} {'median ms':>10} {'calls/s':>10} {'MB/s':>8} {'peak KB':>10}")
+        for name, label, size, fn in cases:
+            result = {"case": name, "input": label, "bytes": size, **measure(fn, args.repeat)}
+            results.append(result)
+            print(f"{name:<40} {label:>14} {size:>10} {result['best'] * 1000:>10.2f} {result['median'] * 1000:>10.2f} "
+                  f"{1 / result['best']:>10.1f} {size / result['best'] / 1e6:>8.1f} {result['peak_bytes'] / 1024:>10.0f}")
+
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Load balancing, ejection and re-admission of the LLM endpoint pool against local stub endpoints.
+
+Three stub endpoints (weights 2, 1, 1) serve completions through LLMClient from --concurrency threads,
+like worker processes do. In the second phase one endpoint fails every request and another one gets
+slow; in the third both recover. For each phase the benchmark prints where requests went,
+the failures the callers saw, latency, and each endpoint's health as the pool sees it. The same
+failing phase against the failing endpoint alone shows what a single AZURE_OPENAI_ENDPOINT would do.
+
+    python -m benchmarks.bench_llm_pool --requests 300 --concurrency 12
+"""
+import argparse
+import logging
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import config
+from backend.llm.client import LLMClient
+from benchmarks.stub_llm_server import StubServer
+
+
+def run_phase(name: str, client: LLMClient, stubs: dict, args) -> None:
+    served = {stub_name: stub.requests for stub_name, stub in stubs.items()}
+    messages = [{"role": "user", "content": "x " * 500}]
+
+    def request(_):
+        start = time.perf_counter()
+        try:
+            client.chat.completions.create(model="gpt-4.1", temperature=0.5, messages=messages)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(request, range(args.requests)))
+    latencies = [latency for latency in results if latency is not None]
+    served = {stub_name: stub.requests - served[stub_name] for stub_name, stub in stubs.items()}
+    print(f"{name}: served {served}, failed {results.count(None)}/{args.requests}", end="")
+    if len(latencies) > 1:
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f", p50 {quantiles[49]:.3f}s, p99 {quantiles[98]:.3f}s", end="")
+    print()
+    for endpoint in client.stats()["endpoints"]:
+        print(f"    {endpoint['name']:<6} error rate {endpoint['error_rate']:.2f}  latency {endpoint['latency_ms'] or '-'}ms  "
+              f"{'ejected' if endpoint['ejected'] else 'admitted'} (ejections {endpoint['ejections']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.05, help="Median completion seconds of a healthy endpoint")
+    parser.add_argument("--slow-latency", type=float, default=0.25, help="Median completion seconds of the slow endpoint")
+    args = parser.parse_args()
+
+    # Every ejected request would log a warning
+    logging.getLogger("backend.llm").setLevel(logging.ERROR)
+    # Scaled down from production seconds so the benchmark finishes quickly
+    config.HEDGE_ENABLED = False
+    config.LLM_POOL_EJECT_SECONDS = 1
+    config.LLM_POOL_RETRY_BACKOFF = 0.05
+    stubs = {name: StubServer(latency=args.latency).start() for name in ("east", "west", "north")}
+    weights = {"east": 2, "west": 1, "north": 1}
+    config.LLM_ENDPOINTS = [{"name": name, "endpoint": stub.url, "api_key": "stub", "weight": weights[name]} for name, stub in stubs.items()]
+    client = LLMClient()
+
+    run_phase("healthy", client, stubs, args)
+    stubs["west"].error_rate = 1.0
+    stubs["north"].latency = args.slow_latency
+    run_phase("west failing, north slow", client, stubs, args)
+    stubs["west"].error_rate = 0.0
+    stubs["north"].latency = args.latency
+    time.sleep(config.LLM_POOL_EJECT_SECONDS * 2)
+    run_phase("recovered", client, stubs, args)
+
+    stubs["west"].error_rate = 1.0
+    config.LLM_ENDPOINTS = [endpoint for endpoint in config.LLM_ENDPOINTS if endpoint["name"] == "west"]
+    run_phase("west failing, single endpoint", LLMClient(), {"west": stubs["west"]}, args)
+
+    for stub in stubs.values():
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Record and replay of the staged analysis completions, offline.
+
+The stage completions of a few synthetic documents run through LLMClient three times: recorded
+from the stub provider into a cassette, replayed at the recorded latency, and replayed without
+latency. Replays must return the recorded outputs without a single cassette miss. Record with
+LLM_RECORD_PROVIDER=azure and LLM_CASSETTE_PATH set to replay real completions the same way.
+
+    python -m benchmarks.bench_llm_replay --pages 1 5 20
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from backend import config
+from backend.llm.client import LLMClient
+from backend.utils.prompt_generators import load_prompts, run_ai_completition
+from backend.utils.text_compaction import compact_text
+from benchmarks.bench_text_compaction import make_text
+
+STAGES = ("smart_summary", "analysis_criteria", "alerts_and_actions")
+
+
+def run(provider: str, prompts: dict, documents: list) -> tuple:
+    config.LLM_PROVIDER = provider
+    client = LLMClient()
+    start = time.perf_counter()
+    outputs = [
+        run_ai_completition(ai_client=client, prompt=prompts[stage], document_text=text, output_language="English",
+                            document_extra1="2025-01-01", inject_date=True, stage=stage)
+        for text in documents for stage in STAGES
+    ]
+    elapsed = time.perf_counter() - start
+    print(f"  {provider:<6} {elapsed:6.2f}s  {client.stats()['endpoints']}")
+    return outputs, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--latency", type=float, default=0.2, help="Median seconds of a stub completion")
+    args = parser.parse_args()
+
+    # A hedge would take a second recording of its request
+    config.HEDGE_ENABLED = False
+    config.LLM_RECORD_PROVIDER = "stub"
+    config.LLM_STUB_LATENCY = args.latency
+    config.LLM_STUB_SEED = 0
+    prompts = load_prompts()
+    documents = [compact_text(make_text(pages, lines_per_page=40)[0]) for pages in args.pages]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config.LLM_CASSETTE_PATH = os.path.join(tmp, "cassette.jsonl")
+        print(f"{len(documents) * len(STAGES)} completions")
+        recorded, recorded_seconds = run("record", prompts, documents)
+        config.LLM_REPLAY_LATENCY_SCALE = 1
+        replayed, replayed_seconds = run("replay", prompts, documents)
+        config.LLM_REPLAY_LATENCY_SCALE = 0
+        instant, _ = run("replay", prompts, documents)
+
+    print(f"replay matches recording: {replayed == recorded and instant == recorded}, "
+          f"latency {replayed_seconds / recorded_seconds:.0%} of recorded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Simulated stage latency of a mixed corpus with and without the model routing ladder.
+
+Documents range from one-paragraph receipts to long leases. Every deployment answers after a fixed
+per-call latency plus a per-token cost, the smallest one breaks the response schema at a given rate
+so escalations show up. Latencies are illustrative, set them from your deployments' measurements.
+
+    python -m benchmarks.bench_model_routing --ladder gpt-4.1-nano gpt-4.1-mini gpt-4.1
+"""
+import argparse
+import random
+import statistics
+import time
+from collections import Counter
+
+from backend import config
+from backend.utils.prompt_generators import load_prompts, run_ai_completition
+from backend.utils.text_compaction import compact_text
+from benchmarks.bench_fused_analysis import FakeClient
+from benchmarks.bench_text_compaction import make_text
+
+STAGES = ("smart_summary", "analysis_criteria", "alerts_and_actions")
+
+
+class LadderClient(FakeClient):
+    """Per-deployment latency, the smallest deployment returns invalid structured output at `failure_rate`."""
+
+    def __init__(self, ladder: list, seconds_per_call: list, seconds_per_1k_tokens: list, failure_rate: float):
+        super().__init__(0, 0)
+        self.latency = {model: (call, tokens) for model, call, tokens in zip(ladder, seconds_per_call, seconds_per_1k_tokens)}
+        self.smallest = ladder[0]
+        self.failure_rate = failure_rate
+        self.models = Counter()
+
+    def create(self, model, temperature, messages, response_format=None, **kwargs):
+        self.models[model] += 1
+        self.seconds_per_call, self.seconds_per_1k_tokens = self.latency[model]
+        response = super().create(model, temperature, messages, response_format=response_format)
+        if response_format and model == self.smallest and random.random() < self.failure_rate:
+            response.choices[0].message.content = "{}"
+        return response
+
+
+def run(client, prompts: dict, documents: list) -> list:
+    latencies = []
+    for text in documents:
+        start = time.perf_counter()
+        for stage in STAGES:
+            run_ai_completition(ai_client=client, prompt=prompts[stage], document_text=text, output_language="English",
+                                document_extra1="2025-01-01", stage=stage, ai_analysis_mode="standard")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ladder", nargs="+", default=["gpt-4.1-nano", "gpt-4.1-mini", "gpt-4.1"])
+    parser.add_argument("--seconds-per-call", type=float, nargs="+", default=[0.05, 0.1, 0.25])
+    parser.add_argument("--seconds-per-1k-tokens", type=float, nargs="+", default=[0.002, 0.004, 0.012])
+    parser.add_argument("--failure-rate", type=float, default=0.1, help="Share of invalid structured outputs of the smallest deployment")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 1, 1, 2, 3, 5, 10, 40, 90])
+    args = parser.parse_args()
+
+    random.seed(0)
+    prompts = load_prompts()
+    documents = [compact_text(make_text(pages, lines_per_page=8 if pages == 1 else 40)[0]) for pages in args.pages]
+
+    for name, ladder in (("single model", []), ("routing ladder", args.ladder)):
+        config.MODEL_LADDER = ladder
+        client = LadderClient(args.ladder, args.seconds_per_call, args.seconds_per_1k_tokens, args.failure_rate)
+        if not ladder:
+            # Without a ladder every prompt uses its own model, which is the largest deployment
+            client.latency[prompts["smart_summary"]["model"]] = client.latency[args.ladder[-1]]
+        latencies = run(client, prompts, documents)
+        print(f"{name}: mean {statistics.mean(latencies):.2f}s, max {max(latencies):.2f}s per document, "
+              f"calls {dict(client.models)}")
+
+
+if __name__ == "__main__":
+    main()
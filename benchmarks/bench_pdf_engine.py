@@ -0,0 +1,92 @@
+"""
+Pages per second of the PDF engines on a generated corpus.
+
+Compares the previous whole-file pdfminer call with the page-range engine (pdfminer and pdftotext,
+sequential and parallel). pdftotext rows are skipped when poppler-utils is not installed.
+
+    python -m benchmarks.bench_pdf_engine --pages 20 60 150 --workers 4
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from pdfminer.high_level import extract_text
+
+from backend.utils.pdf_engine import iter_pdf_pages
+
+WORDS = "lease tenant landlord deposit notice termination clause payment insurance renewal".split()
+
+
+def make_pdf(path: str, pages: int, lines_per_page: int = 45) -> None:
+    """Write a plain PDF with `pages` pages of Helvetica text, enough structure for both engines."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(pages):
+        lines = [
+            " ".join(WORDS[(page + line + i) % len(WORDS)] for i in range(12)) + f" {page + 1}.{line + 1}"
+            for line in range(lines_per_page)
+        ]
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({line}) Tj T*" for line in lines) + " ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream.encode()))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % i for i in page_ids), pages)
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def timed(name: str, pages: int, fn) -> str:
+    start = time.perf_counter()
+    text = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<32} {pages:>5} pages  {elapsed:8.2f}s  {pages / elapsed:8.1f} pages/s")
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[20, 60, 150], help="Page counts of the corpus documents")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--pages-per-chunk", type=int, default=8)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench-pdf-")
+    try:
+        for pages in args.pages:
+            path = os.path.join(tmp, f"{pages}.pdf")
+            make_pdf(path, pages)
+            print(f"{pages} page document, {args.workers} workers, {args.pages_per_chunk} pages per chunk")
+
+            legacy = timed("pdfminer whole file (previous)", pages, lambda: extract_text(path))
+            engines = [("pdfminer", 1), ("pdfminer", args.workers)]
+            if shutil.which("pdftotext"):
+                engines += [("pdftotext", 1), ("pdftotext", args.workers), ("auto", args.workers)]
+            else:
+                print("  pdftotext not installed, skipping poppler engines")
+            for engine, workers in engines:
+                text = timed(
+                    f"{engine}, {workers} worker{'s' if workers > 1 else ''}", pages,
+                    lambda: "\n".join(iter_pdf_pages(path, engine=engine, workers=workers, pages_per_chunk=args.pages_per_chunk))
+                )
+                if engine == "pdfminer":
+                    assert text.split() == legacy.split(), "page-range pdfminer output differs from the whole-file output"
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+End-to-end throughput of the document pipeline: API, worker, broker, result backend and a stub LLM.
+
+The API (benchmarks.pipeline_api) and a Celery worker (benchmarks.pipeline_worker) run as
+subprocesses on a temporary database and upload directory. A filesystem broker and result backend
+stand in for RabbitMQ and Redis, and the stub LLM provider (or a recorded cassette) for Azure.
+Documents are uploaded through POST /api/v1/document/{customer_id} at --rate per minute. A
+document is done when its webhook arrives.
+
+Reported: documents/min, end-to-end latency, run time, queue wait and LLM time per task, and storage
+time per method in the API. The result JSON (--output) compared with an earlier one (--compare)
+shows regressions between commits.
+
+Uploads are synthetic text documents of --pages sizes, or --mix, a JSON lines file of recorded
+uploads {"path", "customer_id", "ai_analysis_mode", "ai_output_language", "at"}, where "at" is seconds
+after the start and all keys but "path" are optional.
+
+    python -m benchmarks.bench_pipeline --documents 40 --rate 120 --concurrency 4
+    python -m benchmarks.bench_pipeline --mix uploads.jsonl --llm replay --cassette data/llm_cassette.jsonl --compare base.json
+"""
+import argparse
+import datetime
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+import requests
+from fastapi import FastAPI, Request
+
+from benchmarks import pipeline_timings
+from benchmarks.bench_text_compaction import make_text
+from benchmarks.stub_llm_server import serve_in_thread
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUEUES = "default,ai-analysis-queue,extraction-queue"
+# Metrics compared against --compare, and whether higher is better
+COMPARED = (
+    ("documents_per_minute", True),
+    ("end_to_end.p50", False),
+    ("end_to_end.p95", False),
+    ("queue_wait.p95", False),
+    ("llm.seconds", False),
+    ("db.seconds", False),
+)
+
+
+def percentiles(values: list) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    quantiles = statistics.quantiles(values, n=100) if len(values) > 1 else values * 99
+    return {
+        "count": len(values),
+        "p50": round(quantiles[49], 4),
+        "p95": round(quantiles[94], 4),
+        "p99": round(quantiles[98], 4),
+        "max": round(values[-1], 4),
+        "seconds": round(sum(values), 3),
+    }
+
+
+def synthetic_mix(directory: str, documents: int, pages: list, modes: list) -> list:
+    mix = []
+    for i in range(documents):
+        path = os.path.join(directory, f"document-{i:04d}.txt")
+        with open(path, "w") as f:
+            f.write(make_text(pages[i % len(pages)], lines_per_page=40)[0])
+        mix.append({"path": path, "customer_id": f"bench-customer-{i % 10}", "ai_analysis_mode": modes[i % len(modes)]})
+    return mix
+
+
+def load_mix(path: str) -> list:
+    with open(path, "rb") as f:
+        return [orjson.loads(line) for line in f if line.strip()]
+
+
+class WebhookSink:
+    """Receives the analysis webhooks, the arrival time of each (customer_id, filename)."""
+
+    def __init__(self):
+        self.arrivals = {}
+        self.done = threading.Condition()
+        app = FastAPI()
+
+        @app.post("/webhook")
+        async def webhook(request: Request):
+            document = orjson.loads(await request.body())
+            with self.done:
+                self.arrivals[(document["customer_id"], document["filename"])] = time.time()
+                self.done.notify_all()
+            return {"status": "ok"}
+
+        self.server, self.thread, self.port = serve_in_thread(app)
+
+    def wait(self, count: int, timeout: float) -> None:
+        with self.done:
+            self.done.wait_for(lambda: len(self.arrivals) >= count, timeout=timeout)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_process(command: list, env: dict, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(command, env=env, cwd=ROOT_DIR, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def stop_process(process: subprocess.Popen) -> None:
+    # Warm shutdown first, then the whole process group including worker children
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def wait_until(ready, process: subprocess.Popen, log_path: str, what: str, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while not ready():
+        if process.poll() is not None or time.time() > deadline:
+            with open(log_path, "rb") as f:
+                sys.stderr.write(f.read()[-4000:].decode(errors="replace"))
+            raise RuntimeError(f"{what} did not start")
+        time.sleep(0.2)
+
+
+def api_ready(api_url: str) -> bool:
+    try:
+        return requests.get(f"{api_url}/docs", timeout=1).ok
+    except requests.RequestException:
+        return False
+
+
+def upload(api_url: str, webhook_url: str, document: dict, started: float) -> tuple:
+    time.sleep(max(started + document["at"] - time.time(), 0))
+    filename = os.path.basename(document["path"])
+    uploaded_at = time.time()
+    with open(document["path"], "rb") as f:
+        response = requests.post(
+            f"{api_url}/api/v1/document/{document['customer_id']}",
+            data={
+                "customer_data": "{}",
+                "ai_analysis_mode": document["ai_analysis_mode"],
+                "ai_output_language": document["ai_output_language"],
+                "eterny_api_webhook_url": webhook_url,
+            },
+            files={"file": (filename, f)},
+        )
+    response.raise_for_status()
+    return (document["customer_id"], filename), uploaded_at, time.time() - uploaded_at
+
+
+def summarize(uploads: dict, upload_seconds: list, arrivals: dict, timings: list) -> dict:
+    end_to_end = [arrivals[key] - uploaded_at for key, uploaded_at in uploads.items() if key in arrivals]
+    elapsed = max(arrivals.values(), default=0) - min(uploads.values())
+    tasks = [record for record in timings if record["kind"] == "task"]
+    stages = defaultdict(lambda: defaultdict(list))
+    for record in tasks:
+        for field in ("run", "queue_wait", "llm"):
+            if record[field] is not None:
+                stages[record["task"]][field].append(record[field])
+    db = defaultdict(list)
+    for record in timings:
+        if record["kind"] == "db":
+            db[record["method"]].append(record["seconds"])
+    return {
+        "documents": len(uploads),
+        "completed": len(end_to_end),
+        "documents_per_minute": round(len(end_to_end) / elapsed * 60, 2) if elapsed > 0 else 0,
+        "end_to_end": percentiles(end_to_end),
+        "upload": percentiles(upload_seconds),
+        "queue_wait": percentiles([record["queue_wait"] for record in tasks if record["queue_wait"] is not None]),
+        "task_failures": sum(record["state"] != "SUCCESS" for record in tasks),
+        "stages": {task: {field: percentiles(values) for field, values in fields.items()} for task, fields in stages.items()},
+        "llm": percentiles([record["seconds"] for record in timings if record["kind"] == "llm"]),
+        "db": {**percentiles([seconds for values in db.values() for seconds in values]),
+               "methods": {method: percentiles(values) for method, values in sorted(db.items())}},
+    }
+
+
+def metric(result: dict, name: str):
+    for key in name.split("."):
+        result = result.get(key, {}) if isinstance(result, dict) else {}
+    return result if isinstance(result, (int, float)) else None
+
+
+def print_result(result: dict) -> None:
+    e2e = result["end_to_end"]
+    print(f"{result['completed']}/{result['documents']} documents, {result['documents_per_minute']} documents/min, "
+          f"end-to-end p50 {e2e.get('p50')}s p95 {e2e.get('p95')}s, {result['task_failures']} failed tasks")
+    print(f"  {'task':<34} {'count':>5} {'run p50':>8} {'run p95':>8} {'wait p50':>8} {'wait p95':>8} {'llm p50':>8}")
+    for task, fields in sorted(result["stages"].items(), key=lambda item: -item[1]["run"]["seconds"]):
+        run, wait, llm = fields["run"], fields.get("queue_wait", {}), fields["llm"]
+        print(f"  {task:<34} {run['count']:>5} {run['p50']:>8.3f} {run['p95']:>8.3f} {wait.get('p50', 0):>8.3f} "
+              f"{wait.get('p95', 0):>8.3f} {llm['p50']:>8.3f}")
+    llm, db = result["llm"], result["db"]
+    print(f"  queue wait p50 {result['queue_wait'].get('p50')}s p95 {result['queue_wait'].get('p95')}s, "
+          f"LLM {llm['count']} calls {llm.get('seconds', 0)}s, DB {db['count']} calls {db.get('seconds', 0)}s")
+
+
+def print_comparison(result: dict, baseline: dict) -> None:
+    print(f"compared with {baseline.get('commit', '?')[:12]} ({baseline.get('date')}):")
+    changed = {key for key in result["parameters"] if baseline.get("parameters", {}).get(key) != result["parameters"][key]}
+    if changed:
+        print(f"  parameters differ ({', '.join(sorted(changed))}), results are not comparable")
+    for name, higher_is_better in COMPARED:
+        before, after = metric(baseline, name), metric(result, name)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        worse = change < 0 if higher_is_better else change > 0
+        print(f"  {name:<24} {before:>10} -> {after:<10} {change:+.1%}{'  worse' if worse and abs(change) > 0.05 else ''}")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=40, help="Synthetic documents to upload")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 2, 5, 10, 30], help="Sizes of the synthetic documents")
+    parser.add_argument("--modes", nargs="+", default=["standard", "detailed"])
+    parser.add_argument("--mix", help="JSON lines file of recorded uploads, instead of synthetic documents")
+    parser.add_argument("--rate", type=float, default=120, help="Uploads per minute, 0 uploads everything at once")
+    parser.add_argument("--concurrency", type=int, default=4, help="Worker processes")
+    parser.add_argument("--llm", choices=["stub", "replay"], default="stub")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Median seconds of a stub completion")
+    parser.add_argument("--cassette", help="Cassette to replay with --llm replay")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for the last webhook")
+    parser.add_argument("--output", default="bench_pipeline.json", help="Result file")
+    parser.add_argument("--compare", help="Earlier result file to compare with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for directory in ("uploads", "blobs", "broker", "control", "results", "documents", "extraction_cache"):
+            os.makedirs(os.path.join(tmp, directory))
+        mix = load_mix(args.mix) if args.mix else synthetic_mix(os.path.join(tmp, "documents"), args.documents, args.pages, args.modes)
+        for i, document in enumerate(mix):
+            document.setdefault("customer_id", "bench-customer")
+            document.setdefault("ai_analysis_mode", "standard")
+            document.setdefault("ai_output_language", "English")
+            document.setdefault("at", i * 60 / args.rate if args.rate else 0)
+
+        sink = WebhookSink()
+        timings_path = os.path.join(tmp, "timings.jsonl")
+        api_port = free_port()
+        api_url = f"http://127.0.0.1:{api_port}"
+        env = {
+            **os.environ,
+            "API_URL": api_url,
+            "STORAGE_BACKEND": "sqlite",
+            "DB_PATH": os.path.join(tmp, "file_records.db"),
+            "BASE_UPLOAD_DIR": os.path.join(tmp, "uploads"),
+            "BLOB_STORE_BACKEND": "local",
+            "BLOB_STORE_DIR": os.path.join(tmp, "blobs"),
+            "EXTRACTION_CACHE_DIR": os.path.join(tmp, "extraction_cache"),
+            "RABBITMQ_BROKER": "filesystem://",
+            "CELERY_BROKER_TRANSPORT_OPTIONS": orjson.dumps({
+                "data_folder_in": os.path.join(tmp, "broker"),
+                "data_folder_out": os.path.join(tmp, "broker"),
+                "control_folder": os.path.join(tmp, "control"),
+                "polling_interval": 0.05,
+            }).decode(),
+            "REDIS_URL": f"file://{os.path.join(tmp, 'results')}",
+            # Progress is published to Redis, which the benchmark does without
+            "PROGRESS_REDIS_URL": "",
+            "LLM_PROVIDER": args.llm,
+            "LLM_STUB_LATENCY": str(args.llm_latency),
+            "LLM_STUB_SEED": "0",
+            "PIPELINE_TIMINGS_PATH": timings_path,
+        }
+        if args.cassette:
+            env["LLM_CASSETTE_PATH"] = os.path.abspath(args.cassette)
+
+        api_log, worker_log = os.path.join(tmp, "api.log"), os.path.join(tmp, "worker.log")
+        api = start_process([sys.executable, "-m", "uvicorn", "benchmarks.pipeline_api:app", "--port", str(api_port),
+                             "--log-level", "warning"], env, api_log)
+        worker = start_process([sys.executable, "-m", "celery", "-A", "benchmarks.pipeline_worker:celery_app", "worker",
+                                "-Q", QUEUES, "-c", str(args.concurrency), "--loglevel", "WARNING"], env, worker_log)
+        try:
+            wait_until(lambda: api_ready(api_url), api, api_log, "API")
+            wait_until(lambda: os.path.exists(timings_path) and any(r["kind"] == "ready" for r in pipeline_timings.load(timings_path)),
+                       worker, worker_log, "Worker")
+            print(f"Uploading {len(mix)} documents to {api_url}, {args.concurrency} worker processes, {args.llm} LLM")
+
+            started = time.time()
+            webhook_url = f"http://127.0.0.1:{sink.port}/webhook"
+            with ThreadPoolExecutor(16) as pool:
+                results = list(pool.map(lambda document: upload(api_url, webhook_url, document, started), mix))
+            uploads = {key: uploaded_at for key, uploaded_at, _ in results}
+            sink.wait(len(uploads), args.timeout)
+        finally:
+            for process in (worker, api):
+                stop_process(process)
+        result = {
+            "commit": git_commit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            **summarize(uploads, [seconds for _, _, seconds in results], dict(sink.arrivals), pipeline_timings.load(timings_path)),
+        }
+        sink.server.should_exit = True
+
+    print_result(result)
+    with open(args.output, "wb") as f:
+        f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+    print(f"Result written to {args.output}")
+    if args.compare:
+        with open(args.compare, "rb") as f:
+            print_comparison(result, orjson.loads(f.read()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Tokens saved by text compaction on generated extracted text, and the time it takes.
+
+Pages carry a running header and footer, page numbers, a repeated disclaimer, dot leaders and
+padded table rows, the way pdftotext renders contracts and statements. Every body line must
+survive compaction.
+
+    python -m benchmarks.bench_text_compaction --pages 10 50 200
+"""
+import argparse
+import time
+
+from backend.utils.text_compaction import compact_document_text
+
+WORDS = "lease tenant landlord deposit notice termination clause payment insurance renewal".split()
+DISCLAIMER = "This document is confidential and intended solely for the addressee named above."
+
+
+def make_text(pages: int, lines_per_page: int = 40) -> tuple:
+    body, rendered = [], []
+    for page in range(1, pages + 1):
+        lines = ["ACME Property Management Ltd.        Lease Agreement No. 2024/117", f"Printed 2024-03-{page % 28 + 1:02d}", ""]
+        for line in range(lines_per_page):
+            text = " ".join(WORDS[(page + line * 7 + i) % len(WORDS)] for i in range(10)) + f" {page}.{line}"
+            body.append(text)
+            if line % 10 == 9:
+                lines += [f"   {text}   ......................   {line * 10:>8}", "    ", ""]
+            else:
+                lines.append(f"  {text}  ")
+        lines += ["-" * 60, DISCLAIMER, f"Page {page} of {pages}"]
+        rendered.append("\n".join(lines))
+    return "\f".join(rendered), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 200])
+    args = parser.parse_args()
+
+    for pages in args.pages:
+        text, body = make_text(pages)
+        start = time.perf_counter()
+        result = compact_document_text(text)
+        elapsed = time.perf_counter() - start
+
+        missing = [line for line in body if line not in result.text]
+        assert not missing, f"compaction dropped body lines, e.g. {missing[0]!r}"
+        assert result.text.count(DISCLAIMER) == 1 and f"Page 2 of {pages}" not in result.text
+        print(
+            f"  {pages:>4} pages  {result.tokens_before:>8} -> {result.tokens_after:>8} tokens  "
+            f"{1 - result.tokens_after / result.tokens_before:6.1%} saved  {elapsed * 1000:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+The API app of the end-to-end pipeline benchmark: backend.main.app with every storage call timed.
+
+    uvicorn benchmarks.pipeline_api:app
+"""
+import functools
+import inspect
+import time
+
+from backend.db.storage import Storage, get_storage
+from backend.main import app
+from benchmarks import pipeline_timings
+
+__all__ = ["app"]
+
+
+def _timed(name: str, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            pipeline_timings.record("db", method=name, seconds=time.perf_counter() - start)
+    return wrapper
+
+
+storage = get_storage()
+for name, _ in inspect.getmembers(Storage, inspect.isfunction):
+    if not name.startswith("_"):
+        setattr(storage, name, _timed(name, getattr(storage, name)))
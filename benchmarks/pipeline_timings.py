@@ -0,0 +1,36 @@
+"""
+Timing records of the end-to-end pipeline benchmark, appended as JSON lines by the API and worker processes.
+
+The harness sets PIPELINE_TIMINGS_PATH for the processes it starts. Every task message is stamped
+with its publish time, so the worker can tell queue wait from run time.
+"""
+import fcntl
+import os
+import time
+
+import orjson
+from celery.signals import before_task_publish
+
+TIMINGS_PATH = os.getenv("PIPELINE_TIMINGS_PATH")
+
+
+def record(kind: str, **fields) -> None:
+    if not TIMINGS_PATH:
+        return
+    line = orjson.dumps({"kind": kind, "pid": os.getpid(), **fields}) + b"\n"
+    with open(TIMINGS_PATH, "ab") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(line)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load(path: str) -> list:
+    with open(path, "rb") as f:
+        return [orjson.loads(line) for line in f if line.strip()]
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    headers["published_at"] = time.time()
@@ -0,0 +1,65 @@
+"""
+The Celery app of the end-to-end pipeline benchmark: queue wait, run time and LLM time of every task.
+
+    celery -A benchmarks.pipeline_worker worker -Q default,ai-analysis-queue,extraction-queue
+"""
+import functools
+import time
+
+from celery import current_task
+from celery.signals import task_postrun, task_prerun, worker_ready
+
+from backend.core.celery import celery_app
+from backend.core.pipeline_events import task_stage
+from backend.dependencies import ai_client
+from benchmarks import pipeline_timings
+
+__all__ = ["celery_app"]
+
+# Start time and LLM seconds of the tasks running in this process
+_running = {}
+
+
+@worker_ready.connect
+def announce_ready(**kwargs):
+    pipeline_timings.record("ready")
+
+
+@task_prerun.connect
+def start_task(task_id=None, task=None, **kwargs):
+    _running[task_id] = {"started_at": time.time(), "llm": 0.0}
+
+
+@task_postrun.connect
+def finish_task(task_id=None, task=None, args=None, kwargs=None, state=None, **extra):
+    running = _running.pop(task_id, None)
+    if running is None:
+        return
+    published_at = task.request.get("published_at")
+    pipeline_timings.record(
+        "task",
+        task=task_stage(task, args, kwargs),
+        document=(kwargs or {}).get("document_uuid"),
+        state=state,
+        queue_wait=running["started_at"] - published_at if published_at else None,
+        run=time.time() - running["started_at"],
+        llm=running["llm"],
+    )
+
+
+def _timed_completion(create):
+    @functools.wraps(create)
+    def wrapper(**kwargs):
+        start = time.perf_counter()
+        try:
+            return create(**kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            task = current_task
+            if task and task.request.id in _running:
+                _running[task.request.id]["llm"] += seconds
+            pipeline_timings.record("llm", model=kwargs.get("model"), seconds=seconds)
+    return wrapper
+
+
+ai_client.chat.completions.create = _timed_completion(ai_client.chat.completions.create)
@@ -0,0 +1,107 @@
+"""
+Stub of an Azure OpenAI resource for benchmarks, with tunable latency and failures.
+
+Serves chat completions, streamed or not, on /openai/deployments/{deployment}/chat/completions.
+Responses are those of the stub provider (backend/llm/providers/stub.py). StubServer runs one in a
+thread of the benchmark; its latency and error rate can be changed while it runs to degrade or heal it.
+
+    python -m benchmarks.stub_llm_server --port 9001 --latency 0.2 --error-rate 0.1
+"""
+import argparse
+import asyncio
+import random
+import socket
+import threading
+import time
+
+import orjson
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from backend.llm.providers.stub import stub_chunks, stub_completion
+
+
+def serve_in_thread(app, port: int = 0) -> tuple:
+    """Serve an ASGI app on 127.0.0.1 from a daemon thread, returns the uvicorn server, the thread and the port."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", port))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, sock.getsockname()[1]
+
+
+class StubServer:
+    """
+    One stub endpoint on 127.0.0.1.
+
+    Completions take a log-normal `latency` around its median, `error_rate` of them fail with `error_status`.
+    Text answers are padded to `completion_tokens`.
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.05, error_rate: float = 0.0, error_status: int = 500, completion_tokens: int = None):
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.completion_tokens = completion_tokens
+        self.requests = 0
+        self.errors = 0
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/openai/deployments/{deployment}/chat/completions")
+        async def chat_completions(deployment: str, request: Request):
+            body = await request.json()
+            self.requests += 1
+            await asyncio.sleep(random.lognormvariate(0, 0.25) * self.latency)
+            if random.random() < self.error_rate:
+                self.errors += 1
+                return JSONResponse({"error": {"code": str(self.error_status), "message": "Stub failure"}}, status_code=self.error_status)
+
+            completion = stub_completion({**body, "model": deployment}, self.completion_tokens)
+            if body.get("stream"):
+                return StreamingResponse(self._stream(completion), media_type="text/event-stream")
+            return completion
+
+        return app
+
+    async def _stream(self, completion: dict):
+        for chunk in stub_chunks(completion):
+            yield f"data: {orjson.dumps(chunk).decode()}\n\n"
+        yield "data: [DONE]\n\n"
+
+    def start(self) -> "StubServer":
+        self._server, self._thread, self.port = serve_in_thread(self.app(), self.port)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency", type=float, default=0.05, help="Median completion seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--completion-tokens", type=int, default=None, help="Length of text answers")
+    args = parser.parse_args()
+
+    stub = StubServer(args.port, args.latency, args.error_rate, args.error_status, args.completion_tokens)
+    uvicorn.run(stub.app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,44 @@
 import datetime
-import json
 import logging
+import os
 
+import orjson
+from celery import chain
 from celery.exceptions import MaxRetriesExceededError
 from celery.signals import task_failure
 from celery.utils.log import get_task_logger
+from celery.utils.time import get_exponential_backoff_interval
 
 from backend import config
+from backend.core import progress
 from backend.core.celery import celery_app
+from backend.core.pipeline_events import (call_argument, document_uuid_of,
+                                          task_stage)
+from backend.core.stage_fusion import FusedStage, get_stage_document, hand_over
+from backend.core.supersede import is_stale
 from backend.dependencies import ai_client
 from backend.utils import prompt_generators
-from backend.utils.helpers import get_document, safe_request
+from backend.utils.context_budget import build_stage_input, legacy_schemas
+from backend.utils.fused_analysis import fused_prompt
+from backend.utils.helpers import (get_document, get_document_response,
+                                   metadata_url, safe_request,
+                                   summary_metadata)
+from backend.utils.pipeline_definitions import (DEFAULT_MAX_RETRIES,
+                                                STAGE_INPUT, Stage,
+                                                get_pipeline, pipeline_name,
+                                                render_template,
+                                                template_names)
 from backend.utils.prompt_generators import run_ai_completition
+from backend.utils.text_compaction import count_tokens
+from backend.utils.token_estimate import estimate_analysis_tokens
+from workers.extraction_worker import (compact_extracted_text,
+                                       extract_document_text)
 
 logger = get_task_logger(__name__)
 logger.setLevel(logging.INFO)
 
 prompts = prompt_generators.load_prompts()
+fused_analysis_prompt = fused_prompt(prompts)
 
 
 # XXX TODO add sentry
@@ -26,6 +48,24 @@ def handle_task_failure(**kwargs):
     if isinstance(kwargs['exception'], MaxRetriesExceededError):
         logger.error(f"MaxRetriesExceededError: Maximum retry attempts exceeded for task {kwargs['task_id']}")
 
+    # Retries exhausted, the document's analysis stops here. Extraction tasks report through the errback of their chain
+    task, args, task_kwargs = kwargs['sender'], kwargs.get('args'), kwargs.get('kwargs')
+    document_uuid = document_uuid_of(task, args, task_kwargs)
+    if document_uuid and getattr(task, 'queue', None) != 'extraction-queue':
+        mark_failed(document_uuid, task_stage(task, args, task_kwargs), kwargs['exception'], call_argument(task, args, task_kwargs, "generation"))
+
+
+def mark_failed(document_uuid: str, stage: str, error: Exception, generation: str = None) -> None:
+    # Out of `processing`, so admission control no longer counts it in flight. Refused if the document was uploaded again
+    response = safe_request(
+        request_type="PATCH",
+        url=metadata_url(document_uuid, generation),
+        data={"analysis_status": "failed"},
+    )
+    # The updated document names the customer, whose channel gets the final state too
+    customer_id = orjson.loads(response.content)["customer_id"] if response is not None else None
+    progress.publish(document_uuid, stage, "failed", customer_id=customer_id, error=str(error))
+
 
 @celery_app.task(
     name='backend.workers.ai_analysis.test_retry',
@@ -70,74 +110,10 @@ def house_clean(document_uuid: str) -> None:
     ...
 
 
-@celery_app.task(
-    acks_late=True,
-    queue='ai-analysis-queue',
-    autoretry_for=(Exception,),
-    retry_backoff=1,
-    retry_jitter=True,
-    max_retries=1000,
-    priority=5
-)
-def execute_webhook(document_uuid: str) -> None:
-    document = get_document(document_uuid=document_uuid)
-    webhook_url = document["webhook_url"]
-    logger.info(f"Webhook URL: {webhook_url}")
-    response = safe_request(
-        request_type="POST",
-        url=webhook_url,
-        data=json.dumps(document),
-        headers={"Content-Type": "application/json"},
-    )
-    if response is None:
-        raise Exception(f"API call failed for marking document {document_uuid}")
-    
-    logger.info("Handing over to house_clean")
-
-
-
-@celery_app.task(
-    acks_late=True,
-    queue='ai-analysis-queue',
-    autoretry_for=(Exception,),
-    retry_backoff=1,
-    retry_jitter=True,
-    max_retries=10,
-    priority=5
-)
-def mark_off_document_record_cost(document_uuid: str, output_language: str, tokens_spent: int) -> None:
-    logger.info("Marking document as processed")
-    response = safe_request(
-        request_type="PATCH",
-        url=config.API_URL + f"/api/v1/artefact/metadata/{document_uuid}",
-        data={
-            "analysis_status": "processed",
-            "analysis_completed_at": datetime.datetime.now().isoformat()
-        }
-    )
-    if response is None:
-        raise Exception(f"API call failed for marking document {document_uuid}")
-    logger.info("Handing over to execute_webhook")
-    execute_webhook.delay(
-        document_uuid=document_uuid
-    )
-
-
-@celery_app.task(
-    acks_late=True,
-    queue='ai-analysis-queue',
-    autoretry_for=(Exception,),
-    retry_backoff=1,
-    retry_jitter=True,
-    max_retries=10,
-    priority=5
-)
-def mark_off_ai_alert(document_uuid: str, output_language: str, tokens_spent: int) -> None:
-    logger.info("Marking off AI alert")
-    document = get_document(document_uuid=document_uuid)
-    ai_alerts_and_actions = document["ai_alerts_and_actions"]
-
+def mark_off_ai_alert(document: dict, tokens_spent: int) -> dict:
+    """The document's alert status, the highest-priority findings type among its alerts and actions."""
     priority = ['alert', 'action_required', 'reminder', 'insights_available']
+    ai_alerts_and_actions = document["ai_alerts_and_actions"] or []
 
     # pick the highest‐priority alert present in the list
     document_ai_alert = next(
@@ -145,206 +121,166 @@ def mark_off_ai_alert(document_uuid: str, output_language: str, tokens_spent: in
         if any(item.get('findings_type') == flag for item in ai_alerts_and_actions)),
         None
     )
+    return {"ai_alert_status": document_ai_alert} if document_ai_alert else {}
 
-    # build your payload
-    payload = {
-        "ai_alerts_and_actions": json.dumps(ai_alerts_and_actions)
-    }
-    if document_ai_alert:
-        payload["ai_alert_status"] = document_ai_alert
 
-    logger.info("Marking document as processed")
+def record_cost(document: dict, tokens_spent: int) -> dict:
+    """Record the tokens of all completed stages in the ledger and mark the document processed."""
+    document_uuid = document["uuid"]
+    tokens_spent += sum(document["pipeline_state"]["completed"].values())
+    logger.info(f"Recording {tokens_spent} tokens spent in the ledger")
     response = safe_request(
-        request_type="PATCH",
-        url=f"{config.API_URL}/api/v1/artefact/metadata/{document_uuid}",
-        data=payload
+        request_type="POST",
+        url=config.API_URL + f"/api/v1/artefact/ledger/{document_uuid}",
+        data={"tokens": tokens_spent}
     )
     if response is None:
-        raise Exception(f"API call failed for marking document {document_uuid}")
+        raise Exception(f"API call failed for recording cost of document {document_uuid}")
+    return {"analysis_status": "processed", "analysis_completed_at": datetime.datetime.now().isoformat()}
 
-    logger.info("Handing over to mark_off_document_record_cost")
-    mark_off_document_record_cost.delay(
-        document_uuid=document_uuid,
-        output_language=output_language,
-        tokens_spent=tokens_spent
-    )
 
-
-@celery_app.task(
-    acks_late=True,
-    queue='ai-analysis-queue',
-    autoretry_for=(Exception,),
-    retry_backoff=1,
-    retry_jitter=True,
-    max_retries=10,
-    priority=5
-)
-def map_eterny_legacy_schemas(document_uuid: str, output_language: str, tokens_spent: int) -> None:
-    logger.info("Mapping existing Eterny.io Document Schemas")
-    document = get_document(document_uuid=document_uuid)
-    document_raw_text = document["document_raw_text"]
-    simple_prompt = prompts["map_existing_eterny.io_schemas"]
-
-    with open("prompts/prompts.json", "r") as f:
-        eterny_legacy_schema = f.read()
-
-    document_raw_text += "\n\n schema:\n" + eterny_legacy_schema
-    data = run_ai_completition(ai_client=ai_client, prompt=simple_prompt, document_text=document_raw_text, output_language="English")
-    legacy_schema_dict = json.loads(data["message"])
-
-    usage = data.get("usage")
-    tokens_spent += usage["total_tokens"]
-
-    logger.info("Update Eterny.io legacy schema to database")
+def execute_webhook(document: dict, tokens_spent: int) -> dict:
+    document_uuid = document["uuid"]
+    # Forward the artefact JSON exactly as the API rendered it instead of decoding and re-dumping it
+    document_response = get_document_response(document_uuid=document_uuid)
+    if document_response is None:
+        raise Exception(f"API call failed for fetching document {document_uuid}")
+    webhook_url = document["webhook_url"]
+    logger.info(f"Webhook URL: {webhook_url}")
     response = safe_request(
-        request_type="PATCH",
-        url=config.API_URL + f"/api/v1/artefact/metadata/{document_uuid}",
-        data={"ai_eterny_legacy_schema": json.dumps(legacy_schema_dict)},
+        request_type="POST",
+        url=webhook_url,
+        data=document_response.text,
+        headers={"Content-Type": "application/json"},
     )
     if response is None:
         raise Exception(f"API call failed for marking document {document_uuid}")
+    return {}
 
-    logger.info("Handing over to mark_off_ai_alert")
-    mark_off_ai_alert.delay(
-        document_uuid=document_uuid,
-        output_language=output_language,
-        tokens_spent=tokens_spent
-    )
-
-
-@celery_app.task(
-    acks_late=True,
-    queue='ai-analysis-queue',
-    autoretry_for=(Exception,),
-    retry_backoff=1,
-    retry_jitter=True,
-    max_retries=10,
-    priority=5
-)
-def generate_alerts_and_actions(document_uuid: str, output_language: str, tokens_spent: int) -> None:
-    logger.info("Running alerts and actions prompt")
-    document = get_document(document_uuid=document_uuid)
-    ai_analysis_mode = document["ai_analysis_mode"]
-    document_raw_text = document["document_raw_text"]
-
-    document_extra2 = ""
-    if ai_analysis_mode == "detailed":
-        document_extra2 = "analysis_criteria = \"{ai_analysis_criteria}\"\nfeatures_and_insights = \"{ai_features_and_insights}\"\n\n"
 
-    features_and_insights = prompts["alerts_and_actions"]
-    data = run_ai_completition(
-        ai_client=ai_client,
-        prompt=features_and_insights,
-        document_text=document_raw_text,
-        document_extra1=str(datetime.datetime.now().date()),
-        document_extra2=document_extra2,
-        output_language=output_language
-        )
+# Actions of the pipeline stages that do not run a prompt, by the `action` name of pipelines.json
+ACTIONS = {
+    "mark_off_ai_alert": mark_off_ai_alert,
+    "record_cost": record_cost,
+    "execute_webhook": execute_webhook,
+}
 
-    usage = data.get("usage")
-    tokens_spent += usage["total_tokens"]
+# Completion fields mapped to artefact columns by the `output_mappers` of a stage
+OUTPUT_MAPPERS = {
+    "summary_metadata": summary_metadata,
+}
 
-    ai_alerts_and_actions = data["alerts_and_actions"]
 
-    logger.info("Saving Analysis Features & Insights to database")
-    response = safe_request(
-        request_type="PATCH",
-        url=config.API_URL + f"/api/v1/artefact/metadata/{document_uuid}",
-        data={
-            "ai_alerts_and_actions": json.dumps(ai_alerts_and_actions)
-        }
-    )
-    if response is None:
-        raise Exception(f"API call failed for marking document {document_uuid}")
-
-    logger.info("Handing over to generate_eterny_legacy_schemas")
-    map_eterny_legacy_schemas.delay(
-        document_uuid=document_uuid,
-        output_language=output_language,
-        tokens_spent=tokens_spent
-    )
+def stage_prompt(name: str) -> dict:
+    return fused_analysis_prompt if name == "fused_analysis" else prompts[name]
 
 
-@celery_app.task(
-    acks_late=True,
-    queue='ai-analysis-queue',
-    autoretry_for=(Exception,),
-    retry_backoff=1,
-    retry_jitter=True,
-    max_retries=10,
-    priority=5
-)
-def generrate_features_and_insights(document_uuid: str, output_language: str, tokens_spent: int) -> None:
-    logger.info("Running AI analysis features & insights")
-    document = get_document(document_uuid=document_uuid)
-
-    ai_analysis_criteria = document["ai_analysis_criteria"]
+def template_variables(document: dict) -> dict:
+    """What the input templates of a stage can refer to: the document columns, {today} and {legacy_schemas}."""
+    variables = {
+        column: "" if value is None else value if isinstance(value, str) else orjson.dumps(value).decode()
+        for column, value in document.items()
+    }
+    variables["today"] = str(datetime.datetime.now().date())
+    variables["legacy_schemas"] = legacy_schemas()
+    return variables
 
-    features_and_insights = prompts["features_and_insights"]
-    data = run_ai_completition(ai_client=ai_client, prompt=features_and_insights, document_extra1=ai_analysis_criteria, output_language=output_language, inject_date=True)
-    features_and_insights_dict = data["features_and_insights"]
 
-    usage = data.get("usage")
-    tokens_spent += usage["total_tokens"]
+def stage_inputs(spec: Stage, document: dict) -> dict:
+    """The prompt placeholders of a stage, {stage_input} cut to the stage's context budget minus the rest of its template."""
+    variables = template_variables(document)
+    inputs = {}
+    for placeholder, template in spec.inputs.items():
+        if STAGE_INPUT in template_names(template):
+            reserved_tokens = count_tokens(render_template(template, {**variables, STAGE_INPUT: ""}))
+            variables[STAGE_INPUT] = build_stage_input(spec.context_budget, document, reserved_tokens=reserved_tokens).text
+        inputs[placeholder] = render_template(template, variables) or None
+    return inputs
 
-    logger.info("Saving Analysis Features & Insights to database")
-    response = safe_request(
-        request_type="PATCH",
-        url=config.API_URL + f"/api/v1/artefact/metadata/{document_uuid}",
-        data={
-            "ai_features_and_insights": json.dumps(features_and_insights_dict)
-        }
-    )
-    if response is None:
-        raise Exception(f"API call failed for marking document {document_uuid}")
 
-    logger.info("Handing over to generate_alerts_and_actions")
-    generate_alerts_and_actions.delay(
-        document_uuid=document_uuid,
-        output_language=output_language,
-        tokens_spent=tokens_spent
+def run_completion_stage(spec: Stage, document: dict, output_language: str) -> tuple:
+    """Run the prompt of a stage, returns the artefact columns it produced and the tokens it spent."""
+    data = run_ai_completition(
+        ai_client=ai_client,
+        prompt=stage_prompt(spec.prompt),
+        output_language=spec.output_language or output_language,
+        inject_date=spec.inject_date,
+        stage=spec.name,
+        ai_analysis_mode=document["ai_analysis_mode"],
+        **stage_inputs(spec, document),
     )
+    outputs = {}
+    for mapper in spec.output_mappers:
+        outputs.update(OUTPUT_MAPPERS[mapper](data))
+    for column, field in spec.outputs.items():
+        value = data[field]
+        outputs[column] = orjson.loads(value) if field == "message" and spec.parse_message else value
+    return outputs, data.get("usage")["total_tokens"]
 
 
 @celery_app.task(
+    base=FusedStage,
+    bind=True,
     acks_late=True,
     queue='ai-analysis-queue',
-    autoretry_for=(Exception,),
-    retry_backoff=1,
-    retry_jitter=True,
-    max_retries=10,
+    max_retries=DEFAULT_MAX_RETRIES,
     priority=5
 )
-def generate_analysis_criteria(document_uuid: str, output_language: str, tokens_spent: int) -> None:
-    logger.info("Running AI analysis criteria")
-    analysis_criteria = prompts["analysis_criteria"]
-    document = get_document(document_uuid=document_uuid)
-    document_raw_text = document["document_raw_text"]
-    data = run_ai_completition(ai_client=ai_client, prompt=analysis_criteria, document_text=document_raw_text, output_language=output_language)
-
-    usage = data.get("usage")
-    tokens_spent += usage["total_tokens"]
-
-    logger.info("Saving analysis criteria to database")
-    response = safe_request(
-        request_type="PATCH",
-        url=config.API_URL + f"/api/v1/artefact/metadata/{document_uuid}",
-        data={
-            "ai_analysis_criteria": data["message"]
-        }
-    )
-    if response is None:
-        raise Exception(f"API call failed for marking document {document_uuid}")
-
-    logger.info("Handing over to generrate_features_and_insights")
-    generrate_features_and_insights.delay(
-        document_uuid=document_uuid,
-        output_language=output_language,
-        tokens_spent=tokens_spent
-    )
+def run_pipeline_stage(self, document_uuid: str, stage: str, output_language: str, tokens_spent: int, generation: str = None) -> None:
+    """Run one stage of the document's pipeline, then hand over to the stages it completes the dependencies of."""
+    max_retries = DEFAULT_MAX_RETRIES
+    try:
+        document = get_stage_document(document_uuid=document_uuid)
+        if is_stale(document, generation, stage):
+            return
+        pipeline = get_pipeline(document["pipeline_state"]["pipeline"])
+        spec = pipeline.stages[stage]
+        max_retries = spec.max_retries
+
+        if stage in document["pipeline_state"]["completed"]:
+            # Redelivered after completing, only the hand over may be missing
+            logger.info(f"Stage {stage} of {document_uuid} already completed")
+        else:
+            logger.info(f"Running stage {stage} of pipeline {pipeline.name}")
+            if spec.prompt:
+                data, tokens = run_completion_stage(spec, document, output_language)
+            else:
+                data, tokens = ACTIONS[spec.action](document, tokens_spent), 0
+
+            # Outputs and completion in one write, parallel stages completing together each see the other
+            response = safe_request(
+                request_type="POST",
+                url=config.API_URL + f"/api/v1/artefact/stage/{document_uuid}",
+                data={"stage": stage, "tokens": tokens, "data": data, "generation": generation},
+            )
+            if response is None:
+                raise Exception(f"API call failed for completing stage {stage} of document {document_uuid}")
+            document = orjson.loads(response.content)
+            progress.publish(document_uuid, stage, "completed", customer_id=document["customer_id"])
+            if "analysis_status" in data:
+                progress.publish(document_uuid, "analysis", data["analysis_status"], customer_id=document["customer_id"])
+
+        for next_stage in pipeline.ready_stages(document["pipeline_state"]["completed"], stage):
+            logger.info(f"Handing over to {next_stage}")
+            hand_over(
+                run_pipeline_stage,
+                document_uuid=document_uuid,
+                stage=next_stage,
+                output_language=output_language,
+                tokens_spent=tokens_spent,
+                generation=generation,
+            )
+    except Exception as e:
+        # Backoff of the other tasks' autoretry, with the retries of the stage
+        raise self.retry(
+            exc=e,
+            countdown=get_exponential_backoff_interval(factor=1, retries=self.request.retries, maximum=600, full_jitter=True),
+            max_retries=max_retries,
+        )
 
 
 @celery_app.task(
+    base=FusedStage,
     acks_late=True,
     queue='ai-analysis-queue',
     autoretry_for=(Exception,),
@@ -353,51 +289,42 @@ def generate_analysis_criteria(document_uuid: str, output_language: str, tokens_
     max_retries=10,
     priority=5
 )
-def generate_smart_summary(document_uuid: str, output_language: str, tokens_spent: int) -> None:
-    logger.info("Running AI smart summary")
-
-    document = get_document(document_uuid=document_uuid)
-    document_raw_text = document["document_raw_text"]
-    smart_summary = prompts["smart_summary"]
-
-    data = run_ai_completition(ai_client=ai_client, prompt=smart_summary, document_text=document_raw_text, output_language=output_language, inject_date=True)
-
-    usage = data.get("usage")
-    tokens_spent += usage["total_tokens"]
-
-    ai_is_expired = False
-    ai_expires = None
-    document_expires_str = data["document_expires"]
-    if document_expires_str:
-        document_expires = datetime.datetime.fromisoformat(document_expires_str)
-        ai_expires = document_expires.isoformat()
-        ai_is_expired = data["is_expired"]
-
-    logger.info("Saving smart summary to database")
+def store_extracted_text(
+    document_raw_text: str, document_uuid: str, output_language: str, tokens_spent: int, ai_analysis_mode: str = None, generation: str = None
+) -> None:
+    if is_stale(get_stage_document(document_uuid=document_uuid), generation, "store_extracted_text"):
+        return
+    logger.info("Saving extracted text to database")
     response = safe_request(
         request_type="PATCH",
-        url=config.API_URL + f"/api/v1/artefact/metadata/{document_uuid}",
+        url=metadata_url(document_uuid, generation),
+        # Admission control counts the document's tokens in the backlog, now known from its text
         data={
-            "ai_category": data["top_category"],
-            "ai_sub_category": data["sub_category"],
-            "ai_summary_short": data["summary_short"],
-            "ai_summary_long": data["summary_long"],
-            "ai_expires": ai_expires,
-            "ai_is_expired": ai_is_expired
-        }
+            "document_raw_text": document_raw_text,
+            "estimated_tokens": sum(estimate_analysis_tokens(count_tokens(document_raw_text), ai_analysis_mode).values()),
+            # A new analysis starts its pipeline over
+            "pipeline_state": {"pipeline": pipeline_name(ai_analysis_mode), "completed": {}},
+        },
     )
     if response is None:
         raise Exception(f"API call failed for marking document {document_uuid}")
-
-    logger.info("Hading over to generate_analysis_criteria")
-    generate_analysis_criteria.delay(
-        document_uuid=document_uuid,
-        output_language=output_language,
-        tokens_spent=tokens_spent
-    )
+    progress.publish(document_uuid, "text_extraction", "completed", customer_id=orjson.loads(response.content)["customer_id"])
+
+    pipeline = get_pipeline(pipeline_name(ai_analysis_mode))
+    for stage in pipeline.entry_stages():
+        logger.info(f"Handing over to {stage}")
+        hand_over(
+            run_pipeline_stage,
+            document_uuid=document_uuid,
+            stage=stage,
+            output_language=output_language,
+            tokens_spent=tokens_spent,
+            generation=generation,
+        )
 
 
 @celery_app.task(
+    base=FusedStage,
     acks_late=True,
     queue='ai-analysis-queue',
     autoretry_for=(Exception,),
@@ -406,33 +333,40 @@ def generate_smart_summary(document_uuid: str, output_language: str, tokens_spen
     max_retries=10,
     priority=5
 )
-def extract_text_from_document(document_uuid: str, output_language: str, tokens_spent: int) -> None:
+def extract_text_from_document(document_uuid: str, output_language: str, tokens_spent: int, generation: str = None) -> None:
+    document = get_stage_document(document_uuid=document_uuid)
+    if is_stale(document, generation, "extract_text_from_document"):
+        return
     logger.info("Extracting text from document")
-    document_raw_text = safe_request(
-        request_type="GET",
-        url=config.API_URL + f"/api/v1/utils/extract_text_from_file?uuid={document_uuid}",
-        data={},
-    )
-    document_raw_text = document_raw_text.json()
-
-    logger.info("Saving extracted text to database")
-    response = safe_request(
-        request_type="PATCH",
-        url=config.API_URL + f"/api/v1/artefact/metadata/{document_uuid}",
-        data={"document_raw_text": document_raw_text},
-    )
-    if response is None:
-        raise Exception(f"API call failed for marking document {document_uuid}")
-
-    logger.info("Handing over to generate_smart_summary")
-    generate_smart_summary.delay(
-        document_uuid=document_uuid,
-        output_language=output_language,
-        tokens_spent=tokens_spent,
-    )
+    file_path = os.path.join(config.BASE_UPLOAD_DIR, document["customer_id"], document["filename"])
+
+    # Extraction and compaction are CPU-bound and run on the extraction queue, store_extracted_text receives the result
+    progress.publish(document_uuid, "text_extraction", "started", customer_id=document["customer_id"])
+    logger.info("Handing over to extract_document_text")
+    # A document that cannot be extracted fails the same way on every attempt, extraction fails it right away
+    failed = extraction_failed.s(document_uuid=document_uuid, generation=generation)
+    chain(
+        extract_document_text.s(file_path, document.get("hash_sha256")).on_error(failed),
+        compact_extracted_text.s(document_uuid=document_uuid, ai_analysis_mode=document["ai_analysis_mode"]).on_error(failed),
+        store_extracted_text.s(
+            document_uuid=document_uuid,
+            output_language=output_language,
+            tokens_spent=tokens_spent,
+            ai_analysis_mode=document["ai_analysis_mode"],
+            generation=generation,
+        ),
+    ).delay()
+
+
+@celery_app.task(queue='ai-analysis-queue')
+def extraction_failed(request, exc, traceback, document_uuid: str, generation: str = None) -> None:
+    """Errback of the extraction chain, called in the extraction worker with the failed task's request."""
+    logger.error(f"Text extraction of document {document_uuid} failed in {request.task}: {exc}")
+    mark_failed(document_uuid, "text_extraction", exc, generation)
 
 
 @celery_app.task(
+    base=FusedStage,
     acks_late=True,
     queue='ai-analysis-queue',
     autoretry_for=(Exception,),
@@ -441,24 +375,29 @@ def extract_text_from_document(document_uuid: str, output_language: str, tokens_
     max_retries=10,
     priority=5
 )
-def analyse_document(document_uuid: str) -> None:
+def analyse_document(document_uuid: str, generation: str = None) -> None:
     logger.info(f"Document to analyze: {document_uuid}")
-    document = get_document(document_uuid=document_uuid)
+    document = get_stage_document(document_uuid=document_uuid)
+    if is_stale(document, generation, "analyse_document"):
+        return
     output_language = document["ai_output_language"]
 
     tokens_spent = 0
     logger.info("Starting analysis")
     response = safe_request(
         request_type="PATCH",
-        url=config.API_URL + f"/api/v1/artefact/metadata/{document_uuid}",
+        url=metadata_url(document_uuid, generation),
         data={"analysis_status": "processing", "analysis_started_at": datetime.datetime.now().isoformat()},
     )
     if response is None:
         raise Exception(f"API call failed for marking document {document_uuid}")
+    progress.publish(document_uuid, "analysis", progress.STARTED_STATUS, customer_id=document["customer_id"])
 
     logger.info("Handing over to extract_text_from_document")
-    extract_text_from_document.delay(
+    hand_over(
+        extract_text_from_document,
         document_uuid=document_uuid,
         output_language=output_language,
         tokens_spent=tokens_spent,
+        generation=generation,
     )
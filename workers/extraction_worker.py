@@ -0,0 +1,84 @@
+import logging
+import resource
+from contextlib import contextmanager
+from pathlib import Path
+
+from celery.utils.log import get_task_logger
+
+from backend import config
+from backend.core.celery import celery_app
+from backend.utils.extract_text import get_extractor
+from backend.utils.extraction_cache import get_extraction_cache
+from backend.utils.text_compaction import (compact_document_text,
+                                           compaction_enabled)
+from backend.utils.uploads import hash_file
+
+logger = get_task_logger(__name__)
+logger.setLevel(logging.INFO)
+
+
+@contextmanager
+def address_space_limit(limit: int):
+    """
+    Cap the address space of the worker process while a document is extracted.
+
+    A document that needs more raises MemoryError in its own task instead of getting the whole
+    container OOM-killed. Meant for the prefork pool, where every task has its own process.
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if limit <= 0 or (hard != resource.RLIM_INFINITY and limit > hard):
+        yield
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+@celery_app.task(
+    acks_late=True,
+    queue='extraction-queue',
+    soft_time_limit=config.EXTRACTION_SOFT_TIME_LIMIT,
+    time_limit=config.EXTRACTION_TIME_LIMIT,
+    priority=5
+)
+def extract_document_text(file_path: str, hash_sha256: str = None) -> str:
+    extractor = get_extractor(file_path)
+    cache = get_extraction_cache()
+    if cache is not None:
+        hash_sha256 = hash_sha256 or hash_file(file_path).sha256
+        text = cache.get(hash_sha256, extractor.name, extractor.version)
+        if text is not None:
+            logger.info(f"Extracted text of {file_path} found in cache")
+            return text
+
+    logger.info(f"Extracting text from {file_path}")
+    with address_space_limit(config.EXTRACTION_MEMORY_LIMIT):
+        text = extractor.extract(Path(file_path))
+    logger.info(f"Extracted {len(text)} characters from {file_path}")
+    if cache is not None:
+        cache.put(hash_sha256, extractor.name, extractor.version, text)
+    return text
+
+
+@celery_app.task(
+    acks_late=True,
+    queue='extraction-queue',
+    soft_time_limit=config.EXTRACTION_SOFT_TIME_LIMIT,
+    time_limit=config.EXTRACTION_TIME_LIMIT,
+    priority=5
+)
+def compact_extracted_text(document_raw_text: str, document_uuid: str, ai_analysis_mode: str) -> str:
+    """Drop repeated headers, footers, page numbers and whitespace before the text reaches the LLM stages."""
+    if not compaction_enabled(ai_analysis_mode):
+        logger.info(f"Text compaction disabled for {ai_analysis_mode} mode, document {document_uuid}")
+        return document_raw_text
+
+    result = compact_document_text(document_raw_text)
+    saved = result.tokens_before - result.tokens_after
+    logger.info(
+        f"Compacted text of document {document_uuid}: {result.tokens_before} -> {result.tokens_after} tokens "
+        f"({saved / max(result.tokens_before, 1):.1%} saved)"
+    )
+    return result.text